@@ -1,25 +1,96 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Security
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, Security
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials
-from app.core.auth import get_current_token, get_admin_token, log_api_usage, security
-from app.models.token import create_token, list_tokens, delete_token, get_token
-from app.models.usage import create_usage, list_usages_by_token, list_usages_by_endpoint
-from app.schemas.token import TokenCreate, TokenResponse
-from app.schemas.usage import UsageInDB
-from app.services.moderation import moderate_image
-from typing import List, Optional
+from app.core.auth import (
+    get_current_token, get_admin_token, get_token_policy, revoke_token, log_api_usage, log_api_usages,
+    charge_calls, security, TokenCache
+)
+from app.core.metrics import stage, UPLOAD_BYTES
+from app.core.ndjson import ndjson_lines, NDJSON_MEDIA_TYPE
+from app.models.token import (
+    create_token, list_tokens, has_tokens, update_token_limits, update_token_policy, update_token_webhook
+)
+from app.models.usage import (
+    list_usages_by_token, list_usages_by_endpoint, build_usage_query,
+    iter_usages, summarize_usages, DEFAULT_PAGE_SIZE
+)
+from app.models.job import create_job, get_job
+from app.schemas.job import JobResponse
+from app.schemas.moderation import ModerationInclude, ModerationResult
+from app.schemas.token import TokenCreate, TokenLimits, TokenPolicy, TokenWebhook, TokenResponse
+from app.models.usage_rollup import get_usage_count, summarize_rollups, ALL_ENDPOINTS
+from app.schemas.usage import UsageInDB, UsageSummary, UsageRollup
+from app.services.moderation import moderate_image, invalid_image_result, SingleFlight
+from app.services.result_cache import ModerationCache
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.batch import moderate_batch
+from app.services.circuit_breaker import UpstreamUnavailable
+from app.services.jobs import JobWorker, can_queue, JOB_MAX_BYTES
+from app.services.policy import PolicyEngine
+from app.services.prefilter import Prefilter
+from app.services.providers import ProviderRouter
+from app.services.sightengine import SightEngineClient
+from app.services.usage_writer import UsageWriter
+from app.services.sniff import TypeSniffer
+from app.services.webhooks import check_webhook_url
+from app.services.upload import (
+    read_uploads, expand_archives, multipart_openapi, UnsupportedUpload, ImageUpload,
+    MAX_UPLOAD_BYTES, MAX_BATCH_FILES, MAX_BATCH_BYTES
+)
+from datetime import datetime
+from typing import List, Literal, Optional
+import asyncio
 
 router = APIRouter()
 
+class UsagePageParams:
+    """Query parameters shared by the paginated usage listings"""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=1000),
+        cursor: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.start = start
+        self.end = end
+
+    async def fetch(self, list_usages, key: str):
+        try:
+            return await list_usages(key, self.limit, self.cursor, self.start, self.end)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def wants_cache(request: Request) -> bool:
+    """Clients can force a fresh upstream check with `Cache-Control: no-cache`"""
+    return "no-cache" not in request.headers.get("cache-control", "").lower()
+
+def include_raw(
+    include: Optional[ModerationInclude] = Query(
+        None, description="'raw' adds the upstream response to each result as details.content_analysis"
+    )
+) -> bool:
+    return include == "raw"
+
+def check_policy_exists(policy: Optional[str]) -> None:
+    if policy is not None and policy not in PolicyEngine.policies:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown policy: {policy}")
+
 @router.post("/auth/tokens", response_model=TokenResponse)
 async def create_new_token(
     token_data: TokenCreate,
     credentials: Optional[HTTPAuthorizationCredentials] = Security(security)
 ):
+    check_policy_exists(token_data.policy)
+
     # First check if any tokens exist
-    existing_tokens = await list_tokens()
+    tokens_exist = await has_tokens()
     
     # If no tokens exist, allow creation without authentication (bootstrap)
-    if not existing_tokens:
+    if not tokens_exist:
         return await create_token(token_data)
     
     # For subsequent tokens, allow creation without authentication
@@ -33,30 +104,294 @@ async def get_all_tokens(token: str = Depends(get_admin_token)):
 @router.delete("/auth/tokens/{token_to_delete}")
 async def remove_token(token_to_delete: str, token: str = Depends(get_admin_token)):
     await log_api_usage(token, f"/auth/tokens/{token_to_delete}")
-    if await delete_token(token_to_delete):
+    if await revoke_token(token_to_delete):
         return {"message": "Token deleted successfully"}
     raise HTTPException(status_code=404, detail="Token not found")
 
-@router.post("/moderate")
-async def moderate_image_endpoint(file: UploadFile = File(...), token: str = Depends(get_current_token)):
+@router.put("/auth/tokens/{token_to_update}/limits")
+async def set_token_limits(token_to_update: str, limits: TokenLimits, token: str = Depends(get_admin_token)):
+    """Replace a token's rate limit and daily quota; unset fields fall back to the server defaults"""
+    await log_api_usage(token, f"/auth/tokens/{token_to_update}/limits")
+    if await update_token_limits(token_to_update, limits):
+        TokenCache.invalidate(token_to_update)
+        return {"message": "Token limits updated successfully"}
+    raise HTTPException(status_code=404, detail="Token not found")
+
+@router.put("/auth/tokens/{token_to_update}/policy")
+async def set_token_policy(token_to_update: str, policy: TokenPolicy, token: str = Depends(get_admin_token)):
+    """Choose the moderation policy applied to a token's images"""
+    await log_api_usage(token, f"/auth/tokens/{token_to_update}/policy")
+    check_policy_exists(policy.policy)
+    if await update_token_policy(token_to_update, policy):
+        TokenCache.invalidate(token_to_update)
+        return {"message": "Token policy updated successfully"}
+    raise HTTPException(status_code=404, detail="Token not found")
+
+@router.put("/auth/tokens/{token_to_update}/webhook")
+async def set_token_webhook(token_to_update: str, webhook: TokenWebhook, token: str = Depends(get_admin_token)):
+    """Set (or clear) the URL that a token's finished async jobs are POSTed to"""
+    await log_api_usage(token, f"/auth/tokens/{token_to_update}/webhook")
+    if webhook.webhookUrl is not None:
+        try:
+            check_webhook_url(str(webhook.webhookUrl))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if await update_token_webhook(token_to_update, webhook):
+        TokenCache.invalidate(token_to_update)
+        return {"message": "Token webhook updated successfully"}
+    raise HTTPException(status_code=404, detail="Token not found")
+
+async def enqueue_upload(token: str, upload: ImageUpload, policy: Optional[str], raw: bool) -> JSONResponse:
+    """Store the upload as a job and answer 202 with where to poll for it"""
+    token_data = await TokenCache.lookup(token)
+    webhook_url = token_data.webhookUrl if token_data else None
+    job = await create_job(
+        token, upload.filename, upload.content, policy, str(webhook_url) if webhook_url else None, raw
+    )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job.id, "status": job.status},
+        headers={"Location": f"/api/moderate/jobs/{job.id}"}
+    )
+
+@router.post(
+    "/moderate", response_model=ModerationResult, response_model_exclude_none=True,
+    openapi_extra=multipart_openapi("file")
+)
+async def moderate_image_endpoint(
+    request: Request,
+    token: str = Depends(get_current_token),
+    policy: Optional[str] = Depends(get_token_policy),
+    raw: bool = Depends(include_raw)
+):
     await log_api_usage(token, "/moderate")
-    result = await moderate_image(file)
-    return result 
+    try:
+        with stage("read"):
+            upload = (await read_uploads(request, accept=TypeSniffer.is_image))[0]
+    except UnsupportedUpload:
+        # Same answer as before, without reading the rest of the upload
+        return invalid_image_result()
+    UPLOAD_BYTES.observe(len(upload.content))
+    try:
+        result = await moderate_image(
+            upload.content, upload.filename, use_cache=wants_cache(request), policy=policy, include_raw=raw
+        )
+    except UpstreamUnavailable:
+        if not can_queue(upload.content):
+            raise
+        # Degraded mode: accept the image now and moderate it once SightEngine recovers
+        return await enqueue_upload(token, upload, policy, raw)
+    return result
+
+@router.post("/moderate/async", status_code=status.HTTP_202_ACCEPTED, openapi_extra=multipart_openapi("file"))
+async def moderate_image_async_endpoint(
+    request: Request,
+    token: str = Depends(get_current_token),
+    policy: Optional[str] = Depends(get_token_policy),
+    raw: bool = Depends(include_raw)
+):
+    """Queue an image and return at once; poll the Location or receive the result on the token's webhook"""
+    await log_api_usage(token, "/moderate/async")
+    with stage("read"):
+        upload = (await read_uploads(request, max_bytes=JOB_MAX_BYTES, accept=TypeSniffer.is_image))[0]
+    UPLOAD_BYTES.observe(len(upload.content))
+    return await enqueue_upload(token, upload, policy, raw)
+
+@router.get("/moderate/jobs/{job_id}", response_model=JobResponse, response_model_exclude_none=True)
+async def get_moderation_job(job_id: str, token: str = Depends(get_current_token)):
+    """Get the status, and once done the result, of an async or degraded-mode job"""
+    await log_api_usage(token, "/moderate/jobs")
+    job = await get_job(job_id)
+    if job and job.token != token:
+        token_data = await TokenCache.lookup(token)
+        if not token_data or not token_data.isAdmin:
+            job = None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/moderate/upstream/stats")
+async def get_upstream_stats(token: str = Depends(get_admin_token)):
+    """Get the circuit breaker state of each SightEngine endpoint, provider latency/error rates and job counters"""
+    await log_api_usage(token, "/moderate/upstream/stats")
+    return {
+        "circuit": SightEngineClient.stats(),
+        "providers": ProviderRouter.stats(),
+        "jobs": JobWorker.stats()
+    }
+
+@router.post("/moderate/batch", openapi_extra=multipart_openapi("files", multiple=True))
+async def moderate_batch_endpoint(
+    request: Request,
+    token: str = Depends(get_current_token),
+    policy: Optional[str] = Depends(get_token_policy),
+    raw: bool = Depends(include_raw)
+):
+    """Moderate many images (or zip/tar archives of images), streaming NDJSON results"""
+    uploads = await read_uploads(
+        request, max_files=MAX_BATCH_FILES, max_bytes=MAX_BATCH_BYTES, max_total_bytes=MAX_BATCH_BYTES
+    )
+    uploads = await asyncio.to_thread(expand_archives, uploads, MAX_BATCH_FILES, MAX_UPLOAD_BYTES)
+    # Each image counts as a call against the rate limit and quota, before any is moderated
+    await charge_calls(token, len(uploads))
+    await log_api_usages(token, "/moderate/batch", len(uploads))
+    results = moderate_batch(uploads, use_cache=wants_cache(request), policy=policy, include_raw=raw)
+    return StreamingResponse(ndjson_lines(results), media_type=NDJSON_MEDIA_TYPE)
+
+@router.get("/moderate/cache/stats")
+async def get_moderation_cache_stats(token: str = Depends(get_admin_token)):
+    """Get hit/miss counters for the moderation result caches"""
+    await log_api_usage(token, "/moderate/cache/stats")
+    return {
+        **ModerationCache.stats(),
+        "near_duplicates": NearDuplicateIndex.stats(),
+        "single_flight": SingleFlight.stats()
+    }
+
+@router.get("/moderate/prefilter/stats")
+async def get_prefilter_stats(token: str = Depends(get_admin_token)):
+    """Get how many images the local pre-filter settled and how many it escalated"""
+    await log_api_usage(token, "/moderate/prefilter/stats")
+    return Prefilter.stats()
+
+@router.get("/moderate/policies")
+async def get_moderation_policies(token: str = Depends(get_admin_token)):
+    """Get the loaded moderation policies and their category thresholds"""
+    await log_api_usage(token, "/moderate/policies")
+    return PolicyEngine.describe()
+
+@router.post("/moderate/policies/reload")
+async def reload_moderation_policies(token: str = Depends(get_admin_token)):
+    """Re-read the policy file now instead of waiting for the next poll"""
+    await log_api_usage(token, "/moderate/policies/reload")
+    try:
+        reloaded = PolicyEngine.reload()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid policy file: {e}")
+    return {"reloaded": reloaded, "policies": sorted(PolicyEngine.policies)}
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
 @router.get("/auth/usage/token/{token_id}", response_model=List[UsageInDB])
-async def get_usage_by_token(token_id: str, token: str = Depends(get_admin_token)):
-    """Get all API usage for a specific token"""
+async def get_usage_by_token(
+    token_id: str,
+    response: Response,
+    page: UsagePageParams = Depends(),
+    token: str = Depends(get_admin_token)
+):
+    """Get API usage for a specific token, newest first. Follow `X-Next-Cursor` for more."""
     await log_api_usage(token, f"/auth/usage/token/{token_id}")
-    return await list_usages_by_token(token_id)
+    usages, next_cursor = await page.fetch(list_usages_by_token, token_id)
+    set_next_cursor(response, next_cursor)
+    return usages
 
 @router.get("/auth/usage/endpoint/{endpoint}", response_model=List[UsageInDB])
-async def get_usage_by_endpoint(endpoint: str, token: str = Depends(get_admin_token)):
-    """Get all API usage for a specific endpoint"""
+async def get_usage_by_endpoint(
+    endpoint: str,
+    response: Response,
+    page: UsagePageParams = Depends(),
+    token: str = Depends(get_admin_token)
+):
+    """Get API usage for a specific endpoint, newest first. Follow `X-Next-Cursor` for more."""
     await log_api_usage(token, f"/auth/usage/endpoint/{endpoint}")
-    return await list_usages_by_endpoint(endpoint)
+    usages, next_cursor = await page.fetch(list_usages_by_endpoint, endpoint)
+    set_next_cursor(response, next_cursor)
+    return usages
+
+@router.get("/auth/usage/summary", response_model=List[UsageSummary])
+async def get_usage_summary(
+    group_by: List[Literal["token", "endpoint"]] = Query(["token", "endpoint"]),
+    granularity: Optional[Literal["hour", "day"]] = None,
+    token_id: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    token: str = Depends(get_admin_token)
+):
+    """Get usage counts per token/endpoint, optionally bucketed by hour or day"""
+    await log_api_usage(token, "/auth/usage/summary")
+    query = build_usage_query(token=token_id, endpoint=endpoint, start=start, end=end)
+    return await summarize_usages(query, sorted(set(group_by)), granularity)
+
+@router.get("/auth/usage/totals", response_model=List[UsageSummary])
+async def get_usage_totals(
+    group_by: List[Literal["token", "endpoint"]] = Query(["token", "endpoint"]),
+    granularity: Optional[Literal["hour", "day"]] = None,
+    token_id: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    token: str = Depends(get_admin_token)
+):
+    """Like /auth/usage/summary, but from the rollup counters, which are kept after records expire"""
+    await log_api_usage(token, "/auth/usage/totals")
+    query = build_usage_query(token=token_id, endpoint=endpoint, start=start, end=end)
+    return await summarize_rollups(query, sorted(set(group_by)), granularity)
+
+@router.get("/auth/usage/count", response_model=UsageRollup)
+async def get_usage_count_endpoint(
+    token_id: str,
+    endpoint: str = ALL_ENDPOINTS,
+    granularity: Literal["minute", "hour", "day"] = "day",
+    at: Optional[datetime] = None,
+    token: str = Depends(get_admin_token)
+):
+    """Get the number of calls a token made in the current (or `at`) minute/hour/day"""
+    await log_api_usage(token, "/auth/usage/count")
+    return await get_usage_count(token_id, endpoint, granularity, at)
+
+@router.get("/auth/usage/export")
+async def export_usage(
+    token_id: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    token: str = Depends(get_admin_token)
+):
+    """Stream matching usage records as NDJSON"""
+    await log_api_usage(token, "/auth/usage/export")
+    query = build_usage_query(token=token_id, endpoint=endpoint, start=start, end=end)
+    return StreamingResponse(ndjson_lines(iter_usages(query)), media_type=NDJSON_MEDIA_TYPE)
+
+@router.get("/auth/usage/writer/stats")
+async def get_usage_writer_stats(token: str = Depends(get_admin_token)):
+    """Get queue depth and flush latency of the background usage writer"""
+    await log_api_usage(token, "/auth/usage/writer/stats")
+    return UsageWriter.stats()
 
 @router.get("/auth/usage/my-usage", response_model=List[UsageInDB])
-async def get_my_usage(token: str = Depends(get_current_token)):
-    """Get usage statistics for the current token"""
+async def get_my_usage(
+    response: Response,
+    page: UsagePageParams = Depends(),
+    token: str = Depends(get_current_token)
+):
+    """Get usage statistics for the current token, newest first"""
     await log_api_usage(token, "/auth/usage/my-usage")
-    return await list_usages_by_token(token) 
\ No newline at end of file
+    usages, next_cursor = await page.fetch(list_usages_by_token, token)
+    set_next_cursor(response, next_cursor)
+    return usages
+
+@router.get("/auth/usage/my-usage/count", response_model=UsageRollup)
+async def get_my_usage_count(
+    endpoint: str = ALL_ENDPOINTS,
+    granularity: Literal["minute", "hour", "day"] = "day",
+    token: str = Depends(get_current_token)
+):
+    """Get the number of calls the current token made this minute/hour/day"""
+    await log_api_usage(token, "/auth/usage/my-usage/count")
+    return await get_usage_count(token, endpoint, granularity)
+
+@router.get("/auth/usage/my-usage/totals", response_model=List[UsageSummary])
+async def get_my_usage_totals(
+    group_by: List[Literal["endpoint"]] = Query([]),
+    granularity: Optional[Literal["hour", "day"]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    token: str = Depends(get_current_token)
+):
+    """Get the current token's call counts, optionally per endpoint and per hour/day bucket"""
+    await log_api_usage(token, "/auth/usage/my-usage/totals")
+    query = build_usage_query(token=token, start=start, end=end)
+    return await summarize_rollups(query, sorted(set(group_by)), granularity)
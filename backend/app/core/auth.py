@@ -1,12 +1,85 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.models.token import get_token
-from app.models.usage import create_usage, UsageCreate
+from app.core.cache import TTLCache
+from app.core.rate_limit import RateLimiter
+from app.db.repositories import STORAGE_ERRORS
+from app.models.token import get_token, delete_token, get_tokens_version
+from app.models.usage import create_usage, create_usages, UsageCreate
+from app.schemas.token import TokenInDB
+from app.services.usage_writer import UsageWriter
 from typing import Optional
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 # Single source of truth for security
 security = HTTPBearer(auto_error=False)
 
+# Token lookups are cached per worker; unknown tokens are cached briefly too
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_NEGATIVE_TTL = float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", "5"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# How often workers poll the tokens version to pick up deletions made elsewhere
+AUTH_CACHE_SYNC_INTERVAL = float(os.getenv("AUTH_CACHE_SYNC_INTERVAL", "1"))
+
+_MISSING = object()
+
+
+class TokenCache:
+    entries: TTLCache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL)
+    version: int = 0
+    generation: int = 0
+    sync_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def start(cls):
+        cls.version = await get_tokens_version()
+        cls.sync_task = asyncio.create_task(cls._sync())
+
+    @classmethod
+    async def close(cls):
+        if cls.sync_task:
+            cls.sync_task.cancel()
+            cls.sync_task = None
+
+    @classmethod
+    async def _sync(cls):
+        while True:
+            await asyncio.sleep(AUTH_CACHE_SYNC_INTERVAL)
+            try:
+                version = await get_tokens_version()
+            except STORAGE_ERRORS:
+                continue
+            if version != cls.version:
+                cls.version = version
+                cls.clear()
+
+    @classmethod
+    async def lookup(cls, token: str) -> Optional[TokenInDB]:
+        token_data = cls.entries.get(token, _MISSING)
+        if token_data is not _MISSING:
+            return token_data
+        generation = cls.generation
+        token_data = await get_token(token)
+        # Don't resurrect a token that was invalidated while we were reading it
+        if generation == cls.generation:
+            cls.entries.set(token, token_data, ttl=None if token_data else AUTH_CACHE_NEGATIVE_TTL)
+        return token_data
+
+    @classmethod
+    def invalidate(cls, token: str) -> None:
+        cls.generation += 1
+        cls.entries.pop(token)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.generation += 1
+        cls.entries.clear()
+
+
 async def get_current_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> str:
     if not credentials:
         raise HTTPException(
@@ -14,16 +87,25 @@ async def get_current_token(credentials: Optional[HTTPAuthorizationCredentials]
             detail="Not authenticated"
         )
     token = credentials.credentials
-    token_data = await get_token(token)
+    token_data = await TokenCache.lookup(token)
     if not token_data:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token"
         )
+    # Runs before the endpoint reads the request body, so rejected uploads cost nothing
+    await RateLimiter.check(token_data)
     return token
 
+async def charge_calls(token: str, calls: int) -> None:
+    """Count a request as `calls` calls against the token's limits, e.g. one per image
+    of a batch; get_current_token already counted the first. 429 if they don't fit."""
+    token_data = await TokenCache.lookup(token)
+    if token_data:
+        await RateLimiter.check_rest(token_data, calls)
+
 async def get_admin_token(token: str = Depends(get_current_token)) -> str:
-    token_data = await get_token(token)
+    token_data = await TokenCache.lookup(token)
     if not token_data or not token_data.isAdmin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -31,5 +113,31 @@ async def get_admin_token(token: str = Depends(get_current_token)) -> str:
         )
     return token
 
+async def get_token_policy(token: str = Depends(get_current_token)) -> Optional[str]:
+    """Name of the moderation policy configured for the calling token"""
+    token_data = await TokenCache.lookup(token)
+    return token_data.policy if token_data else None
+
+async def revoke_token(token: str) -> bool:
+    """Delete a token and drop it from this worker's cache right away.
+
+    Other workers notice through the tokens version within AUTH_CACHE_SYNC_INTERVAL.
+    """
+    deleted = await delete_token(token)
+    TokenCache.invalidate(token)
+    return deleted
+
 async def log_api_usage(token: str, endpoint: str) -> None:
-    await create_usage(UsageCreate(token=token, endpoint=endpoint)) 
\ No newline at end of file
+    usage = UsageCreate(token=token, endpoint=endpoint)
+    if UsageWriter.running():
+        await UsageWriter.enqueue(usage)
+    else:
+        await create_usage(usage)
+
+async def log_api_usages(token: str, endpoint: str, count: int) -> None:
+    """Record `count` calls at once, e.g. one per image of a batch"""
+    usages = [UsageCreate(token=token, endpoint=endpoint) for _ in range(count)]
+    if UsageWriter.running():
+        await UsageWriter.enqueue_many(usages)
+    else:
+        await create_usages(usages)
@@ -0,0 +1,222 @@
+import os
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, Sequence
+
+from dotenv import load_dotenv
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+from prometheus_client import multiprocess
+from prometheus_client.core import HistogramMetricFamily
+from prometheus_client.utils import floatToGoString
+from pymongo import monitoring
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Set by prometheus_client's multiprocess mode when several uvicorn workers share /metrics
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(2 ** i for i in range(10, 26))  # 1 KiB .. 32 MiB
+
+
+class _LoopHistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: list):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, amount: float) -> None:
+        self.counts[bisect_left(self.bounds, amount)] += 1
+        self.sum += amount
+
+
+class LoopHistogram:
+    """Histogram whose observations take no lock, for code running on the event loop thread.
+
+    prometheus_client's Histogram locks every bucket and the sum on each
+    observation, which costs more than the timing itself.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = list(labelnames)
+        self.bounds = [float(bound) for bound in buckets]
+        self.children: Dict[tuple, _LoopHistogramChild] = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values) -> _LoopHistogramChild:
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = _LoopHistogramChild(self.bounds)
+        return child
+
+    def observe(self, amount: float) -> None:
+        self.labels().observe(amount)
+
+    def collect(self):
+        family = HistogramMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for values, child in list(self.children.items()):
+            buckets, total = [], 0
+            for bound, count in zip(self.bounds + [float("inf")], child.counts):
+                total += count
+                buckets.append((floatToGoString(bound), total))
+            family.add_metric(list(values), buckets, child.sum)
+        yield family
+
+
+def loop_histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+    # Multiprocess mode needs the stock Histogram, which writes to shared files
+    if PROMETHEUS_MULTIPROC_DIR:
+        return Histogram(name, documentation, labelnames, buckets=buckets)
+    return LoopHistogram(name, documentation, labelnames, buckets)
+
+
+class InFlight:
+    """Count of work in progress, read at scrape time so updating it takes no lock.
+
+    Only incremented and decremented from the event loop thread.
+    """
+
+    def __init__(self, name: str, documentation: str):
+        self.count = 0
+        Gauge(name, documentation).set_function(lambda: self.count)
+
+    def inc(self) -> None:
+        self.count += 1
+
+    def dec(self) -> None:
+        self.count -= 1
+
+
+def in_flight(name: str, documentation: str):
+    # Multiprocess mode can't call back into a worker at scrape time: use a stock
+    # Gauge summed over the live workers
+    if PROMETHEUS_MULTIPROC_DIR:
+        return Gauge(name, documentation, multiprocess_mode="livesum")
+    return InFlight(name, documentation)
+
+
+class StageTimer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(perf_counter() - self.started)
+
+
+REQUEST_LATENCY = loop_histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = in_flight("http_requests_in_flight", "HTTP requests being served")
+
+STAGE_LATENCY = loop_histogram(
+    "moderation_stage_duration_seconds", "Time spent in each stage of a moderation request", ["stage"]
+)
+COALESCED_REQUESTS = Counter(
+    "moderation_coalesced_requests_total", "Moderation requests that shared another request's in-flight lookup"
+)
+UPLOAD_BYTES = loop_histogram("moderation_upload_bytes", "Size of uploaded images", buckets=SIZE_BUCKETS)
+
+UPSTREAM_RESPONSES = Counter(
+    "sightengine_responses_total", "SightEngine responses by HTTP status (or transport_error)", ["status"]
+)
+UPSTREAM_IN_FLIGHT = in_flight("sightengine_requests_in_flight", "SightEngine calls waiting for a response")
+UPSTREAM_REQUEST_BYTES = loop_histogram(
+    "sightengine_request_bytes", "Size of images sent to SightEngine", buckets=SIZE_BUCKETS
+)
+
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by collection and command",
+    ["collection", "command"], buckets=LATENCY_BUCKETS
+)
+
+# Label lookups cost more than the observation itself, so children are bound once
+_stages: Dict[str, _LoopHistogramChild] = {}
+
+
+def stage(name: str) -> StageTimer:
+    """Times one moderation stage: `with stage("sniff"): ...`"""
+    child = _stages.get(name)
+    if child is None:
+        child = _stages[name] = STAGE_LATENCY.labels(name)
+    return StageTimer(child)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware timing every HTTP request by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+        self.children: Dict[tuple, _LoopHistogramChild] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            # The route template, not the raw path, so token ids don't become labels
+            route = scope.get("route")
+            key = (scope["method"], route.path if route else "unmatched", status_code)
+            child = self.children.get(key)
+            if child is None:
+                child = self.children[key] = REQUEST_LATENCY.labels(*key)
+            child.observe(elapsed)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records the latency of every MongoDB command, labelled by its collection"""
+
+    def __init__(self):
+        self.collections: Dict[int, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self.collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+
+    def _observe(self, event):
+        collection = self.collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+
+def render_metrics() -> tuple:
+    """(body, content type) of the metrics exposition"""
+    registry = REGISTRY
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
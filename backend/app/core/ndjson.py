@@ -0,0 +1,16 @@
+from typing import Any, AsyncIterator
+
+import orjson
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _default(value: Any) -> str:
+    # orjson encodes datetimes itself; anything else unknown becomes its string form
+    return str(value)
+
+
+async def ndjson_lines(items: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    """Encode each item as one JSON line, for StreamingResponse bodies"""
+    async for item in items:
+        yield orjson.dumps(item, default=_default) + b"\n"
@@ -0,0 +1,155 @@
+from fastapi import HTTPException, status
+from pymongo.errors import PyMongoError
+from app.models.rate_limit import increment_window
+from app.schemas.token import TokenInDB
+from datetime import date, datetime, timedelta
+from typing import Dict, Tuple
+import math
+import time
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Applied to tokens that don't set their own limits; 0 means unlimited
+DEFAULT_RATE_LIMIT = float(os.getenv("DEFAULT_RATE_LIMIT", "0"))
+DEFAULT_RATE_BURST = int(os.getenv("DEFAULT_RATE_BURST", "0"))
+DEFAULT_DAILY_QUOTA = int(os.getenv("DEFAULT_DAILY_QUOTA", "0"))
+
+# Count calls in MongoDB so limits hold across all uvicorn workers,
+# instead of per worker in memory
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "false").lower() == "true"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, cost: int = 1) -> float:
+        """Take `cost` tokens; returns 0 on success, otherwise seconds until they are available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+def limits_for(token_data: TokenInDB) -> Tuple[float, int, int]:
+    """(requests per second, burst, daily quota) for a token, 0 meaning unlimited.
+
+    Admin tokens only get the limits set on them, so defaults can't lock
+    out token management.
+    """
+    defaults = (0, 0, 0) if token_data.isAdmin else (DEFAULT_RATE_LIMIT, DEFAULT_RATE_BURST, DEFAULT_DAILY_QUOTA)
+    rate = token_data.rateLimit or defaults[0]
+    burst = token_data.burst or defaults[1] or max(1, math.ceil(rate))
+    quota = token_data.dailyQuota or defaults[2]
+    return rate, burst, quota
+
+def seconds_until_tomorrow(now: datetime) -> float:
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - now).total_seconds()
+
+def over_burst(cost: int, burst: int) -> HTTPException:
+    # Waiting would not help: the bucket never holds more than `burst`
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"{cost} calls at once exceed the rate limit burst of {burst}; send fewer at a time"
+    )
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class RateLimiter:
+    buckets: Dict[str, TokenBucket] = {}
+    quotas: Dict[str, Tuple[date, int]] = {}
+
+    @classmethod
+    async def check(cls, token_data: TokenInDB, cost: int = 1) -> None:
+        """Count `cost` calls for the token (one per image of a batch), raising 429
+        with Retry-After when they would take it over its limits. Calls that are
+        refused are not counted."""
+        rate, burst, quota = limits_for(token_data)
+        if cost < 1 or (not rate and not quota):
+            return
+        if rate and cost > burst:
+            raise over_burst(cost, burst)
+        if RATE_LIMIT_SHARED:
+            try:
+                return await cls._check_shared(token_data.token, rate, burst, quota, cost)
+            except PyMongoError as e:
+                # Fall back to per-worker limits rather than failing every request
+                print(f"Shared rate limit unavailable, limiting per worker: {e}")
+        cls._check_local(token_data.token, rate, burst, quota, cost)
+
+    @classmethod
+    async def check_rest(cls, token_data: TokenInDB, calls: int) -> None:
+        """Count the rest of a request worth `calls` calls, whose first call check() already counted"""
+        rate, burst, _ = limits_for(token_data)
+        if rate and calls > burst:
+            raise over_burst(calls, burst)
+        await cls.check(token_data, cost=calls - 1)
+
+    @classmethod
+    def _check_local(cls, token: str, rate: float, burst: int, quota: int, cost: int) -> None:
+        if quota:
+            now = datetime.utcnow()
+            day, count = cls.quotas.get(token, (now.date(), 0))
+            if day != now.date():
+                day, count = now.date(), 0
+            if count + cost > quota:
+                raise too_many_requests("Daily quota exceeded", seconds_until_tomorrow(now))
+        if rate:
+            bucket = cls.buckets.get(token)
+            if bucket is None or (bucket.rate, bucket.burst) != (rate, burst):
+                bucket = cls.buckets[token] = TokenBucket(rate, burst)
+            retry_after = bucket.take(cost)
+            if retry_after:
+                raise too_many_requests("Rate limit exceeded", retry_after)
+        if quota:
+            cls.quotas[token] = (day, count + cost)
+
+    @classmethod
+    async def _check_shared(cls, token: str, rate: float, burst: int, quota: int, cost: int) -> None:
+        """Fixed windows of `burst / rate` seconds allowing `burst` calls each.
+
+        Same long-run rate and burst as the token bucket, at the cost of up to
+        two bursts back to back around a window boundary.
+        """
+        now = datetime.utcnow()
+        # Refused calls are taken back out, so a refused batch doesn't use up
+        # the window or the day for the calls after it
+        if rate:
+            window = burst / rate
+            timestamp = time.time()
+            window_start = math.floor(timestamp / window) * window
+            window_end = datetime.utcfromtimestamp(window_start + window)
+            rate_key = f"rate:{token}:{window_start}"
+            count = await increment_window(rate_key, window_end, cost)
+            if count > burst:
+                await increment_window(rate_key, window_end, -cost)
+                raise too_many_requests("Rate limit exceeded", window_start + window - timestamp)
+        if quota:
+            retry_after = seconds_until_tomorrow(now)
+            quota_key, quota_end = f"quota:{token}:{now.date().isoformat()}", now + timedelta(seconds=retry_after)
+            count = await increment_window(quota_key, quota_end, cost)
+            if count > quota:
+                await increment_window(quota_key, quota_end, -cost)
+                if rate:
+                    await increment_window(rate_key, window_end, -cost)
+                raise too_many_requests("Daily quota exceeded", retry_after)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.buckets.clear()
+        cls.quotas.clear()
@@ -1,5 +1,18 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import ConnectionFailure
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import ConnectionFailure, OperationFailure
+from bson import ObjectId
+from bson.errors import InvalidId
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+from app.core.metrics import MongoCommandMetrics, METRICS_ENABLED
+from app.db.repositories import (
+    TokenRepository, UsageRepository, UsageQuery, encode_cursor, decode_cursor, token_document,
+    bucket_start, ALL_ENDPOINTS, BUCKET_FORMATS, ROLLUP_RETENTION, USAGE_RETENTION_DAYS
+)
+from app.schemas.token import TokenInDB
+from app.schemas.usage import UsageInDB, UsageSummary
 import os
 from dotenv import load_dotenv
 
@@ -8,6 +21,35 @@ load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 
+# Connection pool per process; every in-flight request can hold a connection
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+
+# Fail fast when MongoDB is unreachable rather than after pymongo's 20-30 s defaults
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "0"))  # 0: no timeout
+
+# Write concern of every write, "majority" or a number of members; usage records
+# may use a weaker one, e.g. MONGODB_USAGE_WRITE_CONCERN=0 to not wait for acks
+MONGODB_WRITE_CONCERN = os.getenv("MONGODB_WRITE_CONCERN", "1")
+MONGODB_USAGE_WRITE_CONCERN = os.getenv("MONGODB_USAGE_WRITE_CONCERN", "")
+
+TOKENS_COLLECTION_NAME = "tokens"
+COUNTERS_COLLECTION_NAME = "counters"
+TOKENS_VERSION_ID = "tokens_version"
+USAGES_COLLECTION_NAME = "usages"
+USAGE_ROLLUPS_COLLECTION_NAME = "usage_rollups"
+
+# Newest first; _id breaks ties between records written in the same millisecond
+USAGE_SORT = [("timestamp", -1), ("_id", -1)]
+
+
+def acknowledgements(value: str):
+    """The `w` of a write concern setting: a number of members, or a tag such as majority"""
+    return int(value) if value.isdigit() else value
+
+
 class MongoDB:
     client: AsyncIOMotorClient = None
     db = None
@@ -15,7 +57,17 @@ class MongoDB:
     @classmethod
     async def connect_to_database(cls):
         try:
-            cls.client = AsyncIOMotorClient(MONGODB_URI)
+            listeners = [MongoCommandMetrics()] if METRICS_ENABLED else []
+            cls.client = AsyncIOMotorClient(
+                MONGODB_URI,
+                event_listeners=listeners,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS or None,
+                w=acknowledgements(MONGODB_WRITE_CONCERN)
+            )
             cls.db = cls.client[DATABASE_NAME]
             # Verify the connection
             await cls.client.admin.command('ping')
@@ -32,4 +84,218 @@ class MongoDB:
 
     @classmethod
     def get_database(cls):
-        return cls.db 
\ No newline at end of file
+        return cls.db
+
+
+async def create_ttl_index(collection_name: str, field: str, ttl_seconds: int) -> None:
+    """Expire documents `ttl_seconds` after their `field` date"""
+    database = MongoDB.get_database()
+    try:
+        await database[collection_name].create_index(field, expireAfterSeconds=ttl_seconds)
+    except OperationFailure:
+        # The index exists with another TTL; change it in place
+        await database.command(
+            "collMod", collection_name,
+            index={"keyPattern": {field: 1}, "expireAfterSeconds": ttl_seconds}
+        )
+
+
+class MongoTokenRepository(TokenRepository):
+
+    @staticmethod
+    def collection():
+        return MongoDB.get_database()[TOKENS_COLLECTION_NAME]
+
+    @staticmethod
+    def counters():
+        return MongoDB.get_database()[COUNTERS_COLLECTION_NAME]
+
+    async def create_indexes(self) -> None:
+        await self.collection().create_index("token", unique=True)
+
+    async def insert(self, token: TokenInDB) -> None:
+        await self.collection().insert_one(token_document(token))
+
+    async def get(self, token: str) -> Optional[TokenInDB]:
+        doc = await self.collection().find_one({"token": token})
+        if doc:
+            doc["_id"] = str(doc["_id"])
+            return TokenInDB(**doc)
+        return None
+
+    async def delete(self, token: str) -> bool:
+        result = await self.collection().delete_one({"token": token})
+        return result.deleted_count == 1
+
+    async def update(self, token: str, fields: dict) -> bool:
+        result = await self.collection().update_one({"token": token}, {"$set": fields})
+        return result.matched_count == 1
+
+    async def any(self) -> bool:
+        return await self.collection().find_one({}, {"_id": 1}) is not None
+
+    async def list(self) -> List[TokenInDB]:
+        tokens = []
+        async for doc in self.collection().find({}):
+            doc["_id"] = str(doc["_id"])
+            tokens.append(TokenInDB(**doc))
+        return tokens
+
+    async def get_version(self) -> int:
+        doc = await self.counters().find_one({"_id": TOKENS_VERSION_ID})
+        return doc["version"] if doc else 0
+
+    async def bump_version(self) -> None:
+        await self.counters().update_one({"_id": TOKENS_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+
+class MongoUsageRepository(UsageRepository):
+
+    @staticmethod
+    def collection():
+        collection = MongoDB.get_database()[USAGES_COLLECTION_NAME]
+        if MONGODB_USAGE_WRITE_CONCERN:
+            collection = collection.with_options(
+                write_concern=WriteConcern(w=acknowledgements(MONGODB_USAGE_WRITE_CONCERN))
+            )
+        return collection
+
+    @staticmethod
+    def rollups():
+        return MongoDB.get_database()[USAGE_ROLLUPS_COLLECTION_NAME]
+
+    async def create_indexes(self) -> None:
+        collection = self.collection()
+        await collection.create_index([("token", 1), ("timestamp", -1), ("_id", -1)])
+        await collection.create_index([("endpoint", 1), ("timestamp", -1), ("_id", -1)])
+        await self.create_retention_index()
+        await self.rollups().create_index(
+            [("token", 1), ("endpoint", 1), ("granularity", 1), ("bucket", -1)], unique=True
+        )
+        # Buckets carry their own expiry date, see ROLLUP_RETENTION
+        await self.rollups().create_index("expireAt", expireAfterSeconds=0)
+
+    async def create_retention_index(self) -> None:
+        if not USAGE_RETENTION_DAYS:
+            return
+        await create_ttl_index(USAGES_COLLECTION_NAME, "timestamp", USAGE_RETENTION_DAYS * 24 * 3600)
+
+    async def insert(self, usages: List[UsageInDB]) -> None:
+        docs = [
+            {"token": usage.token, "endpoint": usage.endpoint, "timestamp": usage.timestamp}
+            for usage in usages
+        ]
+        await self.collection().insert_many(docs, ordered=False)
+
+    async def add_to_rollups(self, counts: Counter) -> None:
+        """A whole batch collapses to one upsert per counter, applied in a single bulk_write"""
+        operations = []
+        for (token, endpoint, granularity, bucket), count in counts.items():
+            update = {"$inc": {"count": count}}
+            retention = ROLLUP_RETENTION[granularity]
+            if retention:
+                update["$setOnInsert"] = {"expireAt": bucket + timedelta(seconds=retention)}
+            operations.append(UpdateOne(
+                {"token": token, "endpoint": endpoint, "granularity": granularity, "bucket": bucket},
+                update,
+                upsert=True
+            ))
+        if operations:
+            await self.rollups().bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def _filter(query: UsageQuery) -> dict:
+        mongo_query: dict = {}
+        if query.token is not None:
+            mongo_query["token"] = query.token
+        if query.endpoint is not None:
+            mongo_query["endpoint"] = query.endpoint
+        if query.start is not None or query.end is not None:
+            mongo_query["timestamp"] = {}
+            if query.start is not None:
+                mongo_query["timestamp"]["$gte"] = query.start
+            if query.end is not None:
+                mongo_query["timestamp"]["$lt"] = query.end
+        return mongo_query
+
+    async def page(
+        self, query: UsageQuery, limit: int, cursor: Optional[str]
+    ) -> Tuple[List[UsageInDB], Optional[str]]:
+        """Keyset pagination on (timestamp, _id): each page is an index range scan
+        no matter how deep the client pages."""
+        mongo_query = self._filter(query)
+        if cursor:
+            timestamp, record_id = decode_cursor(cursor)
+            try:
+                object_id = ObjectId(record_id)
+            except InvalidId as e:
+                raise ValueError("Invalid cursor") from e
+            mongo_query = {"$and": [mongo_query, {"$or": [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": object_id}},
+            ]}]}
+        docs = await self.collection().find(mongo_query).sort(USAGE_SORT).limit(limit + 1).to_list(limit + 1)
+        next_cursor = encode_cursor(docs[limit - 1]["timestamp"], docs[limit - 1]["_id"]) if len(docs) > limit else None
+        usages = []
+        for doc in docs[:limit]:
+            doc["_id"] = str(doc["_id"])
+            usages.append(UsageInDB(**doc))
+        return usages, next_cursor
+
+    async def iterate(self, query: UsageQuery) -> AsyncIterator[dict]:
+        cursor = self.collection().find(self._filter(query), {"_id": 0}).sort(USAGE_SORT).batch_size(1000)
+        async for doc in cursor:
+            yield doc
+
+    async def summarize(
+        self, query: UsageQuery, group_by: List[str], granularity: Optional[str]
+    ) -> List[UsageSummary]:
+        group_id = {field: f"${field}" for field in group_by}
+        if granularity:
+            group_id["bucket"] = {"$dateToString": {"date": "$timestamp", "format": BUCKET_FORMATS[granularity]}}
+        pipeline = [
+            {"$match": self._filter(query)},
+            {"$group": {"_id": group_id, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ]
+        return [
+            UsageSummary(**doc["_id"], count=doc["count"])
+            async for doc in self.collection().aggregate(pipeline)
+        ]
+
+    async def summarize_rollups(
+        self, query: UsageQuery, group_by: List[str], granularity: Optional[str]
+    ) -> List[UsageSummary]:
+        match: dict = {"granularity": granularity or "day"}
+        if query.token is not None:
+            match["token"] = query.token
+        # Calls to every endpoint are also counted under ALL_ENDPOINTS
+        if query.endpoint is not None:
+            match["endpoint"] = query.endpoint
+        else:
+            match["endpoint"] = {"$ne": ALL_ENDPOINTS} if "endpoint" in group_by else ALL_ENDPOINTS
+        if query.start is not None or query.end is not None:
+            match["bucket"] = {}
+            if query.start is not None:
+                match["bucket"]["$gte"] = bucket_start(query.start, granularity or "day")
+            if query.end is not None:
+                match["bucket"]["$lt"] = query.end
+        group_id = {field: f"${field}" for field in group_by}
+        if granularity:
+            group_id["bucket"] = "$bucket"
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": group_id, "count": {"$sum": "$count"}}},
+            {"$sort": {"_id": 1}},
+        ]
+        return [
+            UsageSummary(**doc["_id"], count=doc["count"])
+            async for doc in self.rollups().aggregate(pipeline)
+        ]
+
+    async def rollup_count(self, token: str, endpoint: str, granularity: str, bucket: datetime) -> int:
+        doc = await self.rollups().find_one(
+            {"token": token, "endpoint": endpoint, "granularity": granularity, "bucket": bucket},
+            {"count": 1}
+        )
+        return doc["count"] if doc else 0
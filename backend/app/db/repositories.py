@@ -0,0 +1,162 @@
+import base64
+import binascii
+import os
+import sqlite3
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+
+from app.schemas.token import TokenInDB
+from app.schemas.usage import UsageInDB, UsageSummary
+
+load_dotenv()
+
+# What a failing token or usage store raises, whichever backend is configured
+STORAGE_ERRORS = (PyMongoError, sqlite3.Error)
+
+# Raw usage records are deleted after this many days (0 keeps them forever);
+# long-term counts live in the usage rollups
+USAGE_RETENTION_DAYS = int(os.getenv("USAGE_RETENTION_DAYS", "90"))
+
+DEFAULT_PAGE_SIZE = 100
+
+BUCKET_FORMATS = {
+    "hour": "%Y-%m-%dT%H:00:00Z",
+    "day": "%Y-%m-%dT00:00:00Z",
+}
+
+GRANULARITIES = ("minute", "hour", "day")
+
+# Counters for every endpoint of a token are also kept under this endpoint
+ALL_ENDPOINTS = "*"
+
+# How long buckets of each size are kept, in seconds (0 keeps them forever)
+ROLLUP_RETENTION = {
+    "minute": int(os.getenv("USAGE_ROLLUP_MINUTE_RETENTION", str(2 * 24 * 3600))),
+    "hour": int(os.getenv("USAGE_ROLLUP_HOUR_RETENTION", str(90 * 24 * 3600))),
+    "day": int(os.getenv("USAGE_ROLLUP_DAY_RETENTION", "0")),
+}
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def count_buckets(usages: Iterable[UsageInDB]) -> Counter:
+    """Number of calls per (token, endpoint, granularity, bucket) key"""
+    counts: Counter = Counter()
+    for usage in usages:
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(usage.timestamp, granularity)
+            counts[(usage.token, usage.endpoint, granularity, bucket)] += 1
+            counts[(usage.token, ALL_ENDPOINTS, granularity, bucket)] += 1
+    return counts
+
+
+def encode_cursor(timestamp: datetime, record_id) -> str:
+    raw = f"{timestamp.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """(timestamp, record id) of a cursor; raises ValueError for cursors encode_cursor didn't produce"""
+    try:
+        timestamp, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), record_id
+    except (binascii.Error, UnicodeDecodeError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def token_document(token: TokenInDB) -> dict:
+    """A token's fields as plain values any backend can store"""
+    doc = token.model_dump()
+    doc["webhookUrl"] = str(token.webhookUrl) if token.webhookUrl else None
+    return doc
+
+
+@dataclass
+class UsageQuery:
+    """Which usage records a listing, summary or export covers"""
+    token: Optional[str] = None
+    endpoint: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+
+class TokenRepository:
+    """Stores API tokens, and the version number caches use to notice changes"""
+
+    async def create_indexes(self) -> None:
+        raise NotImplementedError
+
+    async def insert(self, token: TokenInDB) -> None:
+        raise NotImplementedError
+
+    async def get(self, token: str) -> Optional[TokenInDB]:
+        raise NotImplementedError
+
+    async def delete(self, token: str) -> bool:
+        raise NotImplementedError
+
+    async def update(self, token: str, fields: dict) -> bool:
+        """Set fields of a token; False when there is no such token"""
+        raise NotImplementedError
+
+    async def any(self) -> bool:
+        raise NotImplementedError
+
+    async def list(self) -> List[TokenInDB]:
+        raise NotImplementedError
+
+    async def get_version(self) -> int:
+        raise NotImplementedError
+
+    async def bump_version(self) -> None:
+        raise NotImplementedError
+
+
+class UsageRepository:
+    """Stores raw usage records and their per-minute/hour/day rollup counters"""
+
+    async def create_indexes(self) -> None:
+        raise NotImplementedError
+
+    async def insert(self, usages: List[UsageInDB]) -> None:
+        raise NotImplementedError
+
+    async def add_to_rollups(self, counts: Counter) -> None:
+        """Add count_buckets() counts to the rollup counters"""
+        raise NotImplementedError
+
+    async def page(
+        self, query: UsageQuery, limit: int, cursor: Optional[str]
+    ) -> Tuple[List[UsageInDB], Optional[str]]:
+        """One page of records, newest first, and the cursor of the next page (if any)"""
+        raise NotImplementedError
+
+    def iterate(self, query: UsageQuery) -> AsyncIterator[dict]:
+        """Every matching record as a {token, endpoint, timestamp} dict, newest first"""
+        raise NotImplementedError
+
+    async def summarize(
+        self, query: UsageQuery, group_by: List[str], granularity: Optional[str]
+    ) -> List[UsageSummary]:
+        raise NotImplementedError
+
+    async def summarize_rollups(
+        self, query: UsageQuery, group_by: List[str], granularity: Optional[str]
+    ) -> List[UsageSummary]:
+        """Like summarize, but summed from the hour/day counters (day when no granularity
+        is given), which outlive the raw records. start/end select whole buckets."""
+        raise NotImplementedError
+
+    async def rollup_count(self, token: str, endpoint: str, granularity: str, bucket: datetime) -> int:
+        raise NotImplementedError
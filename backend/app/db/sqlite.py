@@ -0,0 +1,335 @@
+import asyncio
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from app.db.repositories import (
+    TokenRepository, UsageRepository, UsageQuery, encode_cursor, decode_cursor, token_document,
+    bucket_start, ALL_ENDPOINTS, BUCKET_FORMATS, ROLLUP_RETENTION, USAGE_RETENTION_DAYS
+)
+from app.schemas.token import TokenInDB
+from app.schemas.usage import UsageInDB, UsageSummary
+
+load_dotenv()
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "moderation.db")
+
+# NORMAL is durable in WAL mode except for the last commits before a power loss
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Expired usage records and rollups are deleted at most this often
+PURGE_INTERVAL = 3600
+
+EXPORT_CHUNK = 1000
+
+TOKEN_COLUMNS = ("token", "isAdmin", "rateLimit", "burst", "dailyQuota", "policy", "webhookUrl", "createdAt")
+
+
+def _timestamp(value: datetime) -> str:
+    # Naive UTC like the stored values, at a fixed width so text order is time order
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+class SQLiteDB:
+    """One SQLite connection in WAL mode, owned by a single worker thread.
+
+    Every statement runs in that thread, so the event loop never waits on a
+    lock or an fsync. Each write is its own transaction, committed before the
+    call returns; the usage writer already batches records, so a flush is one
+    short transaction and no lock is held between flushes. In WAL mode readers
+    in other processes are not blocked, but a writer in another process waits
+    for the flush in progress (at most SQLITE_BUSY_TIMEOUT_MS).
+    """
+    connection: Optional[sqlite3.Connection] = None
+    executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    async def connect_to_database(cls, path: Optional[str] = None):
+        path = path or SQLITE_PATH
+        cls.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        cls.connection = await cls.run(cls._open, path)
+        print(f"Opened SQLite database {path}")
+
+    @classmethod
+    async def close_database_connection(cls):
+        if cls.connection:
+            await cls.run(cls.connection.close)
+            cls.connection = None
+            print("SQLite database closed.")
+        if cls.executor:
+            cls.executor.shutdown()
+            cls.executor = None
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        connection.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        return connection
+
+    @classmethod
+    async def run(cls, function: Callable, *args):
+        """Call function in the database thread"""
+        return await asyncio.get_running_loop().run_in_executor(cls.executor, function, *args)
+
+    @classmethod
+    async def read(cls, sql: str, params: Sequence = ()) -> List[sqlite3.Row]:
+        return await cls.run(lambda: cls.connection.execute(sql, params).fetchall())
+
+    @classmethod
+    async def write(cls, sql: str, params: Sequence = (), many: bool = False) -> int:
+        """Run a write in a transaction of its own; returns the changed row count"""
+        return await cls.run(cls._write, sql, params, many)
+
+    @classmethod
+    def _write(cls, sql: str, params: Sequence, many: bool) -> int:
+        connection = cls.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.executemany(sql, params) if many else connection.execute(sql, params)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    @classmethod
+    async def script(cls, sql: str) -> None:
+        await cls.run(cls.connection.executescript, sql)
+
+
+class SQLiteTokenRepository(TokenRepository):
+
+    async def create_indexes(self) -> None:
+        await SQLiteDB.script("""
+            CREATE TABLE IF NOT EXISTS tokens (
+                token TEXT PRIMARY KEY, isAdmin INTEGER NOT NULL, rateLimit REAL, burst INTEGER,
+                dailyQuota INTEGER, policy TEXT, webhookUrl TEXT, createdAt TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS counters (id TEXT PRIMARY KEY, version INTEGER NOT NULL);
+        """)
+
+    @staticmethod
+    def _to_token(row: sqlite3.Row) -> TokenInDB:
+        return TokenInDB(**{
+            **dict(row), "isAdmin": bool(row["isAdmin"]), "createdAt": datetime.fromisoformat(row["createdAt"])
+        })
+
+    async def insert(self, token: TokenInDB) -> None:
+        doc = token_document(token)
+        doc["createdAt"] = _timestamp(doc["createdAt"])
+        await SQLiteDB.write(
+            f"INSERT INTO tokens ({', '.join(TOKEN_COLUMNS)}) VALUES ({', '.join('?' * len(TOKEN_COLUMNS))})",
+            [doc[column] for column in TOKEN_COLUMNS]
+        )
+
+    async def get(self, token: str) -> Optional[TokenInDB]:
+        rows = await SQLiteDB.read("SELECT * FROM tokens WHERE token = ?", (token,))
+        return self._to_token(rows[0]) if rows else None
+
+    async def delete(self, token: str) -> bool:
+        return await SQLiteDB.write("DELETE FROM tokens WHERE token = ?", (token,)) == 1
+
+    async def update(self, token: str, fields: dict) -> bool:
+        unknown = set(fields) - set(TOKEN_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown token fields: {sorted(unknown)}")
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        return await SQLiteDB.write(
+            f"UPDATE tokens SET {assignments} WHERE token = ?", [*fields.values(), token]
+        ) == 1
+
+    async def any(self) -> bool:
+        return bool(await SQLiteDB.read("SELECT 1 FROM tokens LIMIT 1"))
+
+    async def list(self) -> List[TokenInDB]:
+        return [self._to_token(row) for row in await SQLiteDB.read("SELECT * FROM tokens")]
+
+    async def get_version(self) -> int:
+        rows = await SQLiteDB.read("SELECT version FROM counters WHERE id = 'tokens_version'")
+        return rows[0]["version"] if rows else 0
+
+    async def bump_version(self) -> None:
+        await SQLiteDB.write(
+            "INSERT INTO counters (id, version) VALUES ('tokens_version', 1) "
+            "ON CONFLICT (id) DO UPDATE SET version = version + 1"
+        )
+
+
+class SQLiteUsageRepository(UsageRepository):
+
+    def __init__(self):
+        self.purged_at = 0.0
+
+    async def create_indexes(self) -> None:
+        await SQLiteDB.script("""
+            CREATE TABLE IF NOT EXISTS usages (
+                id INTEGER PRIMARY KEY, token TEXT NOT NULL, endpoint TEXT NOT NULL, timestamp TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS usages_token ON usages (token, timestamp, id);
+            CREATE INDEX IF NOT EXISTS usages_endpoint ON usages (endpoint, timestamp, id);
+            CREATE INDEX IF NOT EXISTS usages_timestamp ON usages (timestamp);
+            CREATE TABLE IF NOT EXISTS usage_rollups (
+                token TEXT NOT NULL, endpoint TEXT NOT NULL, granularity TEXT NOT NULL, bucket TEXT NOT NULL,
+                count INTEGER NOT NULL, expireAt TEXT,
+                PRIMARY KEY (token, endpoint, granularity, bucket)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS usage_rollups_expire ON usage_rollups (expireAt);
+        """)
+        await self.purge_expired()
+
+    async def purge_expired(self) -> None:
+        """What MongoDB's TTL indexes do: drop records past their retention"""
+        now = datetime.utcnow()
+        self.purged_at = time.monotonic()
+        if USAGE_RETENTION_DAYS:
+            await SQLiteDB.write(
+                "DELETE FROM usages WHERE timestamp < ?", (_timestamp(now - timedelta(days=USAGE_RETENTION_DAYS)),)
+            )
+        await SQLiteDB.write("DELETE FROM usage_rollups WHERE expireAt < ?", (_timestamp(now),))
+
+    async def insert(self, usages: List[UsageInDB]) -> None:
+        await SQLiteDB.write(
+            "INSERT INTO usages (token, endpoint, timestamp) VALUES (?, ?, ?)",
+            [(usage.token, usage.endpoint, _timestamp(usage.timestamp)) for usage in usages],
+            many=True
+        )
+        if time.monotonic() - self.purged_at > PURGE_INTERVAL:
+            await self.purge_expired()
+
+    async def add_to_rollups(self, counts: Counter) -> None:
+        rows = []
+        for (token, endpoint, granularity, bucket), count in counts.items():
+            retention = ROLLUP_RETENTION[granularity]
+            expire_at = _timestamp(bucket + timedelta(seconds=retention)) if retention else None
+            rows.append((token, endpoint, granularity, _timestamp(bucket), count, expire_at))
+        await SQLiteDB.write(
+            "INSERT INTO usage_rollups (token, endpoint, granularity, bucket, count, expireAt) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (token, endpoint, granularity, bucket) DO UPDATE SET count = count + excluded.count",
+            rows,
+            many=True
+        )
+
+    @staticmethod
+    def _where(query: UsageQuery, after: Optional[Tuple[str, int]] = None) -> Tuple[str, list]:
+        conditions, params = [], []
+        if query.token is not None:
+            conditions.append("token = ?")
+            params.append(query.token)
+        if query.endpoint is not None:
+            conditions.append("endpoint = ?")
+            params.append(query.endpoint)
+        if query.start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(_timestamp(query.start))
+        if query.end is not None:
+            conditions.append("timestamp < ?")
+            params.append(_timestamp(query.end))
+        if after is not None:
+            conditions.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    async def _select(self, query: UsageQuery, limit: int, after: Optional[Tuple[str, int]]) -> List[sqlite3.Row]:
+        where, params = self._where(query, after)
+        return await SQLiteDB.read(
+            f"SELECT id, token, endpoint, timestamp FROM usages {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            [*params, limit]
+        )
+
+    async def page(
+        self, query: UsageQuery, limit: int, cursor: Optional[str]
+    ) -> Tuple[List[UsageInDB], Optional[str]]:
+        after = None
+        if cursor:
+            timestamp, record_id = decode_cursor(cursor)
+            after = (_timestamp(timestamp), int(record_id))
+        rows = await self._select(query, limit + 1, after)
+        usages = [
+            UsageInDB(token=row["token"], endpoint=row["endpoint"], timestamp=datetime.fromisoformat(row["timestamp"]))
+            for row in rows[:limit]
+        ]
+        next_cursor = encode_cursor(usages[-1].timestamp, rows[limit - 1]["id"]) if len(rows) > limit else None
+        return usages, next_cursor
+
+    async def iterate(self, query: UsageQuery) -> AsyncIterator[dict]:
+        # Chunked by keyset so a large export isn't read into memory at once
+        after = None
+        while True:
+            rows = await self._select(query, EXPORT_CHUNK, after)
+            for row in rows:
+                yield {
+                    "token": row["token"], "endpoint": row["endpoint"],
+                    "timestamp": datetime.fromisoformat(row["timestamp"])
+                }
+            if len(rows) < EXPORT_CHUNK:
+                return
+            after = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    async def summarize(
+        self, query: UsageQuery, group_by: List[str], granularity: Optional[str]
+    ) -> List[UsageSummary]:
+        if not set(group_by) <= {"token", "endpoint"}:
+            raise ValueError(f"Cannot group usage by {group_by}")
+        keys = list(group_by)
+        selected = list(group_by)
+        if granularity:
+            keys.append("bucket")
+            selected.append(f"strftime('{BUCKET_FORMATS[granularity]}', timestamp) AS bucket")
+        where, params = self._where(query)
+        grouping = f"GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if keys else ""
+        rows = await SQLiteDB.read(
+            f"SELECT {', '.join([*selected, 'COUNT(*) AS count'])} FROM usages {where} {grouping}", params
+        )
+        # Without grouping an empty table still yields one row, which MongoDB doesn't
+        return [UsageSummary(**dict(row)) for row in rows if row["count"]]
+
+    async def summarize_rollups(
+        self, query: UsageQuery, group_by: List[str], granularity: Optional[str]
+    ) -> List[UsageSummary]:
+        if not set(group_by) <= {"token", "endpoint"}:
+            raise ValueError(f"Cannot group usage by {group_by}")
+        conditions, params = ["granularity = ?"], [granularity or "day"]
+        if query.token is not None:
+            conditions.append("token = ?")
+            params.append(query.token)
+        # Calls to every endpoint are also counted under ALL_ENDPOINTS
+        if query.endpoint is not None:
+            conditions.append("endpoint = ?")
+            params.append(query.endpoint)
+        else:
+            conditions.append("endpoint != ?" if "endpoint" in group_by else "endpoint = ?")
+            params.append(ALL_ENDPOINTS)
+        if query.start is not None:
+            conditions.append("bucket >= ?")
+            params.append(_timestamp(bucket_start(query.start, granularity or "day")))
+        if query.end is not None:
+            conditions.append("bucket < ?")
+            params.append(_timestamp(query.end))
+        keys = list(group_by) + (["bucket"] if granularity else [])
+        grouping = f"GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if keys else ""
+        rows = await SQLiteDB.read(
+            f"SELECT {', '.join([*keys, 'SUM(count) AS count'])} FROM usage_rollups "
+            f"WHERE {' AND '.join(conditions)} {grouping}",
+            params
+        )
+        return [UsageSummary(**dict(row)) for row in rows if row["count"]]
+
+    async def rollup_count(self, token: str, endpoint: str, granularity: str, bucket: datetime) -> int:
+        rows = await SQLiteDB.read(
+            "SELECT count FROM usage_rollups WHERE token = ? AND endpoint = ? AND granularity = ? AND bucket = ?",
+            (token, endpoint, granularity, _timestamp(bucket))
+        )
+        return rows[0]["count"] if rows else 0
@@ -0,0 +1,42 @@
+import os
+
+from dotenv import load_dotenv
+
+from app.db.mongodb import MongoTokenRepository, MongoUsageRepository
+from app.db.repositories import TokenRepository, UsageRepository
+from app.db.sqlite import SQLiteDB, SQLiteTokenRepository, SQLiteUsageRepository
+
+load_dotenv()
+
+# Where tokens and usage live: "mongodb", or "sqlite" (SQLITE_PATH) for a single
+# node, where auth and usage logging then never leave the host. Jobs and the
+# shared caches stay in MongoDB either way.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongodb")
+
+BACKENDS = ("mongodb", "sqlite")
+
+
+class Storage:
+    """The token and usage repositories of the configured backend"""
+    backend: str = "mongodb"
+    tokens: TokenRepository = MongoTokenRepository()
+    usages: UsageRepository = MongoUsageRepository()
+
+    @classmethod
+    async def connect(cls, backend: str = STORAGE_BACKEND):
+        """Open the backend and create its indexes (tables, for SQLite); MongoDB is connected separately"""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected one of {BACKENDS}")
+        if backend == "sqlite":
+            await SQLiteDB.connect_to_database()
+            cls.tokens, cls.usages = SQLiteTokenRepository(), SQLiteUsageRepository()
+        else:
+            cls.tokens, cls.usages = MongoTokenRepository(), MongoUsageRepository()
+        cls.backend = backend
+        await cls.tokens.create_indexes()
+        await cls.usages.create_indexes()
+
+    @classmethod
+    async def close(cls):
+        if cls.backend == "sqlite":
+            await SQLiteDB.close_database_connection()
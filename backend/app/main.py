@@ -1,22 +1,60 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import router
 from app.db.mongodb import MongoDB
+from app.db.storage import Storage
+from app.core.auth import TokenCache
+from app.core.metrics import MetricsMiddleware, METRICS_ENABLED, render_metrics
+from app.models.rate_limit import create_indexes as create_rate_limit_indexes
+from app.models.job import create_indexes as create_job_indexes
+from app.services.sightengine import SightEngineClient
+from app.services.result_cache import ModerationCache
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.policy import PolicyEngine
+from app.services.prefilter import Prefilter
+from app.services.jobs import JobWorker, JOB_WORKERS_EMBEDDED
+from app.services.webhooks import WebhookSender
+from app.services.sniff import TypeSniffer
+from app.services.usage_writer import UsageWriter
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
     await MongoDB.connect_to_database()
+    await Storage.connect()
+    await create_rate_limit_indexes()
+    await create_job_indexes()
+    await TokenCache.start()
+    await TypeSniffer.start()
+    await UsageWriter.start()
+    await SightEngineClient.start()
+    await ModerationCache.start()
+    await NearDuplicateIndex.start()
+    await PolicyEngine.start()
+    await Prefilter.start()
+    await WebhookSender.start()
+    if JOB_WORKERS_EMBEDDED:
+        await JobWorker.start()
     yield
     # Shutdown logic
+    await JobWorker.close()
+    await WebhookSender.close()
+    await PolicyEngine.close()
+    await TokenCache.close()
+    await UsageWriter.close()
+    await SightEngineClient.close()
+    await Prefilter.close()
+    await Storage.close()
     await MongoDB.close_database_connection()
 
 app = FastAPI(
     title="Image Moderation API",
     description="API for moderating images using FastAPI",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -26,8 +64,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Location", "Retry-After"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        body, content_type = render_metrics()
+        return Response(body, media_type=content_type)
+
 # Include the API router
 app.include_router(router, prefix="/api")
 
@@ -0,0 +1,111 @@
+from app.db.mongodb import MongoDB
+from app.schemas.job import JobInDB
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+from typing import Optional
+import os
+import uuid
+
+load_dotenv()
+
+COLLECTION_NAME = "jobs"
+
+# Finished jobs (and their results) are dropped by a TTL index after this long
+JOB_RESULT_TTL_HOURS = float(os.getenv("JOB_RESULT_TTL_HOURS", "24"))
+
+def get_jobs_collection():
+    return MongoDB.get_database()[COLLECTION_NAME]
+
+async def create_indexes() -> None:
+    collection = get_jobs_collection()
+    await collection.create_index([("status", 1), ("availableAt", 1)])
+    await collection.create_index("expireAt", expireAfterSeconds=0)
+
+def _to_job(doc: dict) -> JobInDB:
+    return JobInDB(id=doc["_id"], **{k: v for k, v in doc.items() if k != "_id"})
+
+async def create_job(
+    token: str, filename: str, content: bytes, policy: Optional[str] = None, webhook_url: Optional[str] = None,
+    include_raw: bool = False
+) -> JobInDB:
+    """Queue an image for moderation; the image bytes live in the job until it finishes"""
+    now = datetime.utcnow()
+    doc = {
+        "_id": uuid.uuid4().hex,
+        "token": token,
+        "filename": filename,
+        "content": content,
+        "policy": policy,
+        "webhookUrl": webhook_url,
+        "includeRaw": include_raw,
+        "status": "queued",
+        "attempts": 0,
+        "result": None,
+        "error": None,
+        "createdAt": now,
+        "updatedAt": now,
+        "availableAt": now
+    }
+    await get_jobs_collection().insert_one(doc)
+    return _to_job(doc)
+
+async def get_job(job_id: str) -> Optional[JobInDB]:
+    doc = await get_jobs_collection().find_one({"_id": job_id}, {"content": 0})
+    return _to_job(doc) if doc else None
+
+async def claim_job(lease_seconds: float) -> Optional[dict]:
+    """Atomically take the oldest runnable job, including ones whose worker's lease ran out.
+
+    The job stays hidden from other workers for `lease_seconds`. Returns the raw
+    document (with `content` and a fresh `leaseId`) or None when there is nothing to do.
+    """
+    now = datetime.utcnow()
+    return await get_jobs_collection().find_one_and_update(
+        {"status": {"$in": ["queued", "processing"]}, "availableAt": {"$lte": now}},
+        {
+            "$set": {
+                "status": "processing",
+                "leaseId": uuid.uuid4().hex,
+                "availableAt": now + timedelta(seconds=lease_seconds),
+                "updatedAt": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("availableAt", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def release_job(job_id: str, lease_id: str, delay: float, count_attempt: bool = True) -> bool:
+    """Put a claimed job back in the queue, runnable again after `delay` seconds.
+
+    With count_attempt=False the claim doesn't count towards the job's attempts.
+    False if the lease was lost to another worker in the meantime.
+    """
+    now = datetime.utcnow()
+    update = {"$set": {"status": "queued", "availableAt": now + timedelta(seconds=delay), "updatedAt": now}}
+    if not count_attempt:
+        update["$inc"] = {"attempts": -1}
+    result = await get_jobs_collection().update_one({"_id": job_id, "leaseId": lease_id}, update)
+    return result.modified_count == 1
+
+async def finish_job(job_id: str, lease_id: str, result: Optional[dict] = None, error: Optional[str] = None) -> bool:
+    """Record the outcome and drop the image bytes; False if the lease was lost to another worker"""
+    now = datetime.utcnow()
+    update = await get_jobs_collection().update_one(
+        {"_id": job_id, "leaseId": lease_id},
+        {
+            "$set": {
+                "status": "failed" if error else "done",
+                "result": result,
+                "error": error,
+                "updatedAt": now,
+                "expireAt": now + timedelta(hours=JOB_RESULT_TTL_HOURS)
+            },
+            "$unset": {"content": "", "availableAt": "", "leaseId": ""}
+        }
+    )
+    return update.modified_count == 1
+
+async def set_webhook_delivered(job_id: str, delivered: bool) -> None:
+    await get_jobs_collection().update_one({"_id": job_id}, {"$set": {"webhookDelivered": delivered}})
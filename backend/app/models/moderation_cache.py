@@ -0,0 +1,24 @@
+from app.db.mongodb import MongoDB, create_ttl_index
+from datetime import datetime
+from typing import Optional
+
+COLLECTION_NAME = "moderation_cache"
+
+def get_moderation_cache_collection():
+    return MongoDB.get_database()[COLLECTION_NAME]
+
+async def create_indexes(ttl_seconds: int) -> None:
+    await create_ttl_index(COLLECTION_NAME, "createdAt", ttl_seconds)
+
+async def get_cached_result(key: str) -> Optional[dict]:
+    collection = get_moderation_cache_collection()
+    doc = await collection.find_one({"_id": key}, {"result": 1})
+    return doc["result"] if doc else None
+
+async def store_cached_result(key: str, result: dict) -> None:
+    collection = get_moderation_cache_collection()
+    await collection.replace_one(
+        {"_id": key},
+        {"result": result, "createdAt": datetime.utcnow()},
+        upsert=True
+    )
@@ -0,0 +1,44 @@
+from app.db.mongodb import MongoDB, create_ttl_index
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+
+COLLECTION_NAME = "phash_index"
+
+def to_signed(phash: int) -> int:
+    """Map an unsigned 64-bit hash onto MongoDB's signed int64 range"""
+    return phash - (1 << 64) if phash >= 1 << 63 else phash
+
+def to_unsigned(phash: int) -> int:
+    return phash + (1 << 64) if phash < 0 else phash
+
+def get_phash_collection():
+    return MongoDB.get_database()[COLLECTION_NAME]
+
+async def create_indexes(ttl_seconds: int) -> None:
+    collection = get_phash_collection()
+    # Sparse: entries stored before results were keyed by models have neither field
+    await collection.create_index([("models", 1), ("phash", 1)], unique=True, sparse=True)
+    await create_ttl_index(COLLECTION_NAME, "createdAt", ttl_seconds)
+
+def _fresh(models: str, ttl_seconds: int) -> dict:
+    # MongoDB's TTL monitor only runs every minute, so expiry is checked here too
+    return {"models": models, "createdAt": {"$gt": datetime.utcnow() - timedelta(seconds=ttl_seconds)}}
+
+async def iter_phashes(models: str, ttl_seconds: int) -> AsyncIterator[int]:
+    """Unexpired hashes stored for this set of upstream models"""
+    collection = get_phash_collection()
+    async for doc in collection.find(_fresh(models, ttl_seconds), {"phash": 1}, batch_size=10000):
+        yield to_unsigned(doc["phash"])
+
+async def get_phash_result(phash: int, models: str, ttl_seconds: int) -> Optional[dict]:
+    collection = get_phash_collection()
+    doc = await collection.find_one({**_fresh(models, ttl_seconds), "phash": to_signed(phash)}, {"result": 1})
+    return doc["result"] if doc else None
+
+async def store_phash_result(phash: int, models: str, result: dict) -> None:
+    collection = get_phash_collection()
+    await collection.replace_one(
+        {"models": models, "phash": to_signed(phash)},
+        {"models": models, "phash": to_signed(phash), "result": result, "createdAt": datetime.utcnow()},
+        upsert=True
+    )
@@ -0,0 +1,23 @@
+from app.db.mongodb import MongoDB
+from datetime import datetime
+from pymongo import ReturnDocument
+
+COLLECTION_NAME = "rate_limits"
+
+def get_rate_limits_collection():
+    return MongoDB.get_database()[COLLECTION_NAME]
+
+async def create_indexes() -> None:
+    collection = get_rate_limits_collection()
+    await collection.create_index("expireAt", expireAfterSeconds=0)
+
+async def increment_window(key: str, expire_at: datetime, calls: int = 1) -> int:
+    """Count `calls` more calls in a fixed window shared by every worker; returns the new count"""
+    collection = get_rate_limits_collection()
+    doc = await collection.find_one_and_update(
+        {"_id": key},
+        {"$inc": {"count": calls}, "$setOnInsert": {"expireAt": expire_at}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["count"]
@@ -1,43 +1,58 @@
-from app.db.mongodb import MongoDB
-from app.schemas.token import TokenCreate, TokenInDB
+from app.db.mongodb import MongoTokenRepository
+from app.db.storage import Storage
+from app.schemas.token import TokenCreate, TokenInDB, TokenLimits, TokenPolicy, TokenWebhook
 from datetime import datetime
 import secrets
 from typing import Optional, List
 
-COLLECTION_NAME = "tokens"
-
 def get_tokens_collection():
-    return MongoDB.get_database()[COLLECTION_NAME]
+    """The MongoDB tokens collection, when tokens are stored in MongoDB"""
+    return MongoTokenRepository.collection()
+
+async def get_tokens_version() -> int:
+    """Version bumped whenever a token is deleted, so caches can tell they are stale"""
+    return await Storage.tokens.get_version()
+
+async def bump_tokens_version() -> None:
+    await Storage.tokens.bump_version()
 
 async def create_token(token_data: TokenCreate) -> TokenInDB:
-    token_str = secrets.token_urlsafe(32)
-    doc = {
-        "token": token_str,
-        "isAdmin": token_data.isAdmin,
-        "createdAt": datetime.utcnow()
-    }
-    collection = get_tokens_collection()
-    await collection.insert_one(doc)
-    return TokenInDB(**doc)
+    token = TokenInDB(
+        token=secrets.token_urlsafe(32),
+        isAdmin=token_data.isAdmin,
+        policy=token_data.policy,
+        createdAt=datetime.utcnow()
+    )
+    await Storage.tokens.insert(token)
+    return token
 
 async def get_token(token: str) -> Optional[TokenInDB]:
-    collection = get_tokens_collection()
-    doc = await collection.find_one({"token": token})
-    if doc:
-        doc["_id"] = str(doc["_id"])
-        return TokenInDB(**doc)
-    return None
+    return await Storage.tokens.get(token)
 
 async def delete_token(token: str) -> bool:
-    collection = get_tokens_collection()
-    result = await collection.delete_one({"token": token})
-    return result.deleted_count == 1
+    if await Storage.tokens.delete(token):
+        await bump_tokens_version()
+        return True
+    return False
+
+async def update_token(token: str, fields: dict) -> bool:
+    if await Storage.tokens.update(token, fields):
+        # Cached copies of the token hold the old settings
+        await bump_tokens_version()
+        return True
+    return False
+
+async def update_token_limits(token: str, limits: TokenLimits) -> bool:
+    return await update_token(token, limits.model_dump())
+
+async def update_token_policy(token: str, policy: TokenPolicy) -> bool:
+    return await update_token(token, policy.model_dump())
+
+async def update_token_webhook(token: str, webhook: TokenWebhook) -> bool:
+    return await update_token(token, webhook.model_dump(mode="json"))
+
+async def has_tokens() -> bool:
+    return await Storage.tokens.any()
 
 async def list_tokens() -> List[TokenInDB]:
-    collection = get_tokens_collection()
-    cursor = collection.find({})
-    tokens = []
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        tokens.append(TokenInDB(**doc))
-    return tokens 
\ No newline at end of file
+    return await Storage.tokens.list()
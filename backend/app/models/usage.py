@@ -1,37 +1,91 @@
-from app.db.mongodb import MongoDB
-from app.schemas.usage import UsageCreate, UsageInDB
+from app.db.mongodb import MongoUsageRepository
+from app.db.repositories import UsageQuery, STORAGE_ERRORS, DEFAULT_PAGE_SIZE
+from app.db.storage import Storage
+from app.models.usage_rollup import apply_usages
+from app.schemas.usage import UsageCreate, UsageInDB, UsageSummary
 from datetime import datetime
-from typing import List
-
-COLLECTION_NAME = "usages"
+from pymongo.errors import BulkWriteError
+from typing import AsyncIterator, List, Optional, Tuple
 
 def get_usages_collection():
-    return MongoDB.get_database()[COLLECTION_NAME]
+    """The MongoDB usages collection, when usage is stored in MongoDB"""
+    return MongoUsageRepository.collection()
+
+async def update_rollups(usages: List[UsageInDB]) -> None:
+    """Best effort: the raw records are already written, so a failure here
+    must not make callers retry (and duplicate) them."""
+    try:
+        await apply_usages(usages)
+    except STORAGE_ERRORS as e:
+        print(f"Failed to update usage rollups for {len(usages)} records: {e}")
 
 async def create_usage(usage_data: UsageCreate) -> UsageInDB:
-    doc = {
-        "token": usage_data.token,
-        "endpoint": usage_data.endpoint,
-        "timestamp": datetime.utcnow()
-    }
-    collection = get_usages_collection()
-    await collection.insert_one(doc)
-    return UsageInDB(**doc)
-
-async def list_usages_by_token(token: str) -> List[UsageInDB]:
-    collection = get_usages_collection()
-    cursor = collection.find({"token": token})
-    usages = []
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        usages.append(UsageInDB(**doc))
-    return usages
-
-async def list_usages_by_endpoint(endpoint: str) -> List[UsageInDB]:
-    collection = get_usages_collection()
-    cursor = collection.find({"endpoint": endpoint})
-    usages = []
-    async for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        usages.append(UsageInDB(**doc))
-    return usages 
\ No newline at end of file
+    usage = UsageInDB(token=usage_data.token, endpoint=usage_data.endpoint, timestamp=datetime.utcnow())
+    await insert_usages([usage])
+    return usage
+
+async def create_usages(usages: List[UsageCreate]) -> List[UsageInDB]:
+    now = datetime.utcnow()
+    records = [UsageInDB(token=usage.token, endpoint=usage.endpoint, timestamp=now) for usage in usages]
+    await insert_usages(records)
+    return records
+
+async def insert_usages(usages: List[UsageInDB]) -> None:
+    """Bulk insert already timestamped usage records"""
+    if not usages:
+        return
+    try:
+        await Storage.usages.insert(usages)
+    except BulkWriteError as e:
+        # The unordered insert_many still wrote every record but the failed ones
+        await update_rollups(not_inserted(usages, e, inserted=True))
+        raise
+    await update_rollups(usages)
+
+def not_inserted(usages: List[UsageInDB], error: Exception, inserted: bool = False) -> List[UsageInDB]:
+    """The records of a failed insert_usages() call that did not reach storage,
+    or with `inserted` the ones that did. Only a BulkWriteError tells them apart;
+    after any other error none are assumed written."""
+    if not isinstance(error, BulkWriteError):
+        return [] if inserted else usages
+    failed = {write_error["index"] for write_error in error.details.get("writeErrors", [])}
+    return [usage for index, usage in enumerate(usages) if (index in failed) != inserted]
+
+def build_usage_query(
+    token: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> UsageQuery:
+    return UsageQuery(token=token, endpoint=endpoint, start=start, end=end)
+
+async def list_usages(
+    query: UsageQuery, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None
+) -> Tuple[List[UsageInDB], Optional[str]]:
+    """One page of usage, newest first, plus the cursor of the next page (if any).
+
+    Raises ValueError for cursors that were not produced by an earlier page.
+    """
+    return await Storage.usages.page(query, limit, cursor)
+
+def iter_usages(query: UsageQuery) -> AsyncIterator[dict]:
+    """Stream every matching usage record without holding them all in memory"""
+    return Storage.usages.iterate(query)
+
+async def summarize_usages(
+    query: UsageQuery, group_by: List[str], granularity: Optional[str] = None
+) -> List[UsageSummary]:
+    """Usage counts grouped by token and/or endpoint, optionally per hour or day bucket"""
+    return await Storage.usages.summarize(query, group_by, granularity)
+
+async def list_usages_by_token(
+    token: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+    start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> Tuple[List[UsageInDB], Optional[str]]:
+    return await list_usages(build_usage_query(token=token, start=start, end=end), limit, cursor)
+
+async def list_usages_by_endpoint(
+    endpoint: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+    start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> Tuple[List[UsageInDB], Optional[str]]:
+    return await list_usages(build_usage_query(endpoint=endpoint, start=start, end=end), limit, cursor)
@@ -0,0 +1,37 @@
+from app.db.mongodb import MongoUsageRepository
+from app.db.repositories import ALL_ENDPOINTS, UsageQuery, bucket_start, count_buckets
+from app.db.storage import Storage
+from app.schemas.usage import UsageInDB, UsageRollup, UsageSummary
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+def get_usage_rollups_collection():
+    """The MongoDB usage_rollups collection, when usage is stored in MongoDB"""
+    return MongoUsageRepository.rollups()
+
+async def apply_usages(usages: Iterable[UsageInDB]) -> None:
+    """Add already written usage records to their rollup counters.
+
+    A whole batch collapses to one increment per counter.
+    """
+    counts = count_buckets(usages)
+    if counts:
+        await Storage.usages.add_to_rollups(counts)
+
+async def get_usage_count(
+    token: str,
+    endpoint: str = ALL_ENDPOINTS,
+    granularity: str = "day",
+    at: Optional[datetime] = None
+) -> UsageRollup:
+    """Calls made by a token in the bucket containing `at` (now by default), from one counter"""
+    bucket = bucket_start(at or datetime.utcnow(), granularity)
+    count = await Storage.usages.rollup_count(token, endpoint, granularity, bucket)
+    return UsageRollup(token=token, endpoint=endpoint, granularity=granularity, bucket=bucket, count=count)
+
+async def summarize_rollups(
+    query: UsageQuery, group_by: List[str], granularity: Optional[str] = None
+) -> List[UsageSummary]:
+    """Call counts grouped by token and/or endpoint, optionally per hour or day bucket,
+    from the rollup counters rather than the raw records (which expire)"""
+    return await Storage.usages.summarize_rollups(query, group_by, granularity)
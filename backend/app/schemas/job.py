@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Literal, Optional
+from app.schemas.moderation import ModerationResult
+
+JobStatus = Literal["queued", "processing", "done", "failed"]
+
+class JobResponse(BaseModel):
+    id: str
+    status: JobStatus
+    filename: str
+    attempts: int = Field(0, description="Times a worker has picked the job up")
+    result: Optional[ModerationResult] = Field(None, description="Moderation result, once the job is done")
+    error: Optional[str] = None
+    webhookDelivered: Optional[bool] = Field(None, description="Whether the token's webhook accepted the result")
+    createdAt: datetime
+    updatedAt: datetime
+
+class JobInDB(JobResponse):
+    token: str
+    policy: Optional[str] = None
+    webhookUrl: Optional[str] = None
+    includeRaw: bool = False
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+
+# Extras a client can ask for with `?include=`
+ModerationInclude = Literal["raw"]
+
+class ModerationDetails(BaseModel):
+    policy: Optional[str] = Field(None, description="Policy the verdict was reached under")
+    violations: List[str] = Field([], description="Categories over their threshold, in policy order")
+    scores: Optional[Dict[str, float]] = Field(None, description="Combined score of each policy category")
+    margins: Optional[Dict[str, float]] = Field(None, description="Each category's score minus its threshold")
+    prefilter_score: Optional[float] = Field(None, description="Local pre-filter score, when it settled the verdict")
+    error: Optional[str] = None
+    content_analysis: Optional[dict] = Field(None, description="Raw upstream response, only with ?include=raw")
+
+class ModerationResult(BaseModel):
+    is_safe: bool
+    message: str
+    details: ModerationDetails
@@ -1,12 +1,25 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, HttpUrl
 from datetime import datetime
 from typing import Optional
 
-class TokenBase(BaseModel):
+class TokenLimits(BaseModel):
+    rateLimit: Optional[float] = Field(None, gt=0, description="Sustained requests per second (unset: server default)")
+    burst: Optional[int] = Field(None, ge=1, description="Requests allowed at once above the sustained rate")
+    dailyQuota: Optional[int] = Field(None, ge=1, description="Requests allowed per UTC day (unset: server default)")
+
+class TokenPolicy(BaseModel):
+    policy: Optional[str] = Field(None, description="Moderation policy applied to this token's images (unset: default)")
+
+class TokenWebhook(BaseModel):
+    webhookUrl: Optional[HttpUrl] = Field(None, description="URL that finished async moderation jobs are POSTed to")
+
+class TokenBase(TokenLimits, TokenPolicy, TokenWebhook):
     token: str = Field(..., description="The bearer token string")
     isAdmin: bool = Field(..., description="Is this token an admin token?")
 
-class TokenCreate(BaseModel):
+class TokenCreate(TokenPolicy):
+    # Creating tokens needs no authentication, so limits and webhooks are only
+    # set by admins through PUT /auth/tokens/{token}/limits and /webhook
     isAdmin: bool = Field(..., description="Is this token an admin token?")
 
 class TokenResponse(TokenBase):
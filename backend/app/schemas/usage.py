@@ -11,4 +11,17 @@ class UsageCreate(UsageBase):
 
 class UsageInDB(UsageBase):
     timestamp: datetime
-    _id: Optional[str] = None 
\ No newline at end of file
+    _id: Optional[str] = None
+
+class UsageSummary(BaseModel):
+    token: Optional[str] = None
+    endpoint: Optional[str] = None
+    bucket: Optional[datetime] = Field(None, description="Start of the hour/day bucket (UTC)")
+    count: int
+
+class UsageRollup(BaseModel):
+    token: str
+    endpoint: str = Field(..., description="The endpoint, or '*' for all endpoints")
+    granularity: str
+    bucket: datetime = Field(..., description="Start of the minute/hour/day bucket (UTC)")
+    count: int
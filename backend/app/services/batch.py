@@ -0,0 +1,71 @@
+import asyncio
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.core.metrics import stage
+from app.services.moderation import analyze_results, find_result
+from app.services.result_cache import content_key
+from app.services.upload import ImageUpload
+
+load_dotenv()
+
+# Images of one batch moderated at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+async def moderate_batch(
+    uploads: List[ImageUpload], use_cache: bool = True, policy: Optional[str] = None, include_raw: bool = False
+) -> AsyncIterator[dict]:
+    """Moderate a batch of images, yielding one result per image as soon as it is ready.
+
+    Identical images inside the batch are only moderated once. Results come back
+    in completion order and carry the `index` of the image in the request.
+    """
+    groups: Dict[str, List[int]] = {}
+    for index, upload in enumerate(uploads):
+        groups.setdefault(content_key(upload.content), []).append(index)
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def look_up(indexes: List[int]):
+        upload = uploads[indexes[0]]
+        async with semaphore:
+            try:
+                return indexes, await find_result(upload.content, upload.filename, use_cache, policy)
+            except HTTPException as e:
+                return indexes, e
+
+    pending = {asyncio.create_task(look_up(indexes)) for indexes in groups.values()}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            settled, found = [], []
+            for task in done:
+                indexes, outcome = task.result()
+                if isinstance(outcome, HTTPException):
+                    settled.append((indexes, outcome))
+                elif outcome[1] is not None:
+                    settled.append((indexes, outcome[1]))
+                else:
+                    found.append((indexes, outcome[0]))
+            if found:
+                # Lookups that finished together (e.g. cache hits) share one policy evaluation
+                with stage("verdict"):
+                    verdicts = analyze_results([result for _, result in found], policy, include_raw)
+                settled += [(indexes, verdict) for (indexes, _), verdict in zip(found, verdicts)]
+
+            for indexes, outcome in settled:
+                for index in indexes:
+                    item = {"index": index, "filename": uploads[index].filename}
+                    if isinstance(outcome, HTTPException):
+                        item["error"] = {"status_code": outcome.status_code, "detail": outcome.detail}
+                    else:
+                        item["result"] = outcome
+                    yield item
+    finally:
+        # The client may disconnect mid-stream, don't leave upstream calls behind
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,105 @@
+import math
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+
+
+class UpstreamUnavailable(HTTPException):
+    """The moderation upstream can't be reached right now; try again after `retry_after` seconds"""
+
+    def __init__(self, detail: str = "Moderation service temporarily unavailable", retry_after: float = 1.0):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated upstream failures.
+
+    closed: calls go through; `failure_threshold` consecutive failures open it.
+    open: calls fail immediately with CircuitOpenError for `reset_timeout` seconds.
+    half_open: up to `half_open_max_calls` probe calls go through; a success
+    closes the circuit, a failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now"""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and self.probes < self.half_open_max_calls:
+            self.probes += 1
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f"{self.name} is unavailable, not retrying yet", self.retry_after() or 1.0)
+
+    def record(self, success: Optional[bool]) -> None:
+        """Outcome of a call allowed by before_call; None when it ended without a verdict (e.g. cancelled)"""
+        if self.state == "half_open" and self.probes:
+            self.probes -= 1
+        if success is None:
+            return
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+            # Failed probes restart the wait
+            self.opened_at = self.clock()
+
+    def reset(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probes = 0
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1),
+        }
@@ -0,0 +1,145 @@
+import asyncio
+import os
+from typing import List
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.models.job import claim_job, release_job, finish_job, get_job, set_webhook_delivered
+from app.schemas.job import JobResponse
+from app.services.circuit_breaker import CircuitOpenError, UpstreamUnavailable
+from app.services.moderation import moderate_image
+from app.services.providers import ProviderRouter
+from app.services.webhooks import WebhookSender
+
+load_dotenv()
+
+# When SightEngine is down, /moderate queues the image and answers 202 with a job id
+# instead of failing; a job worker moderates it once SightEngine is back
+DEGRADED_MODE = os.getenv("DEGRADED_MODE", "false").lower() == "true"
+
+# Images are stored inside the job document, which MongoDB caps at 16 MB
+JOB_MAX_BYTES = int(os.getenv("JOB_MAX_BYTES", str(15 * 1024 * 1024)))
+
+# Queued jobs are moderated by `python -m app.worker`. With JOB_WORKERS_EMBEDDED=true
+# each API process runs workers too, which poll MongoDB even when nothing is queued
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_WORKERS_EMBEDDED = os.getenv("JOB_WORKERS_EMBEDDED", "false").lower() == "true"
+
+# How long a claimed job is hidden from other workers; a crashed worker's job is
+# picked up again once this runs out
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+# Failed attempts are retried with exponential backoff until JOB_MAX_ATTEMPTS
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+
+def can_queue(content: bytes) -> bool:
+    return DEGRADED_MODE and len(content) <= JOB_MAX_BYTES
+
+
+def retry_delay(attempts: int) -> float:
+    return min(JOB_RETRY_MAX_DELAY, JOB_RETRY_DELAY * (2 ** max(attempts - 1, 0)))
+
+
+class JobWorker:
+    """Pool of asyncio workers moderating queued jobs while SightEngine accepts calls"""
+    tasks: List[asyncio.Task] = []
+    processed: int = 0
+    failed: int = 0
+    retried: int = 0
+    deferred: int = 0
+
+    @classmethod
+    async def start(cls, workers: int = JOB_WORKERS):
+        if not cls.tasks:
+            cls.tasks = [asyncio.create_task(cls._run()) for _ in range(workers)]
+
+    @classmethod
+    async def close(cls):
+        for task in cls.tasks:
+            task.cancel()
+        await asyncio.gather(*cls.tasks, return_exceptions=True)
+        cls.tasks = []
+
+    @classmethod
+    async def process_next(cls) -> bool:
+        """Claim and moderate one job; False when none was runnable"""
+        job = await claim_job(JOB_LEASE_SECONDS)
+        if job is None:
+            return False
+        job_id, lease_id = job["_id"], job["leaseId"]
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            # Claimed and abandoned too often, e.g. it keeps crashing its worker
+            await cls._finish(job, error=f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+            return True
+        try:
+            result = await moderate_image(
+                job["content"], job["filename"], policy=job.get("policy"), include_raw=job.get("includeRaw", False)
+            )
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back now rather than after the lease runs out
+            await release_job(job_id, lease_id, 0, count_attempt=False)
+            raise
+        except CircuitOpenError as e:
+            # SightEngine is known to be down; waiting for it isn't the job's fault
+            cls.deferred += 1
+            await release_job(job_id, lease_id, max(e.retry_after, JOB_RETRY_DELAY), count_attempt=False)
+        except HTTPException as e:
+            transient = isinstance(e, UpstreamUnavailable) or e.status_code >= 500
+            if transient and job["attempts"] < JOB_MAX_ATTEMPTS:
+                cls.retried += 1
+                await release_job(job_id, lease_id, retry_delay(job["attempts"]))
+            else:
+                await cls._finish(job, error=str(e.detail))
+        else:
+            await cls._finish(job, result=result)
+        return True
+
+    @classmethod
+    async def _finish(cls, job: dict, result: dict = None, error: str = None) -> None:
+        if not await finish_job(job["_id"], job["leaseId"], result=result, error=error):
+            # Our lease ran out and another worker owns the job now
+            return
+        if error:
+            cls.failed += 1
+        else:
+            cls.processed += 1
+        if job.get("webhookUrl"):
+            finished = await get_job(job["_id"])
+            payload = JobResponse(**finished.model_dump()).model_dump(mode="json", exclude_none=True)
+            delivered = await WebhookSender.send(job["webhookUrl"], payload)
+            await set_webhook_delivered(job["_id"], delivered)
+
+    @classmethod
+    async def _run(cls):
+        while True:
+            # Every upstream endpoint's circuit is open: wait for the first to recover
+            retry_after = ProviderRouter.retry_after()
+            if retry_after:
+                await asyncio.sleep(max(retry_after, JOB_POLL_INTERVAL))
+                continue
+            try:
+                busy = await cls.process_next()
+            except Exception as e:
+                # A bad job or an unexpected error must not take the worker down with it
+                print(f"Job worker error: {e!r}")
+                busy = False
+            if not busy:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "degraded_mode": DEGRADED_MODE,
+            "workers": len(cls.tasks),
+            "processed": cls.processed,
+            "failed": cls.failed,
+            "retried": cls.retried,
+            "deferred": cls.deferred,
+            "webhooks_delivered": WebhookSender.delivered,
+            "webhooks_failed": WebhookSender.failed,
+        }
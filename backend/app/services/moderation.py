@@ -1,143 +1,198 @@
-from fastapi import UploadFile, HTTPException
-import magic
-import requests
-import json
-import os
-from typing import Dict, List, Tuple
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# SightEngine API credentials
-API_USER = os.getenv("SIGHTENGINE_API_USER", "86502181")
-API_SECRET = os.getenv("SIGHTENGINE_API_SECRET", "DFqvSFjWzDx3gGcBUaYCCf8KxEh3JyLt")
-
-# Define content categories and their thresholds
-CONTENT_CATEGORIES = {
-    'nudity': 0.5,     # Nudity detection
-    'violence': 0.5,   # Violence
-    'weapon': 0.5,     # Weapons
-    'alcohol': 0.5,    # Alcohol 
-    'drugs': 0.5,      # Recreational drugs
-    'offensive': 0.5,  # Offensive content (nazi, etc.)
-    'gore': 0.5,       # Gore content
-    'tobacco': 0.5,    # Tobacco
-    'self-harm': 0.5,  # Self-harm content
-}
-
-async def moderate_image(file: UploadFile) -> dict:
+from fastapi import HTTPException
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.metrics import stage, COALESCED_REQUESTS
+from app.services.providers import ProviderRouter, is_complete
+from app.services.result_cache import ModerationCache, content_key
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.policy import CompiledPolicy, PolicyEngine, UnknownPolicy, DEFAULT_POLICY_NAME
+from app.services.prefilter import Prefilter
+from app.services.preprocess import prepare_for_upstream, merge_results
+from app.services.sniff import TypeSniffer
+import asyncio
+
+def invalid_image_result() -> dict:
+    return {
+        "is_safe": False,
+        "message": "File is not a valid image",
+        "details": {"error": "Invalid file type"}
+    }
+
+class SingleFlight:
+    """Shares one in-flight lookup between concurrent requests for the same image.
+
+    The work runs in its own task and every caller awaits it through a shield,
+    so a client disconnecting cancels only its own wait, and an error reaches
+    every caller.
+    """
+    flights: Dict[tuple, asyncio.Task] = {}
+    started: int = 0
+    coalesced: int = 0
+
+    @classmethod
+    async def do(cls, key: tuple, work: Callable[[], Awaitable]):
+        task = cls.flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            cls.flights[key] = task
+            task.add_done_callback(lambda done: cls._landed(key, done))
+            cls.started += 1
+        else:
+            cls.coalesced += 1
+            COALESCED_REQUESTS.inc()
+        return await asyncio.shield(task)
+
+    @classmethod
+    def _landed(cls, key: tuple, task: asyncio.Task) -> None:
+        if cls.flights.get(key) is task:
+            del cls.flights[key]
+        # Mark the error as seen even if every caller stopped waiting
+        if not task.cancelled():
+            task.exception()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {"in_flight": len(cls.flights), "started": cls.started, "coalesced": cls.coalesced}
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.flights.clear()
+        cls.started = 0
+        cls.coalesced = 0
+
+def failed_result(sightengine_result: dict) -> dict:
+    return {
+        "is_safe": False,
+        "message": "Error analyzing image",
+        "details": {"error": sightengine_result.get('error', {}).get('message', 'Unknown error')}
+    }
+
+def verdict_result(
+    sightengine_result: dict, compiled: CompiledPolicy, verdict: Tuple[list, dict, dict], include_raw: bool
+) -> dict:
+    violations, scores, margins = verdict
+
+    # Determine if image is safe
+    is_safe = len(violations) == 0
+
+    # Prepare detailed response
+    response = {
+        "is_safe": is_safe,
+        "message": "Image is safe" if is_safe else "Image contains inappropriate content",
+        "details": {
+            "policy": compiled.name,
+            "violations": violations,
+            "scores": scores,
+            "margins": margins,
+        }
+    }
+    if include_raw:
+        response["details"]["content_analysis"] = sightengine_result
+
+    return response
+
+def analyze_result(sightengine_result: dict, policy: Optional[str] = None, include_raw: bool = False) -> dict:
+    """Turn a raw SightEngine response into the moderation verdict under a policy.
+
+    The raw response is only attached as `content_analysis` when asked for: it
+    is most of the bytes of a result and few clients read it.
+    """
+    if sightengine_result.get('status') != 'success':
+        return failed_result(sightengine_result)
+    compiled = PolicyEngine.get(policy)
+    return verdict_result(sightengine_result, compiled, compiled.verdict(sightengine_result), include_raw)
+
+def analyze_results(
+    sightengine_results: List[dict], policy: Optional[str] = None, include_raw: bool = False
+) -> List[dict]:
+    """analyze_result for several responses, evaluating the policy over all of them at once"""
+    compiled = PolicyEngine.get(policy)
+    succeeded = [result for result in sightengine_results if result.get('status') == 'success']
+    verdicts = iter(compiled.verdicts(succeeded) if succeeded else [])
+    return [
+        verdict_result(result, compiled, next(verdicts), include_raw)
+        if result.get('status') == 'success' else failed_result(result)
+        for result in sightengine_results
+    ]
+
+async def lookup_image(
+    content: bytes, filename: str, key: str, use_cache: bool, allow_prefilter: bool, policy: CompiledPolicy
+) -> Tuple[Optional[dict], Optional[dict]]:
+    """(SightEngine result, None), or (None, pre-filter verdict) when the pre-filter settles it.
+
+    Later model stages are skipped once `policy` finds a violation; such a
+    result is only good for this request and is not cached.
+    """
+    with stage("near_duplicate"):
+        phash = await NearDuplicateIndex.hash(content)
+        sightengine_result = await NearDuplicateIndex.lookup(phash) if use_cache else None
+    if sightengine_result is None and allow_prefilter:
+        with stage("prefilter"):
+            verdict = await Prefilter.check(content)
+        if verdict is not None:
+            return None, verdict
+    if sightengine_result is None:
+        # Downscaled (or sampled animation frames) rather than the original upload
+        with stage("preprocess"):
+            frames = await prepare_for_upstream(content, filename)
+        with stage("upstream"):
+            results = await asyncio.gather(
+                *(ProviderRouter.check(frame, frame_name, policy) for frame_name, frame in frames)
+            )
+        sightengine_result = merge_results(results)
+        if not all(is_complete(result) for result in results):
+            return sightengine_result, None
+        if sightengine_result.get('status') == 'success':
+            await NearDuplicateIndex.add(phash, sightengine_result)
+    if sightengine_result.get('status') == 'success':
+        await ModerationCache.set(key, sightengine_result)
+    return sightengine_result, None
+
+async def find_result(
+    content: bytes, filename: str = "image", use_cache: bool = True, policy: Optional[str] = None
+) -> Tuple[Optional[dict], Optional[dict]]:
+    """(SightEngine result, None) to be analyzed under the policy, or (None, verdict)
+    when none is needed: invalid images and pre-filter hits"""
     try:
-        # Read the file content
-        content = await file.read()
-        
+        # Fails before any work when the policy is gone, e.g. removed by a reload
+        compiled = PolicyEngine.get(policy)
+
         # Check if the file is a valid image
-        mime = magic.Magic(mime=True)
-        file_type = mime.from_buffer(content)
-        if not file_type.startswith('image/'):
-            return {
-                "is_safe": False,
-                "message": "File is not a valid image",
-                "details": {"error": "Invalid file type"}
-            }
-
-        # Create a temporary file to send to SightEngine API
-        temp_file_path = f"/tmp/{file.filename}"
-        with open(temp_file_path, "wb") as temp_file:
-            temp_file.write(content)
-        
-        # Set up parameters for SightEngine API
-        params = {
-            'models': 'nudity-2.1,weapon,alcohol,recreational_drug,medical,offensive-2.0,gore-2.0,tobacco,violence,self-harm',
-            'api_user': API_USER,
-            'api_secret': API_SECRET
-        }
-        
-        # Send request to SightEngine API
-        files = {'media': open(temp_file_path, 'rb')}
-        response = requests.post('https://api.sightengine.com/1.0/check.json', files=files, data=params)
-        
-        # Close and remove temporary file
-        files['media'].close()
-        os.remove(temp_file_path)
-        
-        # Parse the API response
-        sightengine_result = json.loads(response.text)
-        
-        if sightengine_result.get('status') != 'success':
-            return {
-                "is_safe": False,
-                "message": "Error analyzing image",
-                "details": {"error": sightengine_result.get('error', {}).get('message', 'Unknown error')}
-            }
-        
-        # Analyze content for violations
-        violations = []
-        
-        # Check nudity violations
-        if sightengine_result.get('nudity'):
-            nudity_data = sightengine_result['nudity']
-            if (nudity_data.get('sexual_activity', 0) > CONTENT_CATEGORIES['nudity'] or
-                nudity_data.get('sexual_display', 0) > CONTENT_CATEGORIES['nudity'] or
-                nudity_data.get('erotica', 0) > CONTENT_CATEGORIES['nudity'] or
-                nudity_data.get('suggestive', 0) > CONTENT_CATEGORIES['nudity']):
-                violations.append('nudity')
-        
-        # Check weapon violations
-        if sightengine_result.get('weapon'):
-            weapon_data = sightengine_result['weapon']['classes']
-            if (weapon_data.get('firearm', 0) > CONTENT_CATEGORIES['weapon'] or
-                weapon_data.get('knife', 0) > CONTENT_CATEGORIES['weapon']):
-                violations.append('weapon')
-        
-        # Check alcohol violations
-        if sightengine_result.get('alcohol', {}).get('prob', 0) > CONTENT_CATEGORIES['alcohol']:
-            violations.append('alcohol')
-        
-        # Check drug violations
-        if sightengine_result.get('recreational_drug', {}).get('prob', 0) > CONTENT_CATEGORIES['drugs']:
-            violations.append('drugs')
-        
-        # Check offensive content violations
-        if sightengine_result.get('offensive'):
-            offensive_data = sightengine_result['offensive']
-            if (offensive_data.get('nazi', 0) > CONTENT_CATEGORIES['offensive'] or
-                offensive_data.get('supremacist', 0) > CONTENT_CATEGORIES['offensive'] or
-                offensive_data.get('terrorist', 0) > CONTENT_CATEGORIES['offensive']):
-                violations.append('offensive')
-        
-        # Check gore violations
-        if sightengine_result.get('gore', {}).get('prob', 0) > CONTENT_CATEGORIES['gore']:
-            violations.append('gore')
-        
-        # Check tobacco violations
-        if sightengine_result.get('tobacco', {}).get('prob', 0) > CONTENT_CATEGORIES['tobacco']:
-            violations.append('tobacco')
-        
-        # Check violence violations
-        if sightengine_result.get('violence', {}).get('prob', 0) > CONTENT_CATEGORIES['violence']:
-            violations.append('violence')
-        
-        # Check self-harm violations
-        if sightengine_result.get('self-harm', {}).get('prob', 0) > CONTENT_CATEGORIES['self-harm']:
-            violations.append('self-harm')
-        
-        # Determine if image is safe
-        is_safe = len(violations) == 0
-        
-        # Prepare detailed response
-        response = {
-            "is_safe": is_safe,
-            "message": "Image is safe" if is_safe else "Image contains inappropriate content",
-            "details": {
-                "violations": violations,
-                "content_analysis": sightengine_result,
-            }
-        }
-        
-        return response
-        
+        with stage("sniff"):
+            if not TypeSniffer.is_image(content):
+                return None, invalid_image_result()
+
+        # Exact duplicates first, then re-encoded near-duplicates
+        with stage("cache"):
+            key = content_key(content)
+            sightengine_result = await ModerationCache.get(key) if use_cache else None
+        if sightengine_result is not None:
+            return sightengine_result, None
+        # The pre-filter is trained on default-policy verdicts, so other
+        # policies always get the full upstream analysis
+        allow_prefilter = policy in (None, DEFAULT_POLICY_NAME)
+        # Identical uploads arriving together share one lookup; the policy is
+        # part of the key as it decides which model stages run
+        return await SingleFlight.do(
+            (key, use_cache, allow_prefilter, compiled.name),
+            lambda: lookup_image(content, filename, key, use_cache, allow_prefilter, compiled)
+        )
+
+    except HTTPException:
+        raise
+    except UnknownPolicy as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing image: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+async def moderate_image(
+    content: bytes, filename: str = "image", use_cache: bool = True, policy: Optional[str] = None,
+    include_raw: bool = False
+) -> dict:
+    sightengine_result, verdict = await find_result(content, filename, use_cache, policy)
+    if verdict is not None:
+        return verdict
+    with stage("verdict"):
+        return analyze_result(sightengine_result, policy, include_raw)
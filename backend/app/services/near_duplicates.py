@@ -0,0 +1,109 @@
+import asyncio
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+
+from app.core.cache import TTLCache
+from app.models.phash_index import create_indexes, iter_phashes, get_phash_result, store_phash_result
+from app.services.phash import MultiIndexHash, dhash
+from app.services.result_cache import CACHE_TTL, MODELS_FINGERPRINT
+
+load_dotenv()
+
+PHASH_ENABLED = os.getenv("PHASH_ENABLED", "true").lower() == "true"
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "4"))
+
+# Flat or evenly shaded images hash to (almost) all zeros or ones and would
+# match each other, so hashes with too little structure are not used
+PHASH_MIN_BITS = 8
+
+# Recently matched results, so hot near-duplicates skip the MongoDB read too.
+# Stored results expire after MODERATION_CACHE_TTL like exact cache hits, and
+# only results of the current upstream models (MODELS_FINGERPRINT) are matched.
+PHASH_RESULT_CACHE_ENTRIES = int(os.getenv("PHASH_RESULT_CACHE_ENTRIES", "10000"))
+PHASH_RESULT_CACHE_TTL = min(int(os.getenv("PHASH_RESULT_CACHE_TTL", "3600")), CACHE_TTL)
+
+
+class NearDuplicateIndex:
+    enabled: bool = PHASH_ENABLED
+    index: MultiIndexHash = MultiIndexHash(PHASH_MAX_DISTANCE)
+    results: TTLCache = TTLCache(PHASH_RESULT_CACHE_ENTRIES, PHASH_RESULT_CACHE_TTL)
+    hits: int = 0
+    misses: int = 0
+
+    @classmethod
+    async def start(cls):
+        """Load the unexpired hashes of the current models into the in-memory index"""
+        if not cls.enabled:
+            return
+        await create_indexes(CACHE_TTL)
+        cls.index = MultiIndexHash(PHASH_MAX_DISTANCE)
+        async for phash in iter_phashes(MODELS_FINGERPRINT, CACHE_TTL):
+            cls.index.add(phash)
+
+    @classmethod
+    async def hash(cls, content: bytes) -> Optional[int]:
+        """Perceptual hash of the upload, or None if disabled or undecodable"""
+        if not cls.enabled:
+            return None
+        try:
+            phash = await asyncio.to_thread(dhash, content)
+        except Exception:
+            return None
+        if not PHASH_MIN_BITS <= phash.bit_count() <= 64 - PHASH_MIN_BITS:
+            return None
+        return phash
+
+    @classmethod
+    async def lookup(cls, phash: Optional[int]) -> Optional[dict]:
+        """Return the raw upstream result of a previously seen near-duplicate"""
+        if phash is None:
+            return None
+        match = cls.index.search(phash)
+        if match is None:
+            cls.misses += 1
+            return None
+        matched, _ = match
+        result = cls.results.get(matched)
+        if result is None:
+            try:
+                result = await get_phash_result(matched, MODELS_FINGERPRINT, CACHE_TTL)
+            except PyMongoError:
+                cls.misses += 1
+                return None
+            if result is None:
+                # Expired since it was indexed
+                cls.index.remove(matched)
+                cls.misses += 1
+                return None
+            cls.results.set(matched, result)
+        cls.hits += 1
+        return result
+
+    @classmethod
+    async def add(cls, phash: Optional[int], result: dict) -> None:
+        if phash is None:
+            return
+        try:
+            await store_phash_result(phash, MODELS_FINGERPRINT, result)
+        except PyMongoError:
+            return
+        cls.index.add(phash)
+        cls.results.set(phash, result)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.index = MultiIndexHash(PHASH_MAX_DISTANCE)
+        cls.results.clear()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "enabled": cls.enabled,
+            "max_distance": PHASH_MAX_DISTANCE,
+            "size": len(cls.index),
+            "hits": cls.hits,
+            "misses": cls.misses,
+        }
@@ -0,0 +1,76 @@
+import io
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+
+
+def dhash(content: bytes, size: int = 8) -> int:
+    """64-bit difference hash of an image.
+
+    Robust to resizing, recompression and metadata stripping. CPU bound, so call
+    it off the event loop.
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        # Let the JPEG decoder downscale in the DCT domain, it is much cheaper
+        image.draft("L", (size * 8, size * 8))
+        small = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR, reducing_gap=4.0)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class MultiIndexHash:
+    """Hamming-distance index over 64-bit hashes using multi-index hashing.
+
+    The hash is split into `max_distance + 1` bands. By the pigeonhole principle
+    any hash within `max_distance` bits of the query matches it exactly on at
+    least one band, so a lookup only compares against the few hashes sharing a
+    band value instead of scanning the whole set.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        self._bands: List[Tuple[int, int]] = []
+        shift = 0
+        for i in range(bands):
+            width = HASH_BITS // bands + (1 if i < HASH_BITS % bands else 0)
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._bands]
+        self._hashes: Set[int] = set()
+
+    def add(self, value: int) -> None:
+        if value in self._hashes:
+            return
+        self._hashes.add(value)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table.setdefault((value >> shift) & mask, []).append(value)
+
+    def remove(self, value: int) -> None:
+        if value not in self._hashes:
+            return
+        self._hashes.discard(value)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            band = (value >> shift) & mask
+            table[band].remove(value)
+            if not table[band]:
+                del table[band]
+
+    def search(self, value: int) -> Optional[Tuple[int, int]]:
+        """Return the closest stored hash and its distance, if within range"""
+        if value in self._hashes:
+            return value, 0
+        best: Optional[Tuple[int, int]] = None
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            for candidate in table.get((value >> shift) & mask, ()):
+                distance = (candidate ^ value).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (candidate, distance)
+        return best
+
+    def __len__(self) -> int:
+        return len(self._hashes)
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# JSON file of named policies, re-read whenever it changes on disk
+MODERATION_POLICY_FILE = os.getenv("MODERATION_POLICY_FILE", "")
+POLICY_RELOAD_INTERVAL = float(os.getenv("POLICY_RELOAD_INTERVAL", "5"))
+
+DEFAULT_POLICY_NAME = "default"
+
+# Category -> SightEngine score paths and the threshold the combined score must exceed.
+# Violations are reported in this order.
+DEFAULT_POLICY = {
+    "nudity": {
+        "scores": ["nudity.sexual_activity", "nudity.sexual_display", "nudity.erotica", "nudity.suggestive"],
+        "threshold": 0.5,
+    },
+    "weapon": {"scores": ["weapon.classes.firearm", "weapon.classes.knife"], "threshold": 0.5},
+    "alcohol": {"scores": ["alcohol.prob"], "threshold": 0.5},
+    "drugs": {"scores": ["recreational_drug.prob"], "threshold": 0.5},
+    "offensive": {"scores": ["offensive.nazi", "offensive.supremacist", "offensive.terrorist"], "threshold": 0.5},
+    "gore": {"scores": ["gore.prob"], "threshold": 0.5},
+    "tobacco": {"scores": ["tobacco.prob"], "threshold": 0.5},
+    "violence": {"scores": ["violence.prob"], "threshold": 0.5},
+    "self-harm": {"scores": ["self-harm.prob"], "threshold": 0.5},
+}
+
+# How the scores of one category are combined before the threshold check
+COMBINATORS = {
+    "any": np.maximum,  # any score over the threshold
+    "all": np.minimum,  # every score over the threshold
+    "sum": np.add,      # the scores added up
+}
+_COMBINATOR_CODES = {name: code for code, name in enumerate(COMBINATORS)}
+# The same, for one response's scores in plain Python
+_SCALAR_COMBINATORS = [max, min, sum]
+
+
+def _score(response: dict, path: Tuple[str, ...]) -> float:
+    """The score at a path of a response; missing or non-numeric scores count as 0"""
+    value = response
+    try:
+        for key in path:
+            value = value[key]
+    except (KeyError, TypeError, IndexError):
+        return 0.0
+    return value if type(value) in (int, float) else 0.0
+
+
+@dataclass
+class CompiledPolicy:
+    """A policy flattened into arrays: one column per score path, grouped by category"""
+    name: str
+    categories: List[str]
+    paths: List[Tuple[str, ...]]
+    starts: np.ndarray      # first column of each category
+    thresholds: np.ndarray  # per category
+    combine: np.ndarray     # per category, index into COMBINATORS
+
+    def __post_init__(self):
+        # (ufunc, categories it applies to) for the combinators this policy uses;
+        # None when one combinator covers every category, the common case
+        used = [(code, ufunc) for code, ufunc in enumerate(COMBINATORS.values()) if (self.combine == code).any()]
+        self.reducers = [
+            (ufunc, None if len(used) == 1 else self.combine == code) for code, ufunc in used
+        ]
+        # Per category (name, score paths, threshold, combinator) for single responses,
+        # where numpy's per-call overhead outweighs the work
+        ends = self.starts.tolist()[1:] + [len(self.paths)]
+        self.rules = [
+            (category, self.paths[start:end], threshold, _SCALAR_COMBINATORS[code])
+            for category, start, end, threshold, code in zip(
+                self.categories, self.starts.tolist(), ends, self.thresholds.tolist(), self.combine.tolist()
+            )
+        ]
+
+    def scores(self, responses: List[dict]) -> np.ndarray:
+        """(responses x score paths) matrix of raw scores"""
+        return np.array(
+            [[_score(response, path) for path in self.paths] for response in responses], dtype=np.float64
+        ).reshape(len(responses), len(self.paths))
+
+    def combined(self, responses: List[dict]) -> np.ndarray:
+        """(responses x categories) matrix of each category's combined score"""
+        scores = self.scores(responses)
+        combined = np.empty((len(responses), len(self.categories)))
+        for ufunc, columns in self.reducers:
+            if columns is None:
+                combined = ufunc.reduceat(scores, self.starts, axis=1)
+            else:
+                combined[:, columns] = ufunc.reduceat(scores, self.starts, axis=1)[:, columns]
+        return combined
+
+    def evaluate(self, responses: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Violation flags and margins (combined score minus threshold), both (responses x categories)"""
+        combined = self.combined(responses)
+        return combined > self.thresholds, combined - self.thresholds
+
+    def violations(self, response: dict) -> List[str]:
+        """Categories one response violates"""
+        return [
+            category for category, paths, threshold, combine in self.rules
+            if combine([_score(response, path) for path in paths]) > threshold
+        ]
+
+    def verdict(self, response: dict) -> Tuple[List[str], Dict[str, float], Dict[str, float]]:
+        """Violations, combined score per category and margin per category of one response.
+
+        Rounded like ndarray.round(4), so it agrees with verdicts().
+        """
+        violations, scores, margins = [], {}, {}
+        for category, paths, threshold, combine in self.rules:
+            score = combine([_score(response, path) for path in paths])
+            if score > threshold:
+                violations.append(category)
+            scores[category] = round(score * 10000) / 10000
+            margins[category] = round((score - threshold) * 10000) / 10000
+        return violations, scores, margins
+
+    def verdicts(self, responses: List[dict]) -> List[Tuple[List[str], Dict[str, float], Dict[str, float]]]:
+        """verdict() of each response, from one vectorized pass over all of them"""
+        combined = self.combined(responses)
+        violations = [[] for _ in responses]
+        for row, column in zip(*np.nonzero(combined > self.thresholds)):
+            violations[row].append(self.categories[column])
+        scores = combined.round(4).tolist()
+        margins = (combined - self.thresholds).round(4).tolist()
+        return [
+            (found, dict(zip(self.categories, row_scores)), dict(zip(self.categories, row_margins)))
+            for found, row_scores, row_margins in zip(violations, scores, margins)
+        ]
+
+
+def compile_policy(name: str, definition: dict) -> CompiledPolicy:
+    """Validate a policy definition and flatten it; raises ValueError on bad definitions"""
+    if not isinstance(definition, dict) or not definition:
+        raise ValueError(f"Policy '{name}' must map categories to rules")
+    categories, paths, starts, thresholds, combine = [], [], [], [], []
+    for category, rule in definition.items():
+        scores = rule.get("scores") if isinstance(rule, dict) else None
+        if not scores or not all(isinstance(path, str) and path for path in scores):
+            raise ValueError(f"Policy '{name}', category '{category}': 'scores' must be a list of score paths")
+        threshold = rule.get("threshold")
+        # json.load accepts Infinity and NaN, which no score can be compared against
+        if not isinstance(threshold, (int, float)) or isinstance(threshold, bool) or not math.isfinite(threshold):
+            raise ValueError(f"Policy '{name}', category '{category}': 'threshold' must be a finite number")
+        combinator = rule.get("combine", "any")
+        if combinator not in COMBINATORS:
+            raise ValueError(f"Policy '{name}', category '{category}': 'combine' must be one of {list(COMBINATORS)}")
+        categories.append(category)
+        starts.append(len(paths))
+        paths.extend(tuple(path.split(".")) for path in scores)
+        thresholds.append(float(threshold))
+        combine.append(_COMBINATOR_CODES[combinator])
+    return CompiledPolicy(
+        name=name,
+        categories=categories,
+        paths=paths,
+        starts=np.array(starts, dtype=np.intp),
+        thresholds=np.array(thresholds, dtype=np.float64),
+        combine=np.array(combine, dtype=np.intp),
+    )
+
+
+def load_policies(path: str) -> Dict[str, CompiledPolicy]:
+    """Compile every policy of a policy file, on top of the built-in default"""
+    with open(path) as f:
+        document = json.load(f)
+    policies = document.get("policies") if isinstance(document, dict) else None
+    if not isinstance(policies, dict):
+        raise ValueError("Policy file must be a JSON object with a 'policies' mapping")
+    definitions = {DEFAULT_POLICY_NAME: DEFAULT_POLICY, **policies}
+    return {name: compile_policy(name, definition) for name, definition in definitions.items()}
+
+
+class UnknownPolicy(ValueError):
+    pass
+
+
+class PolicyEngine:
+    policies: Dict[str, CompiledPolicy] = {DEFAULT_POLICY_NAME: compile_policy(DEFAULT_POLICY_NAME, DEFAULT_POLICY)}
+    mtime: Optional[float] = None
+    reload_task: Optional[asyncio.Task] = None
+    # Unknown policy names already logged, so a token left on a removed policy doesn't flood the log
+    reported: Set[str] = set()
+
+    @classmethod
+    async def start(cls):
+        if not MODERATION_POLICY_FILE:
+            return
+        # A broken policy file at startup is a deployment error; fail loudly
+        cls.reload()
+        cls.reload_task = asyncio.create_task(cls._watch())
+
+    @classmethod
+    async def close(cls):
+        if cls.reload_task:
+            cls.reload_task.cancel()
+            cls.reload_task = None
+
+    @classmethod
+    def reload(cls) -> bool:
+        """Re-read the policy file if it changed; returns whether policies were replaced"""
+        if not MODERATION_POLICY_FILE:
+            return False
+        mtime = os.path.getmtime(MODERATION_POLICY_FILE)
+        if mtime == cls.mtime:
+            return False
+        # Compile everything before swapping so requests never see a half-loaded set
+        cls.policies = load_policies(MODERATION_POLICY_FILE)
+        cls.mtime = mtime
+        cls.reported = set()
+        return True
+
+    @classmethod
+    async def _watch(cls):
+        while True:
+            await asyncio.sleep(POLICY_RELOAD_INTERVAL)
+            try:
+                if cls.reload():
+                    print(f"Reloaded moderation policies: {sorted(cls.policies)}")
+            except (OSError, ValueError) as e:
+                # Keep serving the last good policies
+                print(f"Ignoring invalid policy file {MODERATION_POLICY_FILE}: {e}")
+
+    @classmethod
+    def get(cls, name: Optional[str] = None) -> CompiledPolicy:
+        """The named policy (default: DEFAULT_POLICY_NAME).
+
+        Raises UnknownPolicy rather than fall back to the default, which may be
+        laxer than the policy that was asked for.
+        """
+        policy = cls.policies.get(name or DEFAULT_POLICY_NAME)
+        if policy is None:
+            if name not in cls.reported:
+                cls.reported.add(name)
+                logger.warning("Rejecting requests for unknown moderation policy '%s'", name)
+            raise UnknownPolicy(f"Unknown policy: {name}")
+        return policy
+
+    @classmethod
+    def describe(cls) -> Dict[str, dict]:
+        return {
+            name: dict(zip(policy.categories, policy.thresholds.tolist()))
+            for name, policy in cls.policies.items()
+        }
@@ -0,0 +1,171 @@
+import asyncio
+import io
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image
+
+load_dotenv()
+
+# Optional local stage that settles obvious images without calling SightEngine
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "false").lower() == "true"
+PREFILTER_WORKERS = int(os.getenv("PREFILTER_WORKERS", "2"))
+
+# Logistic regression weights (.npz with weights, bias, mean, std), see
+# benchmarks/eval_prefilter.py. Without a model only trivial images are settled.
+PREFILTER_MODEL = os.getenv("PREFILTER_MODEL", "")
+
+# Scores below/above these are decided locally; the band in between escalates
+PREFILTER_SAFE_BELOW = float(os.getenv("PREFILTER_SAFE_BELOW", "0.05"))
+PREFILTER_UNSAFE_ABOVE = float(os.getenv("PREFILTER_UNSAFE_ABOVE", "0.98"))
+
+# Images this small, or this close to a single color, are safe whatever the model says
+PREFILTER_TINY_SIDE = int(os.getenv("PREFILTER_TINY_SIDE", "32"))
+PREFILTER_UNIFORM_STD = float(os.getenv("PREFILTER_UNIFORM_STD", "2.0"))
+
+FEATURE_NAMES = (
+    "log_pixels", "aspect", "luma_std", "saturation_mean", "colorfulness",
+    "edge_density", "skin_fraction", "red_fraction",
+)
+
+THUMBNAIL_SIZE = (64, 64)
+
+# Loaded once per worker process by _init_worker
+_model: Optional[dict] = None
+
+
+def load_model(path: str) -> dict:
+    with np.load(path) as data:
+        model = {key: data[key] for key in ("weights", "bias", "mean", "std")}
+    if model["weights"].shape != (len(FEATURE_NAMES),):
+        raise ValueError(f"Pre-filter model {path} expects {model['weights'].shape} features, not {len(FEATURE_NAMES)}")
+    return model
+
+
+def image_features(image: Image.Image) -> np.ndarray:
+    """Cheap global statistics of an image, in FEATURE_NAMES order"""
+    width, height = image.size
+    image.draft("RGB", THUMBNAIL_SIZE)
+    pixels = np.asarray(image.convert("RGB").resize(THUMBNAIL_SIZE, Image.BILINEAR), dtype=np.float64)
+    r, g, b = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    luma = 0.299 * r + 0.587 * g + 0.114 * b
+    high, low = pixels.max(axis=2), pixels.min(axis=2)
+    saturation = np.where(high > 0, (high - low) / np.maximum(high, 1), 0)
+    rg, yb = r - g, 0.5 * (r + g) - b
+    colorfulness = math.hypot(rg.std(), yb.std()) + 0.3 * math.hypot(rg.mean(), yb.mean())
+    edges = np.abs(np.diff(luma, axis=0)).mean() + np.abs(np.diff(luma, axis=1)).mean()
+    skin = (r > 95) & (g > 40) & (b > 20) & (r > g) & (r > b) & (np.abs(r - g) > 15)
+    red = (r > 150) & (g < 80) & (b < 80)
+    return np.array([
+        math.log(width * height), width / height, luma.std() / 255, saturation.mean(),
+        colorfulness / 255, edges / 255, skin.mean(), red.mean(),
+    ])
+
+
+def score_image(content: bytes, model: Optional[dict] = None) -> Optional[float]:
+    """Probability that an image is unsafe, or None when there is nothing to go on"""
+    with Image.open(io.BytesIO(content)) as image:
+        if max(image.size) < PREFILTER_TINY_SIDE:
+            return 0.0
+        features = image_features(image)
+    luma_std, saturation = features[FEATURE_NAMES.index("luma_std")], features[FEATURE_NAMES.index("saturation_mean")]
+    if luma_std * 255 < PREFILTER_UNIFORM_STD and saturation < 0.05:
+        # Blank or solid-color image
+        return 0.0
+    if model is None:
+        return None
+    z = float((features - model["mean"]) / model["std"] @ model["weights"] + model["bias"])
+    return 1 / (1 + math.exp(-z))
+
+
+def _init_worker(model_path: str) -> None:
+    global _model
+    _model = load_model(model_path) if model_path else None
+
+
+def _score_in_worker(content: bytes) -> Optional[float]:
+    return score_image(content, _model)
+
+
+class Prefilter:
+    pool: Optional[ProcessPoolExecutor] = None
+    checked: int = 0
+    safe: int = 0
+    unsafe: int = 0
+    escalated: int = 0
+    errors: int = 0
+
+    @classmethod
+    async def start(cls):
+        if not PREFILTER_ENABLED:
+            return
+        if PREFILTER_MODEL:
+            # Fail at startup rather than in every worker
+            load_model(PREFILTER_MODEL)
+        # Spawned, not forked: the parent runs threads (motor, to_thread) that fork can't copy safely
+        cls.pool = ProcessPoolExecutor(
+            max_workers=PREFILTER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(PREFILTER_MODEL,),
+        )
+
+    @classmethod
+    async def close(cls):
+        if cls.pool:
+            cls.pool.shutdown(cancel_futures=True)
+            cls.pool = None
+
+    @classmethod
+    async def check(cls, content: bytes) -> Optional[dict]:
+        """A local verdict for confident cases, or None to escalate to SightEngine"""
+        if cls.pool is None:
+            return None
+        cls.checked += 1
+        try:
+            score = await asyncio.get_running_loop().run_in_executor(cls.pool, _score_in_worker, content)
+        except Exception as e:
+            # Undecodable images and broken workers escalate instead of failing the request
+            cls.errors += 1
+            print(f"Pre-filter failed, escalating: {e}")
+            score = None
+        if score is not None and score < PREFILTER_SAFE_BELOW:
+            cls.safe += 1
+            return prefilter_verdict(True, score)
+        if score is not None and score > PREFILTER_UNSAFE_ABOVE:
+            cls.unsafe += 1
+            return prefilter_verdict(False, score)
+        cls.escalated += 1
+        return None
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.checked = cls.safe = cls.unsafe = cls.escalated = cls.errors = 0
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "enabled": cls.pool is not None,
+            "checked": cls.checked,
+            "safe": cls.safe,
+            "unsafe": cls.unsafe,
+            "escalated": cls.escalated,
+            "errors": cls.errors,
+            "escalation_rate": round(cls.escalated / cls.checked, 4) if cls.checked else None,
+        }
+
+
+def prefilter_verdict(is_safe: bool, score: float) -> dict:
+    return {
+        "is_safe": is_safe,
+        "message": "Image is safe" if is_safe else "Image contains inappropriate content",
+        "details": {
+            "violations": [] if is_safe else ["prefilter"],
+            "prefilter_score": round(score, 4),
+        }
+    }
@@ -0,0 +1,105 @@
+import asyncio
+import copy
+import io
+import os
+from typing import List, Tuple
+
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+load_dotenv()
+
+# Images are shrunk to this longest edge and re-encoded before the upstream call;
+# SightEngine's models don't look at more detail than that
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "true").lower() == "true"
+PREPROCESS_MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", "1024"))
+PREPROCESS_FORMAT = os.getenv("PREPROCESS_FORMAT", "jpeg").lower()
+PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", "85"))
+
+# Small enough images are sent as they are rather than recompressed
+PREPROCESS_PASSTHROUGH_BYTES = int(os.getenv("PREPROCESS_PASSTHROUGH_BYTES", str(512 * 1024)))
+
+# Frames sampled (evenly spaced) from animated GIF/WebP/PNG
+ANIMATION_FRAMES = int(os.getenv("ANIMATION_FRAMES", "3"))
+
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+
+def _encode(frame: Image.Image) -> bytes:
+    frame = ImageOps.exif_transpose(frame)
+    if frame.mode in ("RGBA", "LA", "P"):
+        # Flatten transparency onto white instead of letting it turn black
+        rgba = frame.convert("RGBA")
+        frame = Image.new("RGB", rgba.size, "white")
+        frame.paste(rgba, mask=rgba.getchannel("A"))
+    elif frame.mode != "RGB":
+        frame = frame.convert("RGB")
+    frame.thumbnail((PREPROCESS_MAX_EDGE, PREPROCESS_MAX_EDGE), Image.LANCZOS, reducing_gap=3.0)
+    buffer = io.BytesIO()
+    frame.save(buffer, PREPROCESS_FORMAT, quality=PREPROCESS_QUALITY)
+    return buffer.getvalue()
+
+
+def prepare_image(content: bytes, filename: str) -> List[Tuple[str, bytes]]:
+    """(filename, bytes) of what to send upstream: one image, or sampled frames of an animation.
+
+    Blocking; run it off the event loop. Anything Pillow can't read is passed
+    through untouched and left for SightEngine to judge.
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0] or "image"
+    extension = EXTENSIONS.get(PREPROCESS_FORMAT, PREPROCESS_FORMAT)
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            frame_count = getattr(image, "n_frames", 1)
+            if frame_count > 1:
+                # Spread over the whole animation: the first and last frame are always sampled
+                samples = min(ANIMATION_FRAMES, frame_count)
+                step = (frame_count - 1) / max(samples - 1, 1)
+                indexes = sorted({round(i * step) for i in range(samples)})
+                frames = []
+                for index in indexes:
+                    image.seek(index)
+                    frames.append((f"{stem}-frame{index}.{extension}", _encode(image)))
+                return frames
+
+            if max(image.size) <= PREPROCESS_MAX_EDGE and len(content) <= PREPROCESS_PASSTHROUGH_BYTES:
+                return [(filename, content)]
+            # JPEG can decode straight at a reduced scale, which is most of the saving
+            image.draft("RGB", (PREPROCESS_MAX_EDGE, PREPROCESS_MAX_EDGE))
+            prepared = _encode(image)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return [(filename, content)]
+    if len(prepared) >= len(content):
+        return [(filename, content)]
+    return [(f"{stem}.{extension}", prepared)]
+
+
+def _merge_scores(merged: dict, other: dict) -> None:
+    for key, value in other.items():
+        current = merged.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            _merge_scores(current, value)
+        elif isinstance(current, (int, float)) and isinstance(value, (int, float)) and not isinstance(value, bool):
+            merged[key] = max(current, value)
+        elif key not in merged:
+            merged[key] = value
+
+
+def merge_results(results: List[dict]) -> dict:
+    """One response for several frames: the first failure, or every score's maximum across frames"""
+    for result in results:
+        if result.get('status') != 'success':
+            return result
+    if len(results) == 1:
+        return results[0]
+    merged = copy.deepcopy(results[0])
+    for result in results[1:]:
+        _merge_scores(merged, result)
+    merged["frames_checked"] = len(results)
+    return merged
+
+
+async def prepare_for_upstream(content: bytes, filename: str) -> List[Tuple[str, bytes]]:
+    if not PREPROCESS_ENABLED:
+        return [(filename, content)]
+    return await asyncio.to_thread(prepare_image, content, filename)
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from app.services.policy import DEFAULT_POLICY, CompiledPolicy
+from app.services.sightengine import SightEngineClient, MODELS
+
+load_dotenv()
+
+# Category (as used by moderation policies) produced by each SightEngine model.
+# Providers report their scores in SightEngine's response shape, which is what
+# policies read, so these categories are the common schema between providers.
+MODEL_CATEGORIES = {
+    "nudity-2.1": ["nudity"],
+    "weapon": ["weapon"],
+    "alcohol": ["alcohol"],
+    "recreational_drug": ["drugs"],
+    "medical": [],
+    "offensive-2.0": ["offensive"],
+    "gore-2.0": ["gore"],
+    "tobacco": ["tobacco"],
+    "violence": ["violence"],
+    "self-harm": ["self-harm"],
+}
+
+# Providers tried in order of expected latency, e.g. "sightengine,sightengine@https://eu.example/check.json"
+MODERATION_PROVIDERS = os.getenv("MODERATION_PROVIDERS", "sightengine")
+
+# Models run in stages separated by ';'. A later stage only runs when the request's
+# policy finds no violation in the earlier ones, e.g. cheap models first:
+# "nudity-2.1,weapon,alcohol;recreational_drug,medical,offensive-2.0,gore-2.0,tobacco,violence,self-harm"
+MODEL_STAGES = [
+    stage.split(",") for stage in os.getenv("MODEL_STAGES", MODELS).replace(" ", "").split(";") if stage
+]
+
+# With more than one provider, a second request goes to the next provider once the
+# first has taken longer than its recent HEDGE_PERCENTILE latency (or HEDGE_DELAY_MS)
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_DELAY_MS = float(os.getenv("HEDGE_DELAY_MS", "0"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_INITIAL_DELAY_MS = float(os.getenv("HEDGE_INITIAL_DELAY_MS", "1000"))
+HEDGE_MIN_SAMPLES = 20
+
+EWMA_ALPHA = float(os.getenv("PROVIDER_EWMA_ALPHA", "0.2"))
+# How much a provider's recent error rate counts against it when ranking
+ERROR_PENALTY = float(os.getenv("PROVIDER_ERROR_PENALTY", "10"))
+
+# The local provider calls every image safe, so it may only be configured in
+# test and load-test setups that opt in explicitly
+LOCAL_PROVIDER_ALLOWED = os.getenv("LOCAL_PROVIDER_ALLOWED", "false").lower() == "true"
+LOCAL_PROVIDER_LATENCY_MS = float(os.getenv("LOCAL_PROVIDER_LATENCY_MS", "0"))
+
+# Models each provider kind may be asked for (default: all); a stage is only
+# sent to providers that run every model in it
+SIGHTENGINE_PROVIDER_MODELS = os.getenv("SIGHTENGINE_PROVIDER_MODELS", ",".join(MODEL_CATEGORIES)).split(",")
+LOCAL_PROVIDER_MODELS = os.getenv("LOCAL_PROVIDER_MODELS", ",".join(MODEL_CATEGORIES)).split(",")
+
+
+def response_from_scores(scores: Dict[str, float], models: Sequence[str]) -> dict:
+    """A SightEngine-shaped response with each category's score at every path policies read"""
+    response = {"status": "success"}
+    for model in models:
+        for category in MODEL_CATEGORIES.get(model, []):
+            for path in DEFAULT_POLICY[category]["scores"]:
+                node = response
+                *parents, leaf = path.split(".")
+                for key in parents:
+                    node = node.setdefault(key, {})
+                node[leaf] = scores.get(category, 0.0)
+    return response
+
+
+def is_success(result) -> bool:
+    return isinstance(result, dict) and result.get("status") == "success"
+
+
+def is_complete(result: dict) -> bool:
+    """Whether every model stage ran; a result cut short by an early exit only
+    holds for the policy that cut it, so it must not be cached"""
+    checked = result.get("models_checked")
+    return checked is None or checked == [model for models in MODEL_STAGES for model in models]
+
+
+class ModerationProvider:
+    """A moderation backend answering in SightEngine's response shape"""
+    name: str = "provider"
+    models: Sequence[str] = tuple(MODEL_CATEGORIES)
+
+    def supports(self, models: Sequence[str]) -> bool:
+        return set(models) <= set(self.models)
+
+    async def check(self, content: bytes, filename: str, models: Sequence[str]) -> dict:
+        raise NotImplementedError
+
+    def retry_after(self) -> float:
+        """Seconds before this provider takes calls again; 0 while it does"""
+        return 0.0
+
+
+class SightEngineProvider(ModerationProvider):
+    """One SightEngine endpoint (default: SIGHTENGINE_API_URL), called through the shared SightEngineClient"""
+
+    def __init__(self, url: Optional[str] = None, name: Optional[str] = None,
+                 models: Sequence[str] = tuple(MODEL_CATEGORIES)):
+        self.url = url
+        self.name = name or (f"sightengine@{url}" if url else "sightengine")
+        self.models = models
+
+    async def check(self, content: bytes, filename: str, models: Sequence[str]) -> dict:
+        return await SightEngineClient.check(content, filename, models=",".join(models), url=self.url)
+
+    def retry_after(self) -> float:
+        return SightEngineClient.breaker(self.url).retry_after()
+
+
+class LocalProvider(ModerationProvider):
+    """Offline provider for tests only: fixed (by default all-zero) scores after an optional delay"""
+
+    def __init__(self, scores: Optional[Dict[str, float]] = None, latency_ms: float = LOCAL_PROVIDER_LATENCY_MS,
+                 name: str = "local", models: Sequence[str] = tuple(MODEL_CATEGORIES)):
+        self.scores = scores or {}
+        self.latency_ms = latency_ms
+        self.name = name
+        self.models = models
+
+    async def check(self, content: bytes, filename: str, models: Sequence[str]) -> dict:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return {**response_from_scores(self.scores, models), "provider": self.name}
+
+
+def build_providers(spec: str) -> List[ModerationProvider]:
+    providers = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, url = entry.partition("@")
+        if kind == "sightengine":
+            providers.append(SightEngineProvider(url or None, name=entry, models=SIGHTENGINE_PROVIDER_MODELS))
+        elif kind == "local":
+            if not LOCAL_PROVIDER_ALLOWED:
+                raise ValueError("The local moderation provider needs LOCAL_PROVIDER_ALLOWED=true (tests only)")
+            providers.append(LocalProvider(name=entry, models=LOCAL_PROVIDER_MODELS))
+        else:
+            raise ValueError(f"Unknown moderation provider: {entry}")
+    return providers
+
+
+class ProviderHealth:
+    """Recent latency and error rate of one provider"""
+
+    def __init__(self):
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.recent = deque(maxlen=200)
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.wins = 0
+        self._deadline: Optional[float] = None
+
+    def observe(self, latency_ms: float, ok: bool) -> None:
+        self.calls += 1
+        self.errors += not ok
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency_ms = latency_ms if self.latency_ms is None else (
+                self.latency_ms + EWMA_ALPHA * (latency_ms - self.latency_ms)
+            )
+            self.recent.append(latency_ms)
+        if self.calls % 16 == 0:
+            self._deadline = None
+
+    def cost(self) -> float:
+        """Ranking key: expected latency, inflated by the recent error rate"""
+        latency = self.latency_ms if self.latency_ms is not None else 0.0
+        # A provider that has only failed has no latency yet but must still rank last
+        return (latency + HEDGE_INITIAL_DELAY_MS * self.error_rate) * (1 + ERROR_PENALTY * self.error_rate)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait on this provider before hedging"""
+        if HEDGE_DELAY_MS:
+            return HEDGE_DELAY_MS / 1000
+        if len(self.recent) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY_MS / 1000
+        if self._deadline is None:
+            ordered = sorted(self.recent)
+            index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+            self._deadline = max(ordered[index], HEDGE_MIN_DELAY_MS) / 1000
+        return self._deadline
+
+    def stats(self) -> dict:
+        return {
+            "ewma_latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "ewma_error_rate": round(self.error_rate, 3),
+            "hedge_after_ms": round(self.hedge_delay() * 1000, 1),
+            "calls": self.calls,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "wins": self.wins,
+        }
+
+
+class ProviderRouter:
+    """Sends each check to the provider expected to answer first, hedging slow calls"""
+    providers: List[ModerationProvider] = build_providers(MODERATION_PROVIDERS)
+    # Keyed by provider, so endpoints never share latency or error estimates
+    health: Dict[ModerationProvider, ProviderHealth] = {}
+
+    @classmethod
+    def configure(cls, providers: List[ModerationProvider]) -> None:
+        cls.providers = providers
+        cls.health = {}
+
+    @classmethod
+    def _health(cls, provider: ModerationProvider) -> ProviderHealth:
+        health = cls.health.get(provider)
+        if health is None:
+            health = cls.health[provider] = ProviderHealth()
+        return health
+
+    @classmethod
+    def ranked(cls, models: Sequence[str]) -> List[ModerationProvider]:
+        eligible = [provider for provider in cls.providers if provider.supports(models)]
+        # Stable sort: ties (e.g. no data yet) keep the configured order
+        return sorted(eligible, key=lambda provider: cls._health(provider).cost())
+
+    @classmethod
+    async def _call(cls, provider: ModerationProvider, content: bytes, filename: str, models: Sequence[str]):
+        started = time.perf_counter()
+        try:
+            result = await provider.check(content, filename, models)
+        except asyncio.CancelledError:
+            # A hedge that lost the race, not a failure
+            raise
+        except Exception:
+            cls._health(provider).observe((time.perf_counter() - started) * 1000, False)
+            raise
+        cls._health(provider).observe((time.perf_counter() - started) * 1000, is_success(result))
+        return result
+
+    @classmethod
+    async def check_models(cls, content: bytes, filename: str, models: Sequence[str]) -> dict:
+        """One provider response for these models: the first success of the primary and its hedge"""
+        providers = cls.ranked(models)
+        if not providers:
+            raise ValueError(f"No moderation provider runs {','.join(models)}")
+        primary = providers[0]
+        if len(providers) == 1 or not HEDGE_ENABLED:
+            return await cls._call(primary, content, filename, models)
+
+        tasks = {asyncio.ensure_future(cls._call(primary, content, filename, models)): primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=cls._health(primary).hedge_delay())
+            first = next(iter(tasks))
+            if done and not first.exception() and is_success(first.result()):
+                cls._health(primary).wins += 1
+                return first.result()
+
+            # Too slow, or already failed: race the next provider
+            backup = providers[1]
+            cls._health(primary).hedges += 1
+            tasks[asyncio.ensure_future(cls._call(backup, content, filename, models))] = backup
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.exception() and is_success(task.result()):
+                        cls._health(tasks[task]).wins += 1
+                        return task.result()
+
+            # Both failed: report the primary's failure
+            if first.exception():
+                raise first.exception()
+            return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @classmethod
+    async def check(cls, content: bytes, filename: str, policy: Optional[CompiledPolicy] = None) -> dict:
+        """Run the model stages, stopping early once `policy` already finds a violation.
+
+        Without a policy every stage runs.
+        """
+        if len(MODEL_STAGES) == 1:
+            return await cls.check_models(content, filename, MODEL_STAGES[0])
+
+        combined = None
+        checked = []
+        for index, models in enumerate(MODEL_STAGES):
+            result = await cls.check_models(content, filename, models)
+            if not is_success(result):
+                return result
+            combined = result if combined is None else {**combined, **{
+                key: value for key, value in result.items() if key not in ("status", "request")
+            }}
+            checked.extend(models)
+            if index < len(MODEL_STAGES) - 1 and policy is not None and policy.violations(combined):
+                break
+        combined["models_checked"] = checked
+        return combined
+
+    @classmethod
+    def retry_after(cls) -> float:
+        """Seconds before any provider takes calls again; 0 while one does"""
+        return min((provider.retry_after() for provider in cls.providers), default=0.0)
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {provider.name: cls._health(provider).stats() for provider in cls.providers}
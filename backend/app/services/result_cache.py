@@ -0,0 +1,84 @@
+import hashlib
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+
+from app.core.cache import TTLCache
+from app.models.moderation_cache import create_indexes, get_cached_result, store_cached_result
+from app.services.providers import MODEL_STAGES
+
+load_dotenv()
+
+# In-process tier
+CACHE_ENABLED = os.getenv("MODERATION_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("MODERATION_CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL = int(os.getenv("MODERATION_CACHE_TTL", "86400"))
+
+# Optional shared tier in MongoDB, so hits work across workers
+CACHE_SHARED = os.getenv("MODERATION_CACHE_SHARED", "false").lower() == "true"
+
+# Cached payloads depend on which upstream models were requested. Only results of
+# every model stage are cached, and thresholds are not part of the key: verdicts
+# are recomputed from the raw scores on every hit.
+MODELS_SPEC = ";".join(",".join(models) for models in MODEL_STAGES)
+MODELS_FINGERPRINT = hashlib.sha256(MODELS_SPEC.encode()).hexdigest()[:12]
+
+
+def content_key(content: bytes) -> str:
+    return f"{MODELS_FINGERPRINT}:{hashlib.sha256(content).hexdigest()}"
+
+
+class ModerationCache:
+    local: TTLCache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL)
+    shared_hits: int = 0
+
+    @classmethod
+    async def start(cls):
+        if CACHE_ENABLED and CACHE_SHARED:
+            await create_indexes(CACHE_TTL)
+
+    @classmethod
+    async def get(cls, key: str) -> Optional[dict]:
+        """Return the cached raw upstream result for a content key, if any"""
+        if not CACHE_ENABLED:
+            return None
+        result = cls.local.get(key)
+        if result is not None or not CACHE_SHARED:
+            return result
+        try:
+            result = await get_cached_result(key)
+        except PyMongoError:
+            return None
+        if result is not None:
+            cls.shared_hits += 1
+            cls.local.set(key, result)
+        return result
+
+    @classmethod
+    async def set(cls, key: str, result: dict) -> None:
+        if not CACHE_ENABLED:
+            return
+        cls.local.set(key, result)
+        if CACHE_SHARED:
+            try:
+                await store_cached_result(key, result)
+            except PyMongoError:
+                pass
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.local.clear()
+
+    @classmethod
+    def stats(cls) -> dict:
+        local = cls.local.stats()
+        return {
+            "enabled": CACHE_ENABLED,
+            "shared": CACHE_SHARED,
+            "size": local["size"],
+            "local_hits": local["hits"],
+            "shared_hits": cls.shared_hits,
+            "misses": local["misses"] - cls.shared_hits,
+        }
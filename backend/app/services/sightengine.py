@@ -0,0 +1,166 @@
+import asyncio
+import os
+import random
+from typing import Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from app.core.metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_REQUEST_BYTES, UPSTREAM_RESPONSES
+from app.services.circuit_breaker import CircuitBreaker, UpstreamUnavailable
+
+load_dotenv()
+
+# SightEngine API credentials
+API_USER = os.getenv("SIGHTENGINE_API_USER", "86502181")
+API_SECRET = os.getenv("SIGHTENGINE_API_SECRET", "DFqvSFjWzDx3gGcBUaYCCf8KxEh3JyLt")
+API_URL = os.getenv("SIGHTENGINE_API_URL", "https://api.sightengine.com/1.0/check.json")
+
+# Models requested from SightEngine for every image
+MODELS = 'nudity-2.1,weapon,alcohol,recreational_drug,medical,offensive-2.0,gore-2.0,tobacco,violence,self-harm'
+
+# Connection pool and timeout settings
+CONNECT_TIMEOUT = float(os.getenv("SIGHTENGINE_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("SIGHTENGINE_READ_TIMEOUT", "30"))
+MAX_CONNECTIONS = int(os.getenv("SIGHTENGINE_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("SIGHTENGINE_MAX_KEEPALIVE", "20"))
+HTTP2 = os.getenv("SIGHTENGINE_HTTP2", "true").lower() == "true"
+
+# Maximum number of upstream calls in flight per worker and endpoint
+MAX_CONCURRENCY = int(os.getenv("SIGHTENGINE_MAX_CONCURRENCY", "50"))
+
+# Retry policy for 429/5xx and transport errors
+MAX_RETRIES = int(os.getenv("SIGHTENGINE_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("SIGHTENGINE_BACKOFF_BASE", "0.2"))
+BACKOFF_MAX = float(os.getenv("SIGHTENGINE_BACKOFF_MAX", "5"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Consecutive failed checks (after retries) that open an endpoint's circuit, and
+# how long calls to it then fail fast before a probe is let through
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("SIGHTENGINE_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("SIGHTENGINE_CIRCUIT_RESET_TIMEOUT", "30"))
+CIRCUIT_HALF_OPEN_CALLS = int(os.getenv("SIGHTENGINE_CIRCUIT_HALF_OPEN_CALLS", "1"))
+
+
+class SightEngineClient:
+    """One pooled HTTP client for every SightEngine endpoint.
+
+    Each endpoint URL has its own circuit breaker and concurrency limit, so a
+    failing or saturated endpoint doesn't hold back calls hedged to another.
+    """
+    client: httpx.AsyncClient = None
+    breakers: Dict[str, CircuitBreaker] = {}
+    semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    async def start(cls, transport: Optional[httpx.AsyncBaseTransport] = None):
+        cls.client = httpx.AsyncClient(
+            http2=HTTP2,
+            transport=transport,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+            ),
+        )
+        cls.semaphores = {}
+
+    @classmethod
+    async def close(cls):
+        if cls.client:
+            await cls.client.aclose()
+            cls.client = None
+
+    @classmethod
+    def breaker(cls, url: Optional[str] = None) -> CircuitBreaker:
+        """The circuit breaker of an endpoint (API_URL by default)"""
+        url = url or API_URL
+        breaker = cls.breakers.get(url)
+        if breaker is None:
+            breaker = cls.breakers[url] = CircuitBreaker(
+                "SightEngine" if url == API_URL else f"SightEngine at {url}",
+                failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                half_open_max_calls=CIRCUIT_HALF_OPEN_CALLS
+            )
+        return breaker
+
+    @classmethod
+    def semaphore(cls, url: str) -> asyncio.Semaphore:
+        semaphore = cls.semaphores.get(url)
+        if semaphore is None:
+            semaphore = cls.semaphores[url] = asyncio.Semaphore(MAX_CONCURRENCY)
+        return semaphore
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {url: breaker.stats() for url, breaker in cls.breakers.items()}
+
+    @classmethod
+    def backoff_delay(cls, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when present"""
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    @classmethod
+    async def check(cls, content: bytes, filename: str, models: str = MODELS, url: Optional[str] = None) -> dict:
+        """Send an image to SightEngine (API_URL unless `url` is given) and return the parsed JSON response"""
+        if cls.client is None:
+            await cls.start()
+
+        url = url or API_URL
+        breaker = cls.breaker(url)
+        data = {
+            'models': models,
+            'api_user': API_USER,
+            'api_secret': API_SECRET
+        }
+
+        # Raises CircuitOpenError while this endpoint is considered down
+        breaker.before_call()
+        healthy = None
+        UPSTREAM_REQUEST_BYTES.observe(len(content))
+        try:
+            attempt = 0
+            async with cls.semaphore(url):
+                while True:
+                    UPSTREAM_IN_FLIGHT.inc()
+                    try:
+                        response = await cls.client.post(
+                            url,
+                            files={'media': (filename, content)},
+                            data=data,
+                        )
+                    except httpx.TransportError as e:
+                        response, error = None, e
+                    finally:
+                        # Also when cancelled, e.g. a hedge that lost its race
+                        UPSTREAM_IN_FLIGHT.dec()
+
+                    if response is None:
+                        UPSTREAM_RESPONSES.labels("transport_error").inc()
+                        if attempt >= MAX_RETRIES:
+                            healthy = False
+                            raise UpstreamUnavailable("Could not reach the moderation service") from error
+                        await asyncio.sleep(cls.backoff_delay(attempt))
+                        attempt += 1
+                        continue
+
+                    UPSTREAM_RESPONSES.labels(str(response.status_code)).inc()
+                    if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+                        await asyncio.sleep(cls.backoff_delay(attempt, response.headers.get("Retry-After")))
+                        attempt += 1
+                        continue
+
+                    healthy = response.status_code not in RETRY_STATUS_CODES
+                    if not healthy:
+                        # Out of retries: an outage, whatever the body says
+                        raise UpstreamUnavailable(f"Moderation service returned HTTP {response.status_code}")
+                    return response.json()
+        finally:
+            breaker.record(healthy)
@@ -0,0 +1,66 @@
+import threading
+from typing import Optional
+
+import magic
+
+# Only the start of a file is inspected; libmagic doesn't need more for images
+SNIFF_HEADER_BYTES = 4096
+
+# ISO BMFF major/compatible brands of HEIF-family images
+AVIF_BRANDS = {b"avif", b"avis"}
+HEIC_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"hevm", b"hevs"}
+HEIF_BRANDS = {b"mif1", b"msf1"}
+
+
+def sniff_signature(header: bytes) -> Optional[str]:
+    """MIME type of common image formats from their magic bytes, None if not recognized"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp":
+        box_size = int.from_bytes(header[:4], "big")
+        brands = {header[8:12]} | {header[i:i + 4] for i in range(16, min(box_size, len(header)) - 3, 4)}
+        if brands & AVIF_BRANDS:
+            return "image/avif"
+        if brands & HEIC_BRANDS:
+            return "image/heic"
+        if brands & HEIF_BRANDS:
+            return "image/heif"
+    return None
+
+
+class TypeSniffer:
+    """File type detection from the first SNIFF_HEADER_BYTES, with one shared libmagic handle"""
+    handle: Optional[magic.Magic] = None
+    # libmagic handles are not safe to use from several threads at once
+    lock = threading.Lock()
+    signature_hits: int = 0
+    magic_lookups: int = 0
+
+    @classmethod
+    async def start(cls):
+        with cls.lock:
+            if cls.handle is None:
+                cls.handle = magic.Magic(mime=True)
+
+    @classmethod
+    def sniff(cls, data: bytes) -> str:
+        header = data[:SNIFF_HEADER_BYTES]
+        mime = sniff_signature(header)
+        if mime is not None:
+            cls.signature_hits += 1
+            return mime
+        cls.magic_lookups += 1
+        with cls.lock:
+            if cls.handle is None:
+                cls.handle = magic.Magic(mime=True)
+            return cls.handle.from_buffer(header)
+
+    @classmethod
+    def is_image(cls, data: bytes) -> bool:
+        return cls.sniff(data).startswith("image/")
@@ -0,0 +1,245 @@
+from fastapi import Request, HTTPException, status
+from dataclasses import dataclass
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from typing import Callable, List, Optional
+import io
+import os
+import tarfile
+import zipfile
+from dotenv import load_dotenv
+from app.services.sniff import SNIFF_HEADER_BYTES
+
+load_dotenv()
+
+# Largest image accepted per uploaded file, enforced while the body streams in
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+# Batch uploads: number of images (after unpacking archives) and total body size
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "100"))
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(200 * 1024 * 1024)))
+
+# Room for multipart boundaries and part headers on top of the file payload
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# Plain (non-file) form fields are not used by the API, keep them tiny
+MAX_FIELD_BYTES = 1024
+
+
+@dataclass
+class ImageUpload:
+    filename: str
+    content_type: Optional[str]
+    content: bytes
+
+
+def multipart_openapi(field: str = "file", multiple: bool = False) -> dict:
+    """OpenAPI request body for endpoints that parse the multipart stream themselves"""
+    file_schema = {"type": "string", "format": "binary"}
+    schema = {"type": "array", "items": file_schema} if multiple else file_schema
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {field: schema},
+                        "required": [field],
+                    }
+                }
+            },
+        }
+    }
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Uploaded file exceeds the maximum size of {max_bytes} bytes"
+    )
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+class UnsupportedUpload(HTTPException):
+    """An uploaded file was refused from its first bytes"""
+
+    def __init__(self, filename: str):
+        super().__init__(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="File is not a valid image")
+        self.filename = filename
+
+
+class _UploadCollector:
+    """python-multipart callbacks that keep file parts in memory with size limits"""
+
+    def __init__(
+        self, max_files: int, max_bytes: int, max_total_bytes: int,
+        accept: Optional[Callable[[bytes], bool]] = None
+    ):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.accept = accept
+        self._checked = False
+        self._total = 0
+        self.uploads: List[ImageUpload] = []
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._content_type: Optional[bytes] = None
+        self._filename: Optional[str] = None
+        self._chunks: List[bytes] = []
+        self._size = 0
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._content_type = None
+        self._filename = None
+        self._chunks = []
+        self._size = 0
+        self._checked = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        name = self._header_name.lower()
+        if name == b"content-disposition":
+            self._disposition = self._header_value
+        elif name == b"content-type":
+            self._content_type = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"filename" in options:
+            if len(self.uploads) >= self.max_files:
+                raise _bad_request(f"Too many files. Maximum number of files is {self.max_files}")
+            self._filename = options[b"filename"].decode("utf-8", "replace") or "upload"
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        self._size += end - start
+        self._total += end - start
+        if self._total > self.max_total_bytes:
+            raise _too_large(self.max_total_bytes)
+        limit = self.max_bytes if self._filename is not None else MAX_FIELD_BYTES
+        if self._size > limit:
+            raise _too_large(limit)
+        if self._filename is not None:
+            self._chunks.append(data[start:end])
+            if self._size >= SNIFF_HEADER_BYTES:
+                self._check_header()
+
+    def _check_header(self):
+        """Refuse a file from its first bytes, before the rest of it is read"""
+        if self.accept is None or self._checked:
+            return
+        self._checked = True
+        if not self.accept(b"".join(self._chunks)[:SNIFF_HEADER_BYTES]):
+            raise UnsupportedUpload(self._filename)
+
+    def on_part_end(self):
+        if self._filename is None:
+            return
+        self._check_header()
+        self.uploads.append(ImageUpload(
+            filename=self._filename,
+            content_type=self._content_type.decode("latin-1") if self._content_type else None,
+            content=b"".join(self._chunks),
+        ))
+        self._chunks = []
+
+
+async def read_uploads(
+    request: Request,
+    max_files: int = 1,
+    max_bytes: Optional[int] = None,
+    max_total_bytes: Optional[int] = None,
+    accept: Optional[Callable[[bytes], bool]] = None
+) -> List[ImageUpload]:
+    """Stream a multipart body into memory, rejecting oversized uploads as they arrive.
+
+    Unlike FastAPI's `UploadFile`, nothing is spooled to disk and the request is
+    aborted as soon as a file part grows past `max_bytes`, or as soon as
+    `accept` returns False for the first bytes of a file (UnsupportedUpload).
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    max_total_bytes = max_total_bytes or max_files * max_bytes
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type.lower() != b"multipart/form-data" or b"boundary" not in params:
+        raise _bad_request("Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_total_bytes + max_files * MULTIPART_OVERHEAD_BYTES:
+            raise _too_large(max_total_bytes)
+
+    collector = _UploadCollector(max_files, max_bytes, max_total_bytes, accept)
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": collector.on_part_begin,
+        "on_part_data": collector.on_part_data,
+        "on_part_end": collector.on_part_end,
+        "on_header_field": collector.on_header_field,
+        "on_header_value": collector.on_header_value,
+        "on_header_end": collector.on_header_end,
+        "on_headers_finished": collector.on_headers_finished,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except MultipartParseError:
+        raise _bad_request("Malformed multipart body")
+
+    if not collector.uploads:
+        raise _bad_request("No file was uploaded")
+    return collector.uploads
+
+
+def _archive_members(upload: ImageUpload):
+    """Return (name, size, reader) for regular files in a zip or tar upload, else None"""
+    buffer = io.BytesIO(upload.content)
+    if zipfile.is_zipfile(buffer):
+        archive = zipfile.ZipFile(buffer)
+        return [(info.filename, info.file_size, lambda info=info: archive.read(info))
+                for info in archive.infolist() if not info.is_dir()]
+    buffer.seek(0)
+    try:
+        archive = tarfile.open(fileobj=buffer, mode="r:*")
+    except tarfile.TarError:
+        return None
+    return [(member.name, member.size, lambda member=member: archive.extractfile(member).read())
+            for member in archive.getmembers() if member.isfile()]
+
+
+def expand_archives(uploads: List[ImageUpload], max_files: int, max_bytes: int) -> List[ImageUpload]:
+    """Replace zip/tar uploads by the files they contain.
+
+    Member sizes are checked against `max_bytes` before anything is decompressed,
+    so an archive cannot expand into more than `max_files * max_bytes`. Blocking,
+    run it in a thread.
+    """
+    expanded: List[ImageUpload] = []
+    for upload in uploads:
+        members = _archive_members(upload)
+        if members is None:
+            if len(upload.content) > max_bytes:
+                raise _too_large(max_bytes)
+            expanded.append(upload)
+            continue
+        for name, size, read in members:
+            if len(expanded) >= max_files:
+                raise _bad_request(f"Too many files. Maximum number of files is {max_files}")
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            expanded.append(ImageUpload(filename=os.path.basename(name), content_type=None, content=read()))
+    if len(expanded) > max_files:
+        raise _bad_request(f"Too many files. Maximum number of files is {max_files}")
+    return expanded
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from app.db.repositories import STORAGE_ERRORS
+from app.models.usage import insert_usages, not_inserted
+from app.schemas.usage import UsageCreate, UsageInDB
+
+load_dotenv()
+
+# Records waiting to be written; producers wait when the queue is full
+USAGE_QUEUE_SIZE = int(os.getenv("USAGE_QUEUE_SIZE", "10000"))
+
+# A flush happens once this many records are queued or the interval elapses
+USAGE_FLUSH_BATCH = int(os.getenv("USAGE_FLUSH_BATCH", "500"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "1"))
+
+
+# Queued by close() to tell the writer loop to flush and exit
+_STOP = object()
+
+
+class UsageWriter:
+    """Background writer that batches usage records into insert_many calls"""
+    queue: Optional[asyncio.Queue] = None
+    task: Optional[asyncio.Task] = None
+    closing: bool = False
+    written: int = 0
+    dropped: int = 0
+    flushes: int = 0
+    last_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+
+    @classmethod
+    def running(cls) -> bool:
+        return cls.task is not None and not cls.closing
+
+    @classmethod
+    async def start(cls):
+        cls.closing = False
+        cls.queue = asyncio.Queue(maxsize=USAGE_QUEUE_SIZE)
+        cls.task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def close(cls):
+        """Stop the writer and flush everything still queued"""
+        if cls.task is None:
+            return
+        # New records go straight to MongoDB from here on, see log_api_usage
+        cls.closing = True
+        await cls.queue.put(_STOP)
+        await cls.task
+        cls.task = None
+        while not cls.queue.empty():
+            await cls._flush(cls._take(USAGE_FLUSH_BATCH))
+
+    @classmethod
+    async def enqueue(cls, usage: UsageCreate) -> None:
+        record = UsageInDB(token=usage.token, endpoint=usage.endpoint, timestamp=datetime.utcnow())
+        # Blocks the caller while the queue is full, which slows producers down
+        # to the rate MongoDB can absorb instead of growing without bound
+        await cls.queue.put(record)
+
+    @classmethod
+    async def enqueue_many(cls, usages: List[UsageCreate]) -> None:
+        for usage in usages:
+            await cls.enqueue(usage)
+
+    @classmethod
+    def _take(cls, limit: int) -> list:
+        """Take up to `limit` queued items without waiting, stopping after _STOP"""
+        items = []
+        while len(items) < limit and not cls.queue.empty():
+            items.append(cls.queue.get_nowait())
+            if items[-1] is _STOP:
+                break
+        return items
+
+    @classmethod
+    async def _run(cls):
+        # Stopped with a sentinel rather than Task.cancel(), so a batch that was
+        # already taken off the queue is always written
+        stopping = False
+        while not stopping:
+            batch = [await cls.queue.get()]
+            deadline = time.monotonic() + USAGE_FLUSH_INTERVAL
+            while True:
+                if batch[-1] is _STOP:
+                    stopping = True
+                    batch.pop()
+                    break
+                if len(batch) >= USAGE_FLUSH_BATCH:
+                    break
+                batch.extend(cls._take(USAGE_FLUSH_BATCH - len(batch)))
+                if batch[-1] is _STOP or len(batch) >= USAGE_FLUSH_BATCH:
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(cls.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await cls._flush(batch)
+            except Exception as e:
+                # Keep the writer alive: running() would stay True with nothing
+                # draining the queue, and log_api_usage would block once it fills
+                cls.dropped += len(batch)
+                print(f"Dropped {len(batch)} usage records: {e!r}")
+
+    @classmethod
+    async def _flush(cls, batch: List[UsageInDB]) -> None:
+        if not batch:
+            return
+        started = time.perf_counter()
+        pending = batch
+        for attempt in range(2):
+            try:
+                await insert_usages(pending)
+                break
+            except STORAGE_ERRORS as e:
+                # Retry only what didn't get written, or the retry duplicates it
+                attempted = len(pending)
+                pending = not_inserted(pending, e)
+                cls.written += attempted - len(pending)
+                if attempt == 1:
+                    cls.dropped += len(pending)
+                    print(f"Dropped {len(pending)} usage records: {e}")
+                    return
+        cls.last_flush_seconds = time.perf_counter() - started
+        cls.total_flush_seconds += cls.last_flush_seconds
+        cls.flushes += 1
+        cls.written += len(pending)
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "running": cls.running(),
+            "queue_depth": cls.queue.qsize() if cls.queue else 0,
+            "queue_capacity": USAGE_QUEUE_SIZE,
+            "written": cls.written,
+            "dropped": cls.dropped,
+            "flushes": cls.flushes,
+            "last_flush_ms": round(cls.last_flush_seconds * 1000, 3),
+            "avg_flush_ms": round(cls.total_flush_seconds * 1000 / cls.flushes, 3) if cls.flushes else 0.0,
+        }
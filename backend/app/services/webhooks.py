@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# When set, every delivery carries X-Signature: sha256=<HMAC of the body with this secret>
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "3"))
+WEBHOOK_BACKOFF_BASE = float(os.getenv("WEBHOOK_BACKOFF_BASE", "1"))
+
+# Webhook URLs are chosen by token owners, so deliveries only go to public hosts
+# over these schemes. Private and loopback receivers (e.g. in development) need
+# WEBHOOK_ALLOW_PRIVATE=true.
+WEBHOOK_SCHEMES = os.getenv("WEBHOOK_SCHEMES", "https").split(",")
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() == "true"
+
+
+def sign(body: bytes, secret: str) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address)
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_webhook_url(url: str) -> None:
+    """Raise ValueError for webhook URLs that may not be delivered to, as far as the URL alone tells"""
+    parts = urlsplit(url)
+    if parts.scheme not in WEBHOOK_SCHEMES:
+        raise ValueError(f"Webhook URLs must use {' or '.join(WEBHOOK_SCHEMES)}")
+    host = parts.hostname
+    if not host:
+        raise ValueError("Webhook URL has no host")
+    if WEBHOOK_ALLOW_PRIVATE:
+        return
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ValueError("Webhook URLs must not point at private or loopback hosts")
+    try:
+        public = is_public(host)
+    except ValueError:
+        return  # A host name, checked once resolved
+    if not public:
+        raise ValueError("Webhook URLs must not point at private or loopback hosts")
+
+
+async def resolve(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port)
+    return [info[4][0] for info in infos]
+
+
+async def check_destination(url: str) -> Optional[str]:
+    """check_webhook_url, plus every address the host resolves to must be public.
+
+    Returns the checked address to connect to, so the delivery can't be sent
+    somewhere else by the host resolving differently a moment later; None
+    when WEBHOOK_ALLOW_PRIVATE leaves resolving to the HTTP client.
+    """
+    check_webhook_url(url)
+    if WEBHOOK_ALLOW_PRIVATE:
+        return None
+    parts = urlsplit(url)
+    try:
+        addresses = await resolve(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    except OSError as e:
+        raise ValueError(f"Could not resolve {parts.hostname}: {e}") from e
+    if not addresses or not all(is_public(address) for address in addresses):
+        raise ValueError(f"{parts.hostname} resolves to a private or loopback address")
+    return addresses[0]
+
+
+def pin(url: str, address: Optional[str]) -> Tuple[httpx.URL, dict, dict]:
+    """(url, headers, extensions) connecting to `address` while still asking for,
+    and verifying the TLS certificate of, the host named in `url`"""
+    target = httpx.URL(url)
+    if address is None:
+        return target, {}, {}
+    host = target.netloc.decode("ascii")
+    extensions = {"sni_hostname": target.host} if target.scheme == "https" else {}
+    return target.copy_with(host=address), {"Host": host}, extensions
+
+
+class WebhookSender:
+    """POSTs finished job results to the URL configured on their token"""
+    client: Optional[httpx.AsyncClient] = None
+    delivered: int = 0
+    failed: int = 0
+
+    @classmethod
+    async def start(cls, transport: Optional[httpx.AsyncBaseTransport] = None):
+        cls.client = httpx.AsyncClient(transport=transport, timeout=WEBHOOK_TIMEOUT)
+
+    @classmethod
+    async def close(cls):
+        if cls.client:
+            await cls.client.aclose()
+            cls.client = None
+
+    @classmethod
+    async def send(cls, url: str, payload: dict) -> bool:
+        """Deliver with a few retries; True once the receiver answers 2xx"""
+        if cls.client is None:
+            await cls.start()
+        try:
+            address = await check_destination(url)
+        except ValueError as e:
+            print(f"Refusing webhook delivery to {url}: {e}")
+            cls.failed += 1
+            return False
+        body = json.dumps(payload).encode()
+        target, headers, extensions = pin(url, address)
+        headers["Content-Type"] = "application/json"
+        if WEBHOOK_SECRET:
+            headers["X-Signature"] = sign(body, WEBHOOK_SECRET)
+
+        for attempt in range(WEBHOOK_MAX_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(WEBHOOK_BACKOFF_BASE * (2 ** (attempt - 1)))
+            try:
+                response = await cls.client.post(target, content=body, headers=headers, extensions=extensions)
+            except httpx.HTTPError as e:
+                print(f"Webhook delivery to {url} failed: {e}")
+                continue
+            if response.is_success:
+                cls.delivered += 1
+                return True
+            # The receiver rejected the payload itself; retrying won't change that
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                break
+        cls.failed += 1
+        return False
@@ -0,0 +1,51 @@
+"""Standalone job worker, for running the job pool apart from the API.
+
+    JOB_WORKERS=8 python -m app.worker
+
+The API processes only enqueue jobs unless JOB_WORKERS_EMBEDDED=true, so run
+this whenever /moderate/async or DEGRADED_MODE is in use.
+"""
+import asyncio
+import signal
+
+from app.db.mongodb import MongoDB
+from app.models.job import create_indexes as create_job_indexes
+from app.services.jobs import JobWorker, JOB_WORKERS
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.policy import PolicyEngine
+from app.services.prefilter import Prefilter
+from app.services.result_cache import ModerationCache
+from app.services.sightengine import SightEngineClient
+from app.services.sniff import TypeSniffer
+from app.services.webhooks import WebhookSender
+
+
+async def main():
+    await MongoDB.connect_to_database()
+    await create_job_indexes()
+    await TypeSniffer.start()
+    await SightEngineClient.start()
+    await ModerationCache.start()
+    await NearDuplicateIndex.start()
+    await PolicyEngine.start()
+    await Prefilter.start()
+    await WebhookSender.start()
+    await JobWorker.start(JOB_WORKERS)
+    print(f"Job worker running with {JOB_WORKERS} workers")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await JobWorker.close()
+    await WebhookSender.close()
+    await PolicyEngine.close()
+    await SightEngineClient.close()
+    await Prefilter.close()
+    await MongoDB.close_database_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Tail latency of upstream checks with and without hedging across two endpoints.
+
+Two fake SightEngine servers with the same long-tailed (lognormal) latency
+stand in for two regional endpoints. Without hedging every check waits on the
+first endpoint; with it, checks slower than that endpoint's recent p95 are
+also sent to the second one and the first answer wins.
+
+    python -m benchmarks.bench_hedging --requests 400 --concurrency 16 --latency-ms 80 --jitter-ms 120
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.services import providers
+from app.services.providers import ProviderRouter, SightEngineProvider
+from app.services.sightengine import SightEngineClient
+from benchmarks.fake_sightengine import run_in_thread
+from benchmarks.loadtest import summarize
+
+PAYLOAD = b"\xff\xd8\xff" + b"\x00" * 20_000
+
+
+async def run(hedge: bool, urls: list, args) -> dict:
+    providers.HEDGE_ENABLED = hedge
+    ProviderRouter.configure([SightEngineProvider(url, name=f"endpoint-{i}") for i, url in enumerate(urls)])
+    await SightEngineClient.start()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await ProviderRouter.check(PAYLOAD, "bench.jpg")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await SightEngineClient.close()
+    stats = ProviderRouter.stats()
+    return {
+        "hedging": hedge,
+        **summarize(latencies, 0, elapsed),
+        "hedges": sum(provider["hedges"] for provider in stats.values()),
+        "upstream_calls": sum(provider["calls"] for provider in stats.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=120)
+    parser.add_argument("--ports", type=int, nargs=2, default=[9101, 9102])
+    args = parser.parse_args()
+
+    options = {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "distribution": "lognormal"}
+    with run_in_thread(port=args.ports[0], **options) as (_, first), \
+            run_in_thread(port=args.ports[1], **options) as (_, second):
+        for hedge in (False, True):
+            print(json.dumps(asyncio.run(run(hedge, [first, second], args))))
+
+
+if __name__ == "__main__":
+    main()
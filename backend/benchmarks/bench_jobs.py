@@ -0,0 +1,64 @@
+"""Async job throughput for different worker pool sizes.
+
+Jobs are queued in an in-memory MongoDB (with --db-latency-ms per round trip)
+and moderated by JobWorker against a stub upstream answering after --latency-ms.
+
+    python -m benchmarks.bench_jobs --jobs 500 --workers 1 4 16 64
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.models.job import create_job, get_jobs_collection
+from app.services import jobs
+from app.services.jobs import JobWorker
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.result_cache import ModerationCache
+from app.services.sightengine import SightEngineClient
+from benchmarks.stubs import install_database, png_bytes, start_stub_upstream
+
+
+async def run(workers: int, images: list, args) -> dict:
+    install_database(args.db_latency_ms)
+    ModerationCache.clear()
+    sent = await start_stub_upstream(args.latency_ms)
+    for i, content in enumerate(images):
+        await create_job("bench", f"image-{i}.png", content)
+
+    started = time.perf_counter()
+    await JobWorker.start(workers)
+    while await get_jobs_collection().count_documents({"status": "done"}) < len(images):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await JobWorker.close()
+    await SightEngineClient.close()
+    return {
+        "workers": workers,
+        "jobs": len(images),
+        "upstream_calls": sent["requests"],
+        "seconds": round(elapsed, 2),
+        "jobs_per_second": round(len(images) / elapsed, 1),
+    }
+
+
+async def main_async(args):
+    NearDuplicateIndex.enabled = False
+    jobs.JOB_POLL_INTERVAL = 0.01
+    images = [png_bytes(seed=i) for i in range(args.jobs)]
+    for workers in args.workers:
+        print(json.dumps(await run(workers, images, args)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--db-latency-ms", type=float, default=1)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
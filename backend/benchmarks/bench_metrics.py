@@ -0,0 +1,68 @@
+"""Per-request cost of the Prometheus instrumentation.
+
+Calls a trivial ASGI app directly, with and without MetricsMiddleware, and
+times the stage timer used inside moderate_image on its own.
+
+    python -m benchmarks.bench_metrics --requests 200000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.core.metrics import MetricsMiddleware, stage
+
+ROUTE = type("Route", (), {"path": "/api/moderate"})()
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = ROUTE
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def per_request_us(app, requests: int) -> float:
+    scope = {"type": "http", "method": "POST", "path": "/api/moderate"}
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def stage_timer_us(iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with stage("bench"):
+            pass
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main_async(args):
+    bare = await per_request_us(endpoint, args.requests)
+    instrumented = await per_request_us(MetricsMiddleware(endpoint), args.requests)
+    print(json.dumps({
+        "requests": args.requests,
+        "bare_us": round(bare, 2),
+        "instrumented_us": round(instrumented, 2),
+        "middleware_overhead_us": round(instrumented - bare, 2),
+        "stage_timer_us": round(stage_timer_us(args.requests), 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
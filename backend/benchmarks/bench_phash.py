@@ -0,0 +1,100 @@
+"""Lookup latency and recall of the perceptual-hash near-duplicate index.
+
+Builds an index of random filler hashes plus a synthetic corpus of images,
+then queries it with re-encoded copies (resized, recompressed, converted) and
+with unrelated images to measure recall and false matches.
+
+    python -m benchmarks.bench_phash --entries 1000000 --images 200
+"""
+import argparse
+import io
+import json
+import random
+import statistics
+import time
+
+from PIL import Image, ImageDraw
+
+from app.services.phash import MultiIndexHash, dhash
+
+VARIANTS = {
+    "jpeg_half_q60": lambda im: encode(im.resize((im.width // 2, im.height // 2)), "jpeg", quality=60),
+    "jpeg_q30": lambda im: encode(im, "jpeg", quality=30),
+    "webp_3q_q50": lambda im: encode(im.resize((im.width * 3 // 4, im.height * 3 // 4)), "webp", quality=50),
+    "png_resave": lambda im: encode(im, "png"),
+}
+
+
+def encode(image: Image.Image, fmt: str, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def synthetic_image(rng: random.Random) -> Image.Image:
+    def color():
+        return tuple(rng.randrange(256) for _ in range(3))
+
+    image = Image.new("RGB", (640, 480), color())
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(600), rng.randrange(440)
+        box = (x, y, x + rng.randrange(40, 300), y + rng.randrange(40, 300))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=color())
+    return image
+
+
+def timed_search(index: MultiIndexHash, value: int, latencies: list):
+    started = time.perf_counter()
+    match = index.search(value)
+    latencies.append((time.perf_counter() - started) * 1e6)
+    return match
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000, help="random filler hashes in the index")
+    parser.add_argument("--images", type=int, default=200, help="synthetic originals")
+    parser.add_argument("--max-distance", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = MultiIndexHash(args.max_distance)
+    started = time.perf_counter()
+    for _ in range(args.entries):
+        index.add(rng.getrandbits(64))
+    build_seconds = time.perf_counter() - started
+
+    originals = [synthetic_image(rng) for _ in range(args.images)]
+    original_hashes = [dhash(encode(image, "png")) for image in originals]
+    for value in original_hashes:
+        index.add(value)
+
+    latencies = []
+    recall = {}
+    for name, variant in VARIANTS.items():
+        found = 0
+        for image, expected in zip(originals, original_hashes):
+            match = timed_search(index, dhash(variant(image)), latencies)
+            found += match is not None and match[0] == expected
+        recall[name] = round(found / len(originals), 4)
+
+    false_matches = 0
+    for _ in range(args.images):
+        false_matches += timed_search(index, dhash(encode(synthetic_image(rng), "png")), latencies) is not None
+
+    latencies.sort()
+    print(json.dumps({
+        "entries": len(index),
+        "max_distance": args.max_distance,
+        "build_seconds": round(build_seconds, 2),
+        "lookup_us_p50": round(statistics.median(latencies), 1),
+        "lookup_us_p99": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+        "recall": recall,
+        "false_match_rate": round(false_matches / args.images, 4),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
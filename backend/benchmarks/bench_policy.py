@@ -0,0 +1,103 @@
+"""Verdicts per second of the policy engine over recorded SightEngine responses.
+
+Responses come from an NDJSON file (one raw SightEngine response per line, e.g.
+the `content_analysis` of logged results) or are synthesized with random
+scores. Compares the old hand-written if-chain, the engine one response at a
+time (violations only, and the full verdict with scores and margins), and the
+engine over the whole batch, and checks that they all agree.
+
+    python -m benchmarks.bench_policy --responses 100000
+    python -m benchmarks.bench_policy --recorded responses.ndjson
+"""
+import argparse
+import json
+import random
+import time
+
+from app.services.policy import PolicyEngine
+
+
+def legacy_violations(result: dict) -> list:
+    """The if-chain the engine replaced, kept as the baseline"""
+    violations = []
+    if result.get('nudity'):
+        nudity = result['nudity']
+        if any(nudity.get(key, 0) > 0.5 for key in ('sexual_activity', 'sexual_display', 'erotica', 'suggestive')):
+            violations.append('nudity')
+    if result.get('weapon'):
+        weapon = result['weapon']['classes']
+        if weapon.get('firearm', 0) > 0.5 or weapon.get('knife', 0) > 0.5:
+            violations.append('weapon')
+    for category, key in (('alcohol', 'alcohol'), ('drugs', 'recreational_drug')):
+        if result.get(key, {}).get('prob', 0) > 0.5:
+            violations.append(category)
+    if result.get('offensive'):
+        offensive = result['offensive']
+        if any(offensive.get(key, 0) > 0.5 for key in ('nazi', 'supremacist', 'terrorist')):
+            violations.append('offensive')
+    for category in ('gore', 'tobacco', 'violence', 'self-harm'):
+        if result.get(category, {}).get('prob', 0) > 0.5:
+            violations.append(category)
+    return violations
+
+
+def synthetic_response(rng: random.Random) -> dict:
+    def score():
+        # Mostly clean images with the occasional high score
+        return round(rng.random() ** 40, 3)
+
+    return {
+        "status": "success",
+        "nudity": {key: score() for key in ("sexual_activity", "sexual_display", "erotica", "suggestive", "none")},
+        "weapon": {"classes": {"firearm": score(), "knife": score()}},
+        "alcohol": {"prob": score()},
+        "recreational_drug": {"prob": score()},
+        "offensive": {"nazi": score(), "supremacist": score(), "terrorist": score()},
+        "gore": {"prob": score()},
+        "tobacco": {"prob": score()},
+        "violence": {"prob": score()},
+        "self-harm": {"prob": score()},
+    }
+
+
+def timed(fn) -> tuple:
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=100000, help="synthetic responses to generate")
+    parser.add_argument("--recorded", help="NDJSON file of recorded SightEngine responses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.recorded:
+        with open(args.recorded) as f:
+            responses = [json.loads(line) for line in f if line.strip()]
+    else:
+        rng = random.Random(args.seed)
+        responses = [synthetic_response(rng) for _ in range(args.responses)]
+    policy = PolicyEngine.get()
+
+    legacy, legacy_seconds = timed(lambda: [legacy_violations(response) for response in responses])
+    single, single_seconds = timed(lambda: [policy.violations(response) for response in responses])
+    verdicts, verdict_seconds = timed(lambda: [policy.verdict(response) for response in responses])
+    batch_verdicts, batch_seconds = timed(lambda: policy.verdicts(responses))
+    batch = [violations for violations, _, _ in batch_verdicts]
+
+    count = len(responses)
+    print(json.dumps({
+        "responses": count,
+        "unsafe": sum(1 for violations in legacy if violations),
+        "legacy_per_second": round(count / legacy_seconds),
+        "engine_single_per_second": round(count / single_seconds),
+        "engine_single_verdict_per_second": round(count / verdict_seconds),
+        "engine_batch_verdict_per_second": round(count / batch_seconds),
+        "agree": legacy == single == batch and verdicts == batch_verdicts,
+    }))
+
+
+if __name__ == "__main__":
+    main()
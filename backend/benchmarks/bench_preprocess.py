@@ -0,0 +1,83 @@
+"""Bytes sent upstream and end-to-end latency per image, with and without preprocessing.
+
+Camera-like JPEGs of several sizes go through moderate_image against an
+in-process upstream that charges transfer time for every byte on a link of
+--uplink-mbps plus a fixed --latency-ms for the analysis itself.
+
+    python -m benchmarks.bench_preprocess --sizes 1024 2048 4000 6000 --repeat 5
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.services import preprocess
+from app.services.moderation import moderate_image
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.sightengine import SightEngineClient
+from benchmarks.stubs import install_database, start_stub_upstream
+
+
+def camera_jpeg(width: int, seed: int = 0) -> bytes:
+    """A 4:3 JPEG with smooth gradients and sensor-like noise, which compresses like a photo"""
+    height = width * 3 // 4
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([
+        128 + 100 * np.sin(x / (width / 7) + seed),
+        128 + 100 * np.cos(y / (height / 5)),
+        128 + 80 * np.sin((x + y) / (width / 3)),
+    ], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "jpeg", quality=92)
+    return buffer.getvalue()
+
+
+async def run(enabled: bool, images: dict, repeat: int, latency_ms: float, uplink_mbps: float) -> list:
+    preprocess.PREPROCESS_ENABLED = enabled
+    rows = []
+    for width, content in images.items():
+        sent = await start_stub_upstream(latency_ms, uplink_mbps)
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await moderate_image(content, f"camera-{width}.jpg", use_cache=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+        await SightEngineClient.close()
+        rows.append({
+            "preprocess": enabled,
+            "width": width,
+            "original_bytes": len(content),
+            "sent_bytes": sent["bytes"] // sent["requests"],
+            "p50_ms": round(statistics.median(latencies), 1),
+        })
+    return rows
+
+
+async def main_async(args):
+    install_database(0)
+    NearDuplicateIndex.enabled = False
+    images = {width: camera_jpeg(width) for width in args.sizes}
+    for enabled in (False, True):
+        for row in await run(enabled, images, args.repeat, args.latency_ms, args.uplink_mbps):
+            print(json.dumps(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4000, 6000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--uplink-mbps", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Size and serialization cost of a /moderate response body.
+
+Compares the old response (the verdict plus the whole SightEngine payload,
+encoded by jsonable_encoder and the stdlib JSONResponse) with the compact
+typed result rendered the way the route now does it: validated against
+ModerationResult, nulls dropped, encoded by ORJSONResponse. The payload is
+shaped like a real answer for the ten default models.
+
+    python -m benchmarks.bench_responses --iterations 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.schemas.moderation import ModerationResult
+from app.services.moderation import analyze_result
+
+
+def classes(*names: str) -> dict:
+    return {name: 0.001 for name in names}
+
+
+UPSTREAM_RESPONSE = {
+    "status": "success",
+    "request": {"id": "req_fUOnGHBgdeRpVvVQbymQp", "timestamp": 1717171717.1234, "operations": 10},
+    "nudity": {
+        **classes("sexual_activity", "sexual_display", "erotica", "very_suggestive", "suggestive",
+                  "mildly_suggestive"),
+        "suggestive_classes": {
+            **classes("bikini", "cleavage", "lingerie", "male_chest", "male_underwear", "miniskirt",
+                      "minishort", "nudity_art", "schematic", "sextoy", "suggestive_focus",
+                      "suggestive_pose", "swimwear_male", "swimwear_one_piece", "visibly_undressed", "other"),
+            "cleavage_categories": classes("very_revealing", "revealing", "none"),
+            "male_chest_categories": classes("very_revealing", "revealing", "slightly_revealing"),
+        },
+        "none": 0.99,
+        "context": classes("sea_lake_pool", "outdoor_other", "indoor_other"),
+    },
+    "weapon": {
+        "classes": classes("firearm", "firearm_gesture", "firearm_toy", "knife"),
+        "firearm_type": classes("animated"),
+        "firearm_action": classes("aiming_threat", "aiming_camera", "aiming_safe", "in_hand_not_aiming",
+                                  "worn_not_in_hand", "not_worn"),
+    },
+    "alcohol": {"prob": 0.002},
+    "recreational_drug": {"prob": 0.001, "classes": classes("cannabis", "cannabis_logo_only", "cannabis_plant",
+                                                            "cannabis_drug", "recreational_drugs_not_cannabis")},
+    "medical": {"prob": 0.001, "classes": classes("pills", "paraphernalia")},
+    "offensive": {
+        "nazi": 0.001, "confederate": 0.001, "supremacist": 0.001, "terrorist": 0.001, "middle_finger": 0.001,
+        "prob": 0.001,
+    },
+    "gore": {
+        "prob": 0.001,
+        "classes": classes("very_bloody", "slightly_bloody", "body_organ", "serious_injury", "superficial_injury",
+                           "corpse", "skull", "unconscious", "body_waste", "other"),
+        "type": classes("animated", "fake", "real"),
+    },
+    "tobacco": {"prob": 0.001, "classes": classes("regular_tobacco", "ambiguous_tobacco")},
+    "violence": {"prob": 0.001, "classes": classes("physical_violence", "firearm_threat", "combat_sport")},
+    "self-harm": {"prob": 0.001, "type": classes("real", "fake", "animated")},
+    "media": {"id": "med_fUOnvBuGIYSGTdBkMUmAL", "uri": "upload.jpg"},
+}
+
+FIELD = create_response_field("response", ModerationResult)
+
+
+def old_body(result: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(result)).body
+
+
+async def new_body(result: dict) -> bytes:
+    content = await serialize_response(field=FIELD, response_content=result, exclude_none=True, is_coroutine=True)
+    return ORJSONResponse(content).body
+
+
+async def timed_us(render, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = render()
+        if asyncio.iscoroutine(body):
+            await body
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main_async(args):
+    full = analyze_result(UPSTREAM_RESPONSE, include_raw=True)
+    compact = analyze_result(UPSTREAM_RESPONSE)
+    report = {"iterations": args.iterations}
+    for name, render in (
+        ("old_full", lambda: old_body(full)),
+        ("new_compact", lambda: new_body(compact)),
+        ("new_raw", lambda: new_body(full)),
+    ):
+        body = render()
+        if asyncio.iscoroutine(body):
+            body = await body
+        report[name] = {"bytes": len(body), "serialize_us": round(await timed_us(render, args.iterations), 2)}
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
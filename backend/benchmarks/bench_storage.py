@@ -0,0 +1,97 @@
+"""Per-request cost of authentication and usage logging on each storage backend.
+
+Times the storage calls behind one request with the caches and the usage
+writer out of the way: the token lookup of a cold auth cache, and the usage
+record with its rollup counters. A batched write (as the usage writer does
+it) is timed per record too.
+
+MongoDB is mongomock-motor with --db-latency-ms per round trip, or a real
+server given with --mongodb-uri (a fresh database on it). mongomock's own
+cost grows with the collections, so take its numbers as an upper bound.
+SQLite is a file in a temporary directory, in WAL mode, with every write
+committed in its own transaction on the database thread.
+
+    python -m benchmarks.bench_storage --requests 5000 --db-latency-ms 0.5
+    python -m benchmarks.bench_storage --backends sqlite
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from app.db import mongodb
+from app.db.mongodb import MongoDB
+from app.db.storage import Storage, BACKENDS
+from app.models.token import create_token, get_token
+from app.models.usage import create_usage, insert_usages
+from app.schemas.token import TokenCreate
+from app.schemas.usage import UsageCreate, UsageInDB
+from benchmarks.stubs import install_database
+
+
+async def per_call_us(call, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await call()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def measure(backend: str, args) -> dict:
+    token = (await create_token(TokenCreate(isAdmin=False))).token
+    usage = UsageCreate(token=token, endpoint="/moderate")
+    auth = await per_call_us(lambda: get_token(token), args.requests)
+    log = await per_call_us(lambda: create_usage(usage), args.requests)
+    batch = [UsageInDB(token=token, endpoint="/moderate", timestamp=datetime.utcnow())] * args.batch
+    batched = await per_call_us(lambda: insert_usages(batch), max(1, args.requests // args.batch)) / args.batch
+    return {
+        "backend": backend,
+        "token_lookup_us": round(auth, 1),
+        "usage_write_us": round(log, 1),
+        "auth_and_usage_us": round(auth + log, 1),
+        "batched_usage_write_us": round(batched, 1),
+    }
+
+
+async def run(backend: str, args) -> dict:
+    if backend == "sqlite":
+        with tempfile.TemporaryDirectory() as directory:
+            with patch('app.db.sqlite.SQLITE_PATH', str(Path(directory) / "bench.db")):
+                await Storage.connect("sqlite")
+                try:
+                    return await measure(backend, args)
+                finally:
+                    await Storage.close()
+
+    if args.mongodb_uri:
+        mongodb.MONGODB_URI = args.mongodb_uri
+        mongodb.DATABASE_NAME = f"bench_storage_{int(time.time())}"
+        await MongoDB.connect_to_database()
+    else:
+        install_database(args.db_latency_ms)
+    await Storage.connect("mongodb")
+    try:
+        return {**await measure(backend, args), "db_latency_ms": None if args.mongodb_uri else args.db_latency_ms}
+    finally:
+        if args.mongodb_uri:
+            await MongoDB.client.drop_database(mongodb.DATABASE_NAME)
+        await MongoDB.close_database_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=100, help="records per batched usage write")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--db-latency-ms", type=float, default=0.5, help="simulated round trip with mongomock")
+    parser.add_argument("--mongodb-uri", help="use this MongoDB (a fresh database on it) instead of mongomock")
+    args = parser.parse_args()
+    for backend in args.backends.split(","):
+        print(json.dumps(asyncio.run(run(backend, args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Requests/sec on /api/moderate with direct vs buffered usage logging.
+
+The upstream is stubbed in-process and MongoDB is an in-memory stand-in with a
+simulated round-trip latency, so the difference between the two runs is the
+cost of writing usage on the request path.
+
+    python -m benchmarks.bench_usage_writer --requests 2000 --concurrency 8 --mongo-latency-ms 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime
+
+import httpx
+
+from app.core.auth import TokenCache
+from app.main import app
+from app.models.token import get_tokens_collection
+from app.models.usage import get_usages_collection
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.sightengine import SightEngineClient
+from app.services.usage_writer import UsageWriter
+from benchmarks.stubs import install_database, png_bytes, start_stub_upstream
+
+TOKEN = "benchmark-token"
+
+
+async def run(mode: str, total: int, concurrency: int, mongo_latency_ms: float) -> dict:
+    install_database(mongo_latency_ms)
+    await get_tokens_collection().insert_one({"token": TOKEN, "isAdmin": False, "createdAt": datetime.utcnow()})
+    TokenCache.clear()
+    NearDuplicateIndex.enabled = False
+    await start_stub_upstream()
+    if mode == "buffered":
+        await UsageWriter.start()
+
+    image = png_bytes()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                sent = time.perf_counter()
+                response = await client.post("/api/moderate", files={"file": ("bench.png", image, "image/png")}, headers=headers)
+                latencies.append((time.perf_counter() - sent) * 1000)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    await UsageWriter.close()
+    writer = UsageWriter.stats()
+    await SightEngineClient.close()
+    written = await get_usages_collection().count_documents({})
+    return {"mode": mode, "requests": total, "concurrency": concurrency,
+            "mongo_latency_ms": mongo_latency_ms, "seconds": round(elapsed, 3),
+            "rps": round(total / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p99_ms": round(sorted(latencies)[int(len(latencies) * 0.99) - 1], 2),
+            "usage_written": written,
+            "flushes": writer["flushes"], "avg_flush_ms": writer["avg_flush_ms"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mongo-latency-ms", type=float, default=5)
+    args = parser.parse_args()
+    for mode in ("direct", "buffered"):
+        print(json.dumps(asyncio.run(run(mode, args.requests, args.concurrency, args.mongo_latency_ms))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Agreement of the local pre-filter with recorded upstream verdicts.
+
+The manifest is NDJSON, one image per line with the verdict SightEngine gave
+it, e.g. collected from /api/moderate responses:
+
+    {"path": "images/0001.jpg", "is_safe": true}
+
+Paths are relative to the manifest. With --fit, a logistic regression is
+trained on a random half of the images and written to the given .npz (usable
+as PREFILTER_MODEL); the other half is used for the evaluation.
+
+    python -m benchmarks.eval_prefilter verdicts.ndjson --fit prefilter.npz
+    python -m benchmarks.eval_prefilter verdicts.ndjson --model prefilter.npz --safe-below 0.1
+"""
+import argparse
+import io
+import json
+import os
+import random
+
+import numpy as np
+from PIL import Image
+
+from app.services.prefilter import (
+    PREFILTER_SAFE_BELOW, PREFILTER_UNSAFE_ABOVE, image_features, load_model, score_image
+)
+
+
+def read_manifest(path: str) -> list:
+    root = os.path.dirname(os.path.abspath(path))
+    samples = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                with open(os.path.join(root, entry["path"]), "rb") as image:
+                    samples.append((image.read(), bool(entry["is_safe"])))
+    return samples
+
+
+def fit(samples: list, iterations: int = 2000, learning_rate: float = 0.1, l2: float = 1e-3) -> dict:
+    """Plain NumPy logistic regression on standardized features; label 1 means unsafe"""
+    features = []
+    for content, _ in samples:
+        with Image.open(io.BytesIO(content)) as image:
+            features.append(image_features(image))
+    x = np.array(features)
+    y = np.array([0.0 if is_safe else 1.0 for _, is_safe in samples])
+    mean, std = x.mean(axis=0), x.std(axis=0) + 1e-9
+    x = (x - mean) / std
+    weights, bias = np.zeros(x.shape[1]), 0.0
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-(x @ weights + bias)))
+        weights -= learning_rate * (x.T @ (p - y) / len(y) + l2 * weights)
+        bias -= learning_rate * float((p - y).mean())
+    return {"weights": weights, "bias": np.array(bias), "mean": mean, "std": std}
+
+
+def evaluate(samples: list, model, safe_below: float, unsafe_above: float) -> dict:
+    local_safe = local_unsafe = false_safe = false_unsafe = 0
+    for content, is_safe in samples:
+        score = score_image(content, model)
+        if score is not None and score < safe_below:
+            local_safe += 1
+            false_safe += not is_safe
+        elif score is not None and score > unsafe_above:
+            local_unsafe += 1
+            false_unsafe += is_safe
+    decided = local_safe + local_unsafe
+    total = len(samples)
+    return {
+        "images": total,
+        "escalation_rate": round((total - decided) / total, 4) if total else None,
+        "decided_locally": decided,
+        "agreement": round((decided - false_safe - false_unsafe) / decided, 4) if decided else None,
+        "false_safe": false_safe,
+        "false_unsafe": false_unsafe,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("manifest")
+    parser.add_argument("--model", help="existing .npz model to evaluate")
+    parser.add_argument("--fit", help="train on half the manifest and save the model here")
+    parser.add_argument("--safe-below", type=float, default=PREFILTER_SAFE_BELOW)
+    parser.add_argument("--unsafe-above", type=float, default=PREFILTER_UNSAFE_ABOVE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    samples = read_manifest(args.manifest)
+    model = load_model(args.model) if args.model else None
+    if args.fit:
+        random.Random(args.seed).shuffle(samples)
+        train, samples = samples[:len(samples) // 2], samples[len(samples) // 2:]
+        model = fit(train)
+        np.savez(args.fit, **model)
+    print(json.dumps(evaluate(samples, model, args.safe_below, args.unsafe_above)))
+
+
+if __name__ == "__main__":
+    main()
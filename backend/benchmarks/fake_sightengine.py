@@ -0,0 +1,110 @@
+"""Local fake SightEngine server for load tests and benchmarks.
+
+Run standalone with:
+    python -m benchmarks.fake_sightengine --port 9100 --latency-ms 200
+
+latency_ms, jitter_ms, distribution and error_rate live on app.state and can
+be changed while the server runs, e.g. error_rate = 1 to simulate an outage.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+SAFE_RESPONSE = {
+    "status": "success",
+    "request": {"id": "fake"},
+    "nudity": {"sexual_activity": 0.01, "sexual_display": 0.01, "erotica": 0.01, "suggestive": 0.01},
+    "weapon": {"classes": {"firearm": 0.01, "knife": 0.01}},
+    "alcohol": {"prob": 0.01},
+    "recreational_drug": {"prob": 0.01},
+    "offensive": {"nazi": 0.01, "supremacist": 0.01, "terrorist": 0.01},
+    "gore": {"prob": 0.01},
+    "tobacco": {"prob": 0.01},
+    "violence": {"prob": 0.01},
+    "self-harm": {"prob": 0.01}
+}
+
+
+DISTRIBUTIONS = ("uniform", "normal", "lognormal", "exponential")
+
+
+def sample_latency_ms(distribution: str, latency_ms: float, jitter_ms: float) -> float:
+    """One simulated model latency.
+
+    uniform: latency_ms +/- jitter_ms; normal: standard deviation jitter_ms;
+    lognormal: median latency_ms with a long tail that grows with jitter_ms;
+    exponential: mean latency_ms.
+    """
+    if distribution == "normal":
+        delay = random.gauss(latency_ms, jitter_ms)
+    elif distribution == "lognormal":
+        delay = latency_ms * random.lognormvariate(0, jitter_ms / latency_ms) if latency_ms else 0
+    elif distribution == "exponential":
+        delay = random.expovariate(1 / latency_ms) if latency_ms else 0
+    else:
+        delay = latency_ms + random.uniform(-jitter_ms, jitter_ms)
+    return max(0.0, delay)
+
+
+def create_app(
+    latency_ms: float = 100, jitter_ms: float = 0, error_rate: float = 0, distribution: str = "uniform"
+) -> Starlette:
+    """Build an app that answers check.json after a simulated model latency"""
+    async def check(request: Request):
+        await request.body()
+        state = request.app.state
+        state.calls += 1
+        await asyncio.sleep(sample_latency_ms(state.distribution, state.latency_ms, state.jitter_ms) / 1000)
+        if random.random() < state.error_rate:
+            return JSONResponse({"status": "failure", "error": {"message": "Injected error"}}, status_code=503)
+        return JSONResponse(SAFE_RESPONSE)
+
+    app = Starlette(routes=[Route("/1.0/check.json", check, methods=["POST"])])
+    app.state.calls = 0
+    app.state.latency_ms = latency_ms
+    app.state.jitter_ms = jitter_ms
+    app.state.error_rate = error_rate
+    app.state.distribution = distribution
+    return app
+
+
+@contextmanager
+def run_in_thread(host: str = "127.0.0.1", port: int = 9100, **kwargs):
+    """Serve the fake upstream from a background thread for the duration of the block"""
+    app = create_app(**kwargs)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield app, f"http://{host}:{port}/1.0/check.json"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake SightEngine server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.distribution)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare blocking vs pooled async upstream calls from a single event loop.
+
+The blocking mode reproduces the old `requests.post` call inside `moderate_image`;
+the async mode goes through `SightEngineClient`. Both run against the local fake
+SightEngine server, so the difference is purely how many calls one worker can
+keep in flight.
+
+    python -m benchmarks.load_upstream --requests 200 --concurrency 50 --latency-ms 100
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import requests
+
+from app.services import sightengine
+from app.services.sightengine import SightEngineClient
+from benchmarks.fake_sightengine import run_in_thread
+
+PAYLOAD = b"\x89PNG\r\n\x1a\n" + b"\x00" * 20_000
+
+
+async def run(mode: str, url: str, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def blocking_call():
+        response = requests.post(url, files={'media': ('bench.png', PAYLOAD)}, data={'models': sightengine.MODELS})
+        return response.json()
+
+    async def async_call():
+        return await SightEngineClient.check(PAYLOAD, 'bench.png')
+
+    call = blocking_call if mode == "blocking" else async_call
+
+    async def one():
+        async with semaphore:
+            await call()
+
+    await SightEngineClient.start()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one() for _ in range(total)))
+    finally:
+        await SightEngineClient.close()
+    elapsed = time.perf_counter() - started
+    return {"mode": mode, "requests": total, "concurrency": concurrency,
+            "seconds": round(elapsed, 3), "rps": round(total / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+
+    with run_in_thread(port=args.port, latency_ms=args.latency_ms) as (_, url):
+        sightengine.API_URL = url
+        for mode in ("blocking", "async"):
+            print(json.dumps(asyncio.run(run(mode, url, args.requests, args.concurrency))))
+
+
+if __name__ == "__main__":
+    main()
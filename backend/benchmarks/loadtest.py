@@ -0,0 +1,258 @@
+"""Load test of the whole API against local stand-ins for MongoDB and SightEngine.
+
+The app runs in-process with its real lifespan. MongoDB is mongomock-motor with
+--db-latency-ms per round trip, or a throwaway mongod given with --mongodb-uri
+(mongomock's own cost grows with collection size, so use a real server when
+the database scenarios matter). SightEngine is the fake server from
+fake_sightengine on a local port, answering after latencies drawn from
+--latency-dist. A closed loop of --concurrency clients sends a weighted mix of
+moderation, token and usage requests. Images come from a pool of camera-like
+JPEGs in a weighted mix of sizes.
+
+The JSON result is the only thing written to stdout, so it can be piped into
+jq; everything the app and the stand-ins print goes to stderr. --output also
+writes it to a file. Keep one from a known good commit and pass it as
+--baseline to fail (exit 1) when RPS drops, or any scenario's p95/p99 grows,
+by more than --tolerance:
+
+    python -m benchmarks.loadtest --duration 30 --concurrency 32 --output base.json
+    python -m benchmarks.loadtest --duration 30 --concurrency 32 --baseline base.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from app.db import mongodb
+from app.db.mongodb import MongoDB
+from app.main import app
+from app.models.token import create_token, update_token_limits
+from app.schemas.token import TokenCreate, TokenLimits
+from app.services import sightengine
+from benchmarks.bench_preprocess import camera_jpeg
+from benchmarks.fake_sightengine import DISTRIBUTIONS, run_in_thread
+from benchmarks.stubs import install_database
+
+DEFAULT_MIX = "moderate=70,tokens_list=5,tokens_create=5,my_usage=10,usage_summary=5,usage_count=5"
+DEFAULT_SIZES = "320=50,1024=35,3000=15"
+
+
+def parse_weights(spec: str) -> dict:
+    """'a=3,b=1' -> {'a': 3.0, 'b': 1.0}"""
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Scenarios:
+    """The requests a simulated client can send, one coroutine per scenario name"""
+
+    def __init__(self, client: httpx.AsyncClient, admin: str, users: list, images: dict, size_weights: dict,
+                 no_cache: bool):
+        self.client = client
+        self.admin = {"Authorization": f"Bearer {admin}"}
+        self.users = [{"Authorization": f"Bearer {user}"} for user in users]
+        self.images = images
+        self.sizes = list(size_weights)
+        self.size_weights = list(size_weights.values())
+        self.no_cache = no_cache
+
+    def user(self) -> dict:
+        return random.choice(self.users)
+
+    async def moderate(self) -> httpx.Response:
+        size = random.choices(self.sizes, self.size_weights)[0]
+        image = random.choice(self.images[size])
+        headers = {**self.user(), **({"Cache-Control": "no-cache"} if self.no_cache else {})}
+        return await self.client.post(
+            "/api/moderate", files={"file": (f"load-{size}.jpg", image, "image/jpeg")}, headers=headers
+        )
+
+    async def tokens_list(self) -> httpx.Response:
+        return await self.client.get("/api/auth/tokens", headers=self.admin)
+
+    async def tokens_create(self) -> httpx.Response:
+        return await self.client.post("/api/auth/tokens", json={"isAdmin": False}, headers=self.admin)
+
+    async def my_usage(self) -> httpx.Response:
+        return await self.client.get("/api/auth/usage/my-usage", params={"limit": 50}, headers=self.user())
+
+    async def usage_summary(self) -> httpx.Response:
+        return await self.client.get("/api/auth/usage/summary", params={"group_by": "token"}, headers=self.admin)
+
+    async def usage_count(self) -> httpx.Response:
+        return await self.client.get("/api/auth/usage/my-usage/count", headers=self.user())
+
+
+async def drive(scenarios: Scenarios, mix: dict, concurrency: int, duration: float, total: int) -> dict:
+    """Closed loop: every client sends its next request as soon as the previous one returns"""
+    names = list(mix)
+    weights = list(mix.values())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    sent = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def client_loop():
+        nonlocal sent
+        while (deadline is None or time.perf_counter() < deadline) and (not total or sent < total):
+            sent += 1
+            name = random.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(scenarios, name)()
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            errors[name] += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {name: summarize(latencies[name], errors[name], elapsed) for name in names if latencies[name]}
+    everything = [latency for values in latencies.values() for latency in values]
+    report["total"] = summarize(everything, sum(errors.values()), elapsed)
+    return report
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable reasons the result is worse than the baseline beyond the tolerance"""
+    reasons = []
+    base_rps = baseline["scenarios"]["total"]["rps"]
+    rps = result["scenarios"]["total"]["rps"]
+    if rps < base_rps * (1 - tolerance):
+        reasons.append(f"total rps {rps} < baseline {base_rps}")
+    for name, stats in result["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if stats[key] > base[key] * (1 + tolerance):
+                reasons.append(f"{name} {key} {stats[key]} > baseline {base[key]}")
+    return reasons
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    mix = parse_weights(args.mix)
+    size_weights = {int(size): weight for size, weight in parse_weights(args.image_sizes).items()}
+    images = {size: [camera_jpeg(size, seed) for seed in range(args.image_pool)] for size in size_weights}
+
+    if args.mongodb_uri:
+        mongodb.MONGODB_URI = args.mongodb_uri
+        mongodb.DATABASE_NAME = f"loadtest_{int(time.time())}"
+    else:
+        async def connect():
+            install_database(args.db_latency_ms)
+        MongoDB.connect_to_database = connect
+
+    with run_in_thread(
+        port=args.upstream_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, distribution=args.latency_dist
+    ) as (upstream, url):
+        sightengine.API_URL = url
+        async with app.router.lifespan_context(app):
+            admin = await create_token(TokenCreate(isAdmin=True))
+            users = [(await create_token(TokenCreate(isAdmin=False))).token for _ in range(args.tokens)]
+            for user in users:
+                await update_token_limits(user, TokenLimits(rateLimit=1e6, burst=1_000_000))
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+                scenarios = Scenarios(client, admin.token, users, images, size_weights, args.no_cache)
+                if args.warmup:
+                    await drive(scenarios, mix, args.concurrency, 0, args.warmup)
+                report = await drive(scenarios, mix, args.concurrency, args.duration, args.requests)
+        upstream_calls = upstream.state.calls
+
+    return {
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "upstream_calls": upstream_calls,
+        "scenarios": report,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run (0: until --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0: no limit)")
+    parser.add_argument("--warmup", type=int, default=50, help="requests sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. moderate=8,my_usage=2")
+    parser.add_argument("--image-sizes", default=DEFAULT_SIZES, help="longest edge (px) weights, e.g. 320=3,3000=1")
+    parser.add_argument("--image-pool", type=int, default=20, help="distinct images per size")
+    parser.add_argument("--no-cache", action="store_true", help="send Cache-Control: no-cache on /api/moderate")
+    parser.add_argument("--tokens", type=int, default=20, help="user tokens the load is spread over")
+    parser.add_argument("--latency-dist", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=60)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--db-latency-ms", type=float, default=1, help="simulated round trip with mongomock")
+    parser.add_argument("--mongodb-uri", help="use this MongoDB (a fresh database on it) instead of mongomock")
+    parser.add_argument("--upstream-port", type=int, default=9100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON result here")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+    if not args.duration and not args.requests:
+        parser.error("give --duration or --requests")
+
+    # The app prints as it runs (e.g. "Connected to MongoDB!"); keep stdout for the result
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            reasons = regressions(result, json.load(f), args.tolerance)
+        for reason in reasons:
+            print(f"REGRESSION: {reason}", file=sys.stderr)
+        if reasons:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
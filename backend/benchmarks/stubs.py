@@ -0,0 +1,82 @@
+"""In-process stand-ins for MongoDB and SightEngine used by the benchmarks."""
+import asyncio
+import inspect
+import io
+import random
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+from PIL import Image
+
+from app.db.mongodb import MongoDB
+from app.services.sightengine import SightEngineClient
+from benchmarks.fake_sightengine import SAFE_RESPONSE
+
+
+class LatencyCollection:
+    """Wraps a mongomock-motor collection, adding a fixed delay to every awaited call"""
+
+    def __init__(self, collection, latency: float):
+        self._collection = collection
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        async def delayed(*args, **kwargs):
+            await asyncio.sleep(self._latency)
+            return await attribute(*args, **kwargs)
+        return delayed
+
+
+class LatencyDatabase:
+    def __init__(self, database, latency: float):
+        self._database = database
+        self._latency = latency
+
+    def __getitem__(self, name):
+        return LatencyCollection(self._database[name], self._latency)
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+def install_database(latency_ms: float = 1.0):
+    """Point MongoDB.get_database() at an in-memory database with simulated round trips"""
+    MongoDB.client = AsyncMongoMockClient()
+    MongoDB.db = LatencyDatabase(MongoDB.client["benchmark"], latency_ms / 1000)
+    return MongoDB.db
+
+
+async def start_stub_upstream(latency_ms: float = 0.0, uplink_mbps: float = 0.0) -> dict:
+    """Start SightEngineClient against an in-process upstream that always says 'safe'.
+
+    With `uplink_mbps`, each request also waits as long as sending its body
+    would take on a link that fast. Returns counters of requests and bytes sent.
+    """
+    sent = {"requests": 0, "bytes": 0}
+
+    async def handler(request: httpx.Request):
+        body = await request.aread()
+        sent["requests"] += 1
+        sent["bytes"] += len(body)
+        delay = latency_ms / 1000
+        if uplink_mbps:
+            delay += len(body) * 8 / (uplink_mbps * 1_000_000)
+        if delay:
+            await asyncio.sleep(delay)
+        return httpx.Response(200, json=SAFE_RESPONSE)
+
+    await SightEngineClient.start(transport=httpx.MockTransport(handler))
+    return sent
+
+
+def png_bytes(size: int = 64, seed: int = 0) -> bytes:
+    """A unique noise PNG so neither cache short-circuits the request"""
+    rng = random.Random(seed)
+    image = Image.frombytes("L", (size, size), bytes(rng.getrandbits(8) for _ in range(size * size)))
+    buffer = io.BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue()
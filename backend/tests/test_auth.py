@@ -3,13 +3,18 @@ from unittest.mock import patch, AsyncMock
 from types import SimpleNamespace
 from fastapi import HTTPException
 
-from app.core.auth import get_admin_token
+from app.core.auth import get_admin_token, get_current_token, revoke_token, TokenCache
+from app.core.rate_limit import RateLimiter
+from fastapi.security import HTTPAuthorizationCredentials
 
 # Mock tokens using SimpleNamespace for attribute-style access
 MOCK_ADMIN_TOKEN = SimpleNamespace(
     token="admin_token_123",
     name="Admin User",
     isAdmin=True,
+    rateLimit=None,
+    burst=None,
+    dailyQuota=None,
     createdAt="2023-01-01T00:00:00"
 )
 
@@ -17,9 +22,23 @@ MOCK_REGULAR_TOKEN = SimpleNamespace(
     token="user_token_456",
     name="Regular User",
     isAdmin=False,
+    rateLimit=None,
+    burst=None,
+    dailyQuota=None,
     createdAt="2023-01-01T00:00:00"
 )
 
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    TokenCache.clear()
+    RateLimiter.clear()
+    yield
+    TokenCache.clear()
+    RateLimiter.clear()
+
+def bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
 @pytest.mark.asyncio
 @patch('app.core.auth.get_token')
 async def test_get_admin_token_valid(mock_get_token):
@@ -40,3 +59,44 @@ async def test_get_admin_token_non_admin(mock_get_token):
 
     assert excinfo.value.status_code == 403
     assert excinfo.value.detail == "Admin privileges required"
+
+@pytest.mark.asyncio
+@patch('app.core.auth.get_token')
+async def test_token_lookups_are_cached(mock_get_token):
+    """Test that auth and admin checks share one database lookup"""
+    mock_get_token.return_value = MOCK_ADMIN_TOKEN
+
+    token = await get_current_token(bearer("admin_token_123"))
+    await get_admin_token(token)
+    await get_current_token(bearer("admin_token_123"))
+
+    assert mock_get_token.call_count == 1
+
+@pytest.mark.asyncio
+@patch('app.core.auth.get_token')
+async def test_invalid_tokens_are_negatively_cached(mock_get_token):
+    """Test that repeated unknown tokens don't hit the database every time"""
+    mock_get_token.return_value = None
+
+    for _ in range(3):
+        with pytest.raises(HTTPException) as excinfo:
+            await get_current_token(bearer("unknown"))
+        assert excinfo.value.status_code == 401
+
+    assert mock_get_token.call_count == 1
+
+@pytest.mark.asyncio
+@patch('app.core.auth.delete_token')
+@patch('app.core.auth.get_token')
+async def test_revoked_token_is_rejected_immediately(mock_get_token, mock_delete_token):
+    """Test that deleting a token invalidates the cached entry"""
+    mock_get_token.return_value = MOCK_REGULAR_TOKEN
+    mock_delete_token.return_value = True
+    await get_current_token(bearer("user_token_456"))
+
+    assert await revoke_token("user_token_456")
+    mock_get_token.return_value = None
+
+    with pytest.raises(HTTPException) as excinfo:
+        await get_current_token(bearer("user_token_456"))
+    assert excinfo.value.status_code == 401
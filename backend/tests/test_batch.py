@@ -0,0 +1,75 @@
+import io
+import json
+import zipfile
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+
+from app.main import app
+from app.core.auth import get_current_token, get_token_policy
+from app.services.batch import moderate_batch
+from app.services.upload import ImageUpload
+from benchmarks.fake_sightengine import SAFE_RESPONSE
+
+UNSAFE_RESPONSE = {**SAFE_RESPONSE, "weapon": {"classes": {"firearm": 0.9, "knife": 0.01}}}
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def authenticated():
+    app.dependency_overrides[get_current_token] = lambda: "user_token_456"
+    app.dependency_overrides[get_token_policy] = lambda: None
+    yield
+    app.dependency_overrides.clear()
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+@patch('app.api.endpoints.charge_calls', new_callable=AsyncMock)
+@patch('app.api.endpoints.log_api_usages', new_callable=AsyncMock)
+@patch('app.services.batch.find_result', new_callable=AsyncMock)
+def test_batch_dedupes_and_streams_ndjson(mock_moderate, mock_log, mock_charge):
+    """Test that archives are unpacked, duplicates moderated once and usage logged in bulk"""
+    mock_moderate.side_effect = lambda content, filename, use_cache, policy: (
+        UNSAFE_RESPONSE if content == b"bad" else SAFE_RESPONSE, None
+    )
+
+    response = client.post("/api/moderate/batch", files=[
+        ("files", ("a.png", b"good", "image/png")),
+        ("files", ("b.png", b"good", "image/png")),
+        ("files", ("images.zip", make_zip({"dir/c.png": b"bad"}), "application/zip")),
+    ])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    items = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda item: item["index"])
+    assert [item["filename"] for item in items] == ["a.png", "b.png", "c.png"]
+    assert [item["result"]["is_safe"] for item in items] == [True, True, False]
+    assert mock_moderate.await_count == 2
+    mock_log.assert_awaited_once_with("user_token_456", "/moderate/batch", 3)
+    mock_charge.assert_awaited_once_with("user_token_456", 3)
+
+
+@pytest.mark.asyncio
+@patch('app.services.batch.find_result', new_callable=AsyncMock)
+async def test_batch_reports_errors_per_image(mock_moderate):
+    """Test that one failing image does not fail the rest of the batch"""
+    async def moderate(content, filename, use_cache, policy):
+        if content == b"broken":
+            raise HTTPException(status_code=500, detail="Error processing image: boom")
+        return SAFE_RESPONSE, None
+    mock_moderate.side_effect = moderate
+
+    uploads = [ImageUpload("ok.png", "image/png", b"ok"), ImageUpload("broken.png", "image/png", b"broken")]
+    items = {item["filename"]: item async for item in moderate_batch(uploads)}
+
+    assert items["ok.png"]["result"]["is_safe"] is True
+    assert items["broken.png"]["error"] == {"status_code": 500, "detail": "Error processing image: boom"}
@@ -0,0 +1,158 @@
+import pytest
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+from unittest.mock import patch, AsyncMock
+
+from app.main import app
+from app.core.auth import get_current_token, get_token_policy
+from app.db.mongodb import MongoDB
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, UpstreamUnavailable
+from app.services.jobs import JobWorker
+from app.services.providers import ProviderRouter, SightEngineProvider
+from app.services.sightengine import SightEngineClient, API_URL
+from benchmarks.fake_sightengine import create_app
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\nimage-bytes"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    breaker = CircuitBreaker("SightEngine", failure_threshold=2, reset_timeout=30, clock=clock)
+    with patch.dict(SightEngineClient.breakers, {API_URL: breaker}, clear=True):
+        yield clock
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.MAX_RETRIES', 0)
+async def test_open_circuit_fails_fast(clock):
+    """Test that after repeated failures calls are refused without reaching the upstream"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503, json={"status": "failure"})
+
+    await SightEngineClient.start(transport=httpx.MockTransport(handler))
+    try:
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailable):
+                await SightEngineClient.check(b"image-bytes", "test.png")
+        with pytest.raises(CircuitOpenError) as exc_info:
+            await SightEngineClient.check(b"image-bytes", "test.png")
+    finally:
+        await SightEngineClient.close()
+
+    assert len(calls) == 2
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "30"
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.MAX_RETRIES', 0)
+async def test_half_open_probe_closes_or_reopens(clock):
+    """Test that one probe is let through after the timeout and its outcome decides the state"""
+    responses = [503, 503, 503, 200]
+
+    def handler(request):
+        return httpx.Response(responses.pop(0), json={"status": "success"})
+
+    await SightEngineClient.start(transport=httpx.MockTransport(handler))
+    try:
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailable):
+                await SightEngineClient.check(b"image-bytes", "test.png")
+        assert SightEngineClient.breaker().state == "open"
+
+        clock.now += 30
+        with pytest.raises(UpstreamUnavailable):
+            await SightEngineClient.check(b"image-bytes", "test.png")
+        assert SightEngineClient.breaker().state == "open"
+
+        clock.now += 30
+        await SightEngineClient.check(b"image-bytes", "test.png")
+        assert SightEngineClient.breaker().state == "closed"
+    finally:
+        await SightEngineClient.close()
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.MAX_RETRIES', 0)
+@patch('app.services.jobs.DEGRADED_MODE', True)
+@patch('app.services.near_duplicates.NearDuplicateIndex.enabled', False)
+@patch('app.api.endpoints.log_api_usage', new_callable=AsyncMock)
+async def test_degraded_mode_queues_until_upstream_recovers(mock_log, clock):
+    """Test that an outage turns /moderate into a 202 job that completes once the upstream is back"""
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    upstream = create_app(latency_ms=0, error_rate=1)
+    app.dependency_overrides[get_current_token] = lambda: "user_token_456"
+    app.dependency_overrides[get_token_policy] = lambda: None
+    await SightEngineClient.start(transport=httpx.ASGITransport(app=upstream))
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            statuses = []
+            for _ in range(3):
+                response = await client.post(
+                    "/api/moderate", files={"file": ("cat.png", PNG_BYTES, "image/png")},
+                    headers={"Cache-Control": "no-cache"}
+                )
+                statuses.append(response.status_code)
+            # Queued from the first failed check on, not only once the circuit opens
+            assert statuses == [202, 202, 202]
+            assert SightEngineClient.breaker().state == "open"
+            job_id = response.json()["job_id"]
+            assert response.headers["Location"] == f"/api/moderate/jobs/{job_id}"
+
+            upstream.state.error_rate = 0
+            clock.now += 30
+            while await JobWorker.process_next():
+                pass
+
+            response = await client.get(f"/api/moderate/jobs/{job_id}")
+    finally:
+        await SightEngineClient.close()
+        app.dependency_overrides.clear()
+
+    job = response.json()
+    assert job["status"] == "done"
+    assert job["result"]["is_safe"] is True
+    assert upstream.state.calls == 3
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.MAX_RETRIES', 0)
+@patch('app.services.providers.HEDGE_ENABLED', True)
+async def test_failing_endpoint_does_not_open_the_backup_circuit(clock):
+    """Test that each endpoint has its own circuit, so calls keep failing over to a healthy backup"""
+    backup_url = "https://backup.example/check.json"
+
+    def handler(request):
+        if str(request.url) == API_URL:
+            return httpx.Response(503, json={"status": "failure"})
+        return httpx.Response(200, json={"status": "success"})
+
+    providers = ProviderRouter.providers
+    ProviderRouter.configure([SightEngineProvider(), SightEngineProvider(backup_url)])
+    await SightEngineClient.start(transport=httpx.MockTransport(handler))
+    try:
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailable):
+                await SightEngineClient.check(b"image-bytes", "test.png")
+        assert SightEngineClient.breaker().state == "open"
+        result = await ProviderRouter.check_models(b"image-bytes", "test.png", ["weapon"])
+        # Job workers keep going while one endpoint still takes calls
+        assert ProviderRouter.retry_after() == 0
+    finally:
+        await SightEngineClient.close()
+        ProviderRouter.configure(providers)
+
+    assert result["status"] == "success"
+    assert SightEngineClient.breaker(backup_url).state == "closed"
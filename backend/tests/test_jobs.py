@@ -0,0 +1,155 @@
+import asyncio
+import json
+import pytest
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+from unittest.mock import patch, AsyncMock
+
+from app.main import app
+from app.core.auth import get_admin_token, get_current_token, get_token_policy, TokenCache
+from app.db.mongodb import MongoDB
+from app.models.job import create_job, claim_job, finish_job, get_job
+from app.models.token import create_token, update_token_webhook
+from app.schemas.token import TokenCreate, TokenWebhook
+from app.services.circuit_breaker import UpstreamUnavailable
+from app.services.jobs import JobWorker
+from app.services.sightengine import SightEngineClient
+from app.services.webhooks import WebhookSender
+from benchmarks.fake_sightengine import SAFE_RESPONSE
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\nimage-bytes"
+
+
+@pytest.fixture(autouse=True)
+def database():
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    yield
+    TokenCache.clear()
+
+
+@pytest.mark.asyncio
+@patch('app.services.near_duplicates.NearDuplicateIndex.enabled', False)
+@patch('app.services.webhooks.resolve', new_callable=AsyncMock, return_value=["93.184.216.34"])
+@patch('app.api.endpoints.log_api_usage', new_callable=AsyncMock)
+async def test_async_job_result_is_pushed_to_webhook(mock_log, mock_resolve):
+    """Test that /moderate/async answers 202 and a worker later POSTs the result to the token's webhook"""
+    owner = await create_token(TokenCreate(isAdmin=False))
+    await update_token_webhook(owner.token, TokenWebhook(webhookUrl="https://hooks.example.com/moderation"))
+    app.dependency_overrides[get_current_token] = lambda: owner.token
+    app.dependency_overrides[get_token_policy] = lambda: None
+    deliveries = []
+
+    def webhook(request):
+        deliveries.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    await SightEngineClient.start(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=SAFE_RESPONSE)))
+    await WebhookSender.start(transport=httpx.MockTransport(webhook))
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/moderate/async", files={"file": ("cat.png", PNG_BYTES, "image/png")})
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            assert (await client.get(f"/api/moderate/jobs/{job_id}")).json()["status"] == "queued"
+
+            assert await JobWorker.process_next()
+            job = (await client.get(f"/api/moderate/jobs/{job_id}")).json()
+    finally:
+        await SightEngineClient.close()
+        await WebhookSender.close()
+        app.dependency_overrides.clear()
+
+    assert job["status"] == "done"
+    assert job["webhookDelivered"] is True
+    assert deliveries == [{**deliveries[0], "id": job_id, "status": "done"}]
+    assert deliveries[0]["result"]["is_safe"] is True
+
+
+@pytest.mark.asyncio
+@patch('app.api.endpoints.log_api_usage', new_callable=AsyncMock)
+async def test_webhooks_never_reach_internal_hosts(mock_log):
+    """Test that private/loopback webhook URLs are refused when set and again before each delivery"""
+    owner = await create_token(TokenCreate(isAdmin=False))
+    app.dependency_overrides[get_admin_token] = lambda: "admin_token"
+    deliveries = []
+    await WebhookSender.start(transport=httpx.MockTransport(lambda request: deliveries.append(request) or httpx.Response(204)))
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            statuses = [
+                (await client.put(f"/api/auth/tokens/{owner.token}/webhook", json={"webhookUrl": url})).status_code
+                for url in ("https://127.0.0.1/hook", "https://169.254.169.254/latest", "http://hooks.example.com/")
+            ]
+        with patch('app.services.webhooks.resolve', new_callable=AsyncMock, return_value=["10.0.0.7"]):
+            delivered = await WebhookSender.send("https://internal.example.com/hook", {"id": "job"})
+    finally:
+        await WebhookSender.close()
+        app.dependency_overrides.clear()
+
+    assert statuses == [400, 400, 400]
+    assert delivered is False and deliveries == []
+
+
+@pytest.mark.asyncio
+@patch('app.services.webhooks.resolve', new_callable=AsyncMock, return_value=["93.184.216.34"])
+async def test_webhook_connects_to_the_checked_address(mock_resolve):
+    """Test that delivery goes to the address that passed the check, not a second lookup"""
+    deliveries = []
+    await WebhookSender.start(transport=httpx.MockTransport(lambda request: deliveries.append(request) or httpx.Response(204)))
+    try:
+        assert await WebhookSender.send("https://hooks.example.com:8443/hook", {"id": "job"})
+    finally:
+        await WebhookSender.close()
+
+    request = deliveries[0]
+    assert request.url == "https://93.184.216.34:8443/hook"
+    assert request.headers["Host"] == "hooks.example.com:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+
+
+@pytest.mark.asyncio
+@patch('app.services.jobs.JOB_POLL_INTERVAL', 0)
+@patch('app.services.jobs.ProviderRouter.retry_after', return_value=0)
+async def test_worker_keeps_running_after_an_unexpected_error(mock_retry_after):
+    """Test that an error other than MongoDB's is logged and the worker moves on to the next job"""
+    with patch.object(JobWorker, 'process_next', new_callable=AsyncMock,
+                      side_effect=[KeyError("content"), True, asyncio.CancelledError()]) as mock_process:
+        with pytest.raises(asyncio.CancelledError):
+            await JobWorker._run()
+    assert mock_process.await_count == 3
+
+
+@pytest.mark.asyncio
+@patch('app.services.jobs.moderate_image', new_callable=AsyncMock, return_value={
+    "is_safe": True, "message": "Image is safe", "details": {"violations": []}
+})
+async def test_crashed_workers_job_is_picked_up_again(mock_moderate):
+    """Test that a job whose lease ran out is claimed again and the stale worker can't overwrite it"""
+    job = await create_job("user_token_456", "cat.png", PNG_BYTES)
+    stale = await claim_job(lease_seconds=-1)
+
+    with patch('app.services.jobs.JOB_LEASE_SECONDS', 60):
+        assert await JobWorker.process_next()
+
+    assert not await finish_job(job.id, stale["leaseId"], error="late")
+    finished = await get_job(job.id)
+    assert finished.status == "done"
+    assert finished.attempts == 2
+    assert mock_moderate.await_args.args == (PNG_BYTES, "cat.png")
+
+
+@pytest.mark.asyncio
+@patch('app.services.jobs.JOB_MAX_ATTEMPTS', 2)
+@patch('app.services.jobs.JOB_RETRY_DELAY', -1)
+@patch('app.services.jobs.moderate_image', new_callable=AsyncMock, side_effect=UpstreamUnavailable())
+async def test_transient_failures_are_retried_then_given_up(mock_moderate):
+    """Test that upstream failures put the job back until its attempts run out"""
+    job = await create_job("user_token_456", "cat.png", PNG_BYTES)
+
+    assert await JobWorker.process_next()
+    assert (await get_job(job.id)).status == "queued"
+    assert await JobWorker.process_next()
+
+    finished = await get_job(job.id)
+    assert finished.status == "failed"
+    assert finished.attempts == 2
+    assert not await JobWorker.process_next()
@@ -0,0 +1,97 @@
+import asyncio
+import httpx
+import os
+import pytest
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock
+
+from app.main import app
+from app.core.metrics import MongoCommandMetrics
+from app.services.moderation import moderate_image
+from app.services.sightengine import SightEngineClient
+from benchmarks.fake_sightengine import SAFE_RESPONSE
+from benchmarks.stubs import png_bytes
+
+client = TestClient(app)
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_timed_by_route_template():
+    """Test that /metrics reports request latency labelled by route, not by raw path"""
+    client.get("/api/moderate/jobs/some-job-id")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert 'route="/api/moderate/jobs/{job_id}"' in response.text
+    assert "some-job-id" not in response.text
+
+
+@pytest.mark.asyncio
+@patch('app.services.near_duplicates.NearDuplicateIndex.enabled', False)
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock, return_value=SAFE_RESPONSE)
+async def test_moderation_stages_are_timed(mock_check):
+    """Test that each stage of an uncached moderation lands in the stage histogram"""
+    stages = ("sniff", "cache", "preprocess", "upstream", "verdict")
+    before = {name: sample("moderation_stage_duration_seconds_count", stage=name) for name in stages}
+
+    await moderate_image(png_bytes(seed=17), "noise.png", use_cache=False)
+
+    for name in stages:
+        assert sample("moderation_stage_duration_seconds_count", stage=name) == before[name] + 1
+
+
+def test_mongo_commands_are_timed_by_collection():
+    """Test that the command listener labels latency with the collection the command ran on"""
+    listener = MongoCommandMetrics()
+    before = sample("mongodb_command_duration_seconds_count", collection="tokens", command="find")
+
+    listener.started(SimpleNamespace(request_id=1, command_name="find", command={"find": "tokens"}))
+    listener.succeeded(SimpleNamespace(request_id=1, command_name="find", duration_micros=1500))
+
+    assert sample("mongodb_command_duration_seconds_count", collection="tokens", command="find") == before + 1
+    assert not listener.collections
+
+
+@pytest.mark.asyncio
+async def test_cancelled_upstream_calls_leave_the_in_flight_gauge():
+    """Test that upstream calls cancelled mid-request (e.g. hedges that lost) are no longer counted"""
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    await SightEngineClient.start(transport=httpx.MockTransport(hang))
+    try:
+        for _ in range(5):
+            call = asyncio.ensure_future(SightEngineClient.check(b"image-bytes", "test.png"))
+            await asyncio.sleep(0.01)
+            assert sample("sightengine_requests_in_flight") == 1
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+    finally:
+        await SightEngineClient.close()
+
+    assert sample("sightengine_requests_in_flight") == 0
+
+
+def test_in_flight_gauges_are_summed_in_multiprocess_mode(tmp_path):
+    """Test that in-flight gauges report live counts when workers share PROMETHEUS_MULTIPROC_DIR"""
+    # Multiprocess mode is chosen when the first metric is created, so it needs a fresh interpreter
+    script = (
+        "from app.core.metrics import UPSTREAM_IN_FLIGHT, render_metrics\n"
+        "UPSTREAM_IN_FLIGHT.inc(); UPSTREAM_IN_FLIGHT.inc(); UPSTREAM_IN_FLIGHT.dec()\n"
+        "print(render_metrics()[0].decode())\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True,
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    ).stdout
+
+    assert "sightengine_requests_in_flight 1.0" in output
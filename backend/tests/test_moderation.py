@@ -1,17 +1,21 @@
 import pytest
 from fastapi.testclient import TestClient
-from fastapi import UploadFile
 import io
 import os
 import sys
-from unittest.mock import patch, MagicMock
-from PIL import Image
+from unittest.mock import patch, AsyncMock
+from mongomock_motor import AsyncMongoMockClient
+from PIL import Image, ImageDraw
 
 # Add the parent directory to sys.path to import app modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from app.db.mongodb import MongoDB
 from app.main import app
+from app.models.moderation_cache import get_moderation_cache_collection
 from app.services.moderation import moderate_image
+from app.services.result_cache import ModerationCache
+from app.services.near_duplicates import NearDuplicateIndex
 
 client = TestClient(app)
 
@@ -42,6 +46,15 @@ MOCK_UNSAFE_RESPONSE = {
     "self-harm": {"prob": 0.01}
 }
 
+@pytest.fixture(autouse=True)
+def empty_cache():
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+    with patch('app.services.near_duplicates.store_phash_result', new_callable=AsyncMock):
+        yield
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+
 def create_test_image():
     """Create a simple test image in memory"""
     file = io.BytesIO()
@@ -52,25 +65,17 @@ def create_test_image():
     return file
 
 @pytest.mark.asyncio
-@patch('app.services.moderation.requests.post')
-@patch('app.services.moderation.magic.Magic')
-async def test_moderate_safe_image(mock_magic, mock_post):
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_moderate_safe_image(mock_check):
     """Test that safe images are correctly identified"""
     # Setup mocks
-    mock_magic_instance = MagicMock()
-    mock_magic_instance.from_buffer.return_value = 'image/png'
-    mock_magic.return_value = mock_magic_instance
-    
-    mock_response = MagicMock()
-    mock_response.text = '{"status": "success", "nudity": {"sexual_activity": 0.01, "sexual_display": 0.01, "erotica": 0.01, "suggestive": 0.01}, "weapon": {"classes": {"firearm": 0.01, "knife": 0.01}}, "alcohol": {"prob": 0.01}, "recreational_drug": {"prob": 0.01}, "offensive": {"nazi": 0.01, "supremacist": 0.01, "terrorist": 0.01}, "gore": {"prob": 0.01}, "tobacco": {"prob": 0.01}, "violence": {"prob": 0.01}, "self-harm": {"prob": 0.01}}'
-    mock_post.return_value = mock_response
+    mock_check.return_value = MOCK_SAFE_RESPONSE
     
     # Create test file
     test_file = create_test_image()
-    file = UploadFile(filename="test.png", file=test_file)
     
     # Call the function
-    result = await moderate_image(file)
+    result = await moderate_image(test_file.read(), "test.png")
     
     # Assertions
     assert result["is_safe"] == True
@@ -79,28 +84,85 @@ async def test_moderate_safe_image(mock_magic, mock_post):
     assert len(result["details"]["violations"]) == 0
 
 @pytest.mark.asyncio
-@patch('app.services.moderation.requests.post')
-@patch('app.services.moderation.magic.Magic')
-async def test_moderate_unsafe_image(mock_magic, mock_post):
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_moderate_unsafe_image(mock_check):
     """Test that unsafe images are correctly identified"""
     # Setup mocks
-    mock_magic_instance = MagicMock()
-    mock_magic_instance.from_buffer.return_value = 'image/png'
-    mock_magic.return_value = mock_magic_instance
-    
-    mock_response = MagicMock()
-    mock_response.text = '{"status": "success", "nudity": {"sexual_activity": 0.01, "sexual_display": 0.01, "erotica": 0.01, "suggestive": 0.01}, "weapon": {"classes": {"firearm": 0.9, "knife": 0.01}}, "alcohol": {"prob": 0.01}, "recreational_drug": {"prob": 0.01}, "offensive": {"nazi": 0.01, "supremacist": 0.01, "terrorist": 0.01}, "gore": {"prob": 0.01}, "tobacco": {"prob": 0.01}, "violence": {"prob": 0.01}, "self-harm": {"prob": 0.01}}'
-    mock_post.return_value = mock_response
+    mock_check.return_value = MOCK_UNSAFE_RESPONSE
     
     # Create test file
     test_file = create_test_image()
-    file = UploadFile(filename="test.png", file=test_file)
     
     # Call the function
-    result = await moderate_image(file)
+    result = await moderate_image(test_file.read(), "test.png")
     
     # Assertions
     assert result["is_safe"] == False
     assert result["message"] == "Image contains inappropriate content"
     assert "violations" in result["details"]
-    assert "weapon" in result["details"]["violations"] 
\ No newline at end of file
+    assert "weapon" in result["details"]["violations"]
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_duplicate_image_is_served_from_cache(mock_check):
+    """Test that identical uploads only reach SightEngine once"""
+    mock_check.return_value = MOCK_UNSAFE_RESPONSE
+    content = create_test_image().read()
+
+    first = await moderate_image(content, "test.png")
+    second = await moderate_image(content, "copy.png")
+
+    assert mock_check.await_count == 1
+    assert second["details"]["violations"] == first["details"]["violations"] == ["weapon"]
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_cache_bypass_calls_upstream(mock_check):
+    """Test that use_cache=False always asks SightEngine and refreshes the cache"""
+    content = create_test_image().read()
+
+    mock_check.return_value = MOCK_UNSAFE_RESPONSE
+    await moderate_image(content, "test.png")
+    mock_check.return_value = MOCK_SAFE_RESPONSE
+    result = await moderate_image(content, "test.png", use_cache=False)
+
+    assert mock_check.await_count == 2
+    assert result["is_safe"] == True
+    assert (await moderate_image(content, "test.png"))["is_safe"] == True
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_reencoded_image_is_served_from_near_duplicate_index(mock_check):
+    """Test that a resized JPEG copy of a moderated image skips SightEngine"""
+    mock_check.return_value = MOCK_UNSAFE_RESPONSE
+    image = Image.new('RGB', (400, 300), (30, 120, 200))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((50, 40, 250, 260), fill=(240, 200, 20))
+    draw.rectangle((260, 100, 380, 280), fill=(10, 10, 10))
+    original, copy = io.BytesIO(), io.BytesIO()
+    image.save(original, 'png')
+    image.resize((200, 150)).save(copy, 'jpeg', quality=60)
+
+    await moderate_image(original.getvalue(), "original.png")
+    result = await moderate_image(copy.getvalue(), "copy.jpg")
+
+    assert mock_check.await_count == 1
+    assert result["details"]["violations"] == ["weapon"]
+
+
+@pytest.mark.asyncio
+@patch('app.services.result_cache.CACHE_SHARED', True)
+@patch('app.services.result_cache.CACHE_TTL', 600)
+async def test_changed_cache_ttl_updates_the_shared_cache_index():
+    """Test that startup changes a TTL index built with another MODERATION_CACHE_TTL instead of failing"""
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    try:
+        await get_moderation_cache_collection().create_index("createdAt", expireAfterSeconds=86400)
+        with patch.object(MongoDB.db, "command", new_callable=AsyncMock) as command:
+            await ModerationCache.start()
+    finally:
+        MongoDB.db = None
+
+    command.assert_awaited_once_with(
+        "collMod", "moderation_cache", index={"keyPattern": {"createdAt": 1}, "expireAfterSeconds": 600}
+    )
@@ -0,0 +1,115 @@
+import io
+import random
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockClient
+from unittest.mock import patch, AsyncMock
+from PIL import Image, ImageDraw
+
+from app.db.mongodb import MongoDB
+from app.models.phash_index import get_phash_collection, to_signed
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.phash import MultiIndexHash, dhash
+from app.services.result_cache import CACHE_TTL, MODELS_FINGERPRINT
+
+RESULT = {"status": "success", "weapon": {"classes": {"firearm": 0.9}}}
+
+
+@pytest_asyncio.fixture
+async def database():
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    NearDuplicateIndex.clear()
+    yield MongoDB.db
+    NearDuplicateIndex.clear()
+    MongoDB.db = None
+
+
+def encode(image, fmt, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def test_dhash_survives_resize_and_recompression():
+    """Test that re-encoded copies of an image hash within a few bits"""
+    image = Image.new('RGB', (400, 300), (30, 120, 200))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((50, 40, 250, 260), fill=(240, 200, 20))
+    draw.rectangle((260, 100, 380, 280), fill=(10, 10, 10))
+
+    original = dhash(encode(image, 'png'))
+    copy = dhash(encode(image.resize((200, 150)), 'jpeg', quality=50))
+
+    assert (original ^ copy).bit_count() <= 4
+
+
+def test_multi_index_hash_finds_neighbours_within_distance():
+    """Test that lookups return the nearest stored hash within the radius only"""
+    rng = random.Random(0)
+    index = MultiIndexHash(max_distance=4)
+    stored = [rng.getrandbits(64) for _ in range(10000)]
+    for value in stored:
+        index.add(value)
+
+    target = stored[1234]
+    near = target ^ (1 << 3) ^ (1 << 40) ^ (1 << 63)
+    far = target ^ sum(1 << bit for bit in range(0, 60, 6))
+
+    assert index.search(near) == (target, 3)
+    assert index.search(target) == (target, 0)
+    assert index.search(far) is None or index.search(far)[0] != target
+
+
+def test_multi_index_hash_forgets_removed_hashes():
+    """Test that a removed hash is no longer found, and its neighbours still are"""
+    index = MultiIndexHash(max_distance=4)
+    index.add(0x0F0F0F0F0F0F0F0F)
+    index.add(0x0F0F0F0F0F0F0F0E)
+    index.remove(0x0F0F0F0F0F0F0F0F)
+
+    assert len(index) == 1
+    assert index.search(0x0F0F0F0F0F0F0F0F) == (0x0F0F0F0F0F0F0F0E, 1)
+
+
+@pytest.mark.asyncio
+async def test_near_duplicates_only_match_fresh_results_of_the_current_models(database):
+    """Test that results of other models or older than the cache TTL are neither loaded nor served"""
+    now = datetime.utcnow()
+    current, other_models, expired = 0x00FF00FF00FF00FF, 0x0F0F0F0F0F0F0F0F, 0x3333333333333333
+    await get_phash_collection().insert_many([
+        {"models": MODELS_FINGERPRINT, "phash": to_signed(current), "result": RESULT, "createdAt": now},
+        {"models": "other", "phash": to_signed(other_models), "result": RESULT, "createdAt": now},
+        {"models": MODELS_FINGERPRINT, "phash": to_signed(expired), "result": RESULT,
+         "createdAt": now - timedelta(seconds=CACHE_TTL + 1)},
+    ])
+
+    await NearDuplicateIndex.start()
+
+    assert NearDuplicateIndex.stats()["size"] == 1
+    assert await NearDuplicateIndex.lookup(current ^ 1) == RESULT
+    assert await NearDuplicateIndex.lookup(other_models) is None
+    assert await NearDuplicateIndex.lookup(expired) is None
+
+    # Indexed before it expired: the stale match is dropped on lookup
+    NearDuplicateIndex.index.add(expired)
+    assert await NearDuplicateIndex.lookup(expired) is None
+    assert NearDuplicateIndex.stats()["size"] == 1
+
+
+@pytest.mark.asyncio
+async def test_changed_cache_ttl_updates_the_index_instead_of_failing_startup(database):
+    """Test that a TTL index built with another MODERATION_CACHE_TTL is changed in place with collMod"""
+    await get_phash_collection().create_index("createdAt", expireAfterSeconds=CACHE_TTL + 60)
+    # Written before entries were keyed by models
+    await get_phash_collection().insert_many([
+        {"_id": to_signed(phash), "result": RESULT, "createdAt": datetime.utcnow()} for phash in (1, 2)
+    ])
+
+    with patch.object(database, "command", new_callable=AsyncMock) as command:
+        await NearDuplicateIndex.start()
+
+    command.assert_awaited_once_with(
+        "collMod", "phash_index", index={"keyPattern": {"createdAt": 1}, "expireAfterSeconds": CACHE_TTL}
+    )
+    assert NearDuplicateIndex.stats()["size"] == 0
@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import pytest
+from fastapi import HTTPException
+from unittest.mock import patch, AsyncMock
+
+from app.services.moderation import analyze_result, moderate_image
+from app.services.policy import PolicyEngine, compile_policy, load_policies, DEFAULT_POLICY_NAME
+from benchmarks.stubs import png_bytes
+
+SAFE = {
+    "status": "success",
+    "nudity": {"sexual_activity": 0.01, "sexual_display": 0.01, "erotica": 0.01, "suggestive": 0.01},
+    "weapon": {"classes": {"firearm": 0.01, "knife": 0.01}},
+    "alcohol": {"prob": 0.2},
+    "gore": {"prob": 0.01},
+}
+
+KIDS_POLICY = {"policies": {"kids": {
+    "alcohol": {"scores": ["alcohol.prob"], "threshold": 0.1},
+    "weapon": {"scores": ["weapon.classes.firearm", "weapon.classes.knife"], "threshold": 0.1},
+}}}
+
+
+@pytest.fixture(autouse=True)
+def restore_policies():
+    policies, mtime, reported = PolicyEngine.policies, PolicyEngine.mtime, PolicyEngine.reported
+    yield
+    PolicyEngine.policies, PolicyEngine.mtime, PolicyEngine.reported = policies, mtime, reported
+
+
+def test_default_policy_keeps_strict_thresholds_and_order():
+    """Test that scores must exceed 0.5, missing scores count as 0 and violations keep their order"""
+    at_threshold = {**SAFE, "weapon": {"classes": {"firearm": 0.5}}}
+    unsafe = {**SAFE, "gore": {"prob": 0.8}, "nudity": {"suggestive": 0.9}, "weapon": None}
+
+    assert analyze_result(at_threshold)["is_safe"] is True
+    result = analyze_result(unsafe)
+    assert result["details"]["violations"] == ["nudity", "gore"]
+    assert result["details"]["margins"]["gore"] == pytest.approx(0.3)
+    assert result["details"]["policy"] == DEFAULT_POLICY_NAME
+
+
+def test_batch_evaluation_with_combinators():
+    """Test that a batch is evaluated in one call and 'all'/'sum' combine scores as documented"""
+    policy = compile_policy("custom", {
+        "both": {"scores": ["a", "b"], "threshold": 0.5, "combine": "all"},
+        "total": {"scores": ["a", "b"], "threshold": 1.0, "combine": "sum"},
+    })
+
+    responses = [{"a": 0.6, "b": 0.6}, {"a": 0.9, "b": 0.2}, {}, {"a": "high", "b": True}]
+    violations, margins = policy.evaluate(responses)
+
+    assert violations.tolist() == [[True, True], [False, True], [False, False], [False, False]]
+    assert margins[1].tolist() == pytest.approx([-0.3, 0.1])
+    # The batch and the one-at-a-time paths agree exactly, rounding included
+    assert policy.verdicts(responses) == [policy.verdict(response) for response in responses]
+    assert [policy.violations(response) for response in responses] == [["both", "total"], ["total"], [], []]
+    with pytest.raises(ValueError):
+        compile_policy("broken", {"both": {"scores": ["a"], "threshold": 0.5, "combine": "xor"}})
+
+
+def test_policy_file_is_hot_reloaded(tmp_path):
+    """Test that per-token policies come from a file that is re-read when it changes"""
+    policy_file = tmp_path / "policies.json"
+    policy_file.write_text(json.dumps(KIDS_POLICY))
+
+    with patch('app.services.policy.MODERATION_POLICY_FILE', str(policy_file)):
+        assert PolicyEngine.reload()
+        assert analyze_result(SAFE, "kids")["details"]["violations"] == ["alcohol"]
+        assert analyze_result(SAFE)["is_safe"] is True
+
+        # A broken edit is refused and the last good policies stay active
+        policy_file.write_text("{not json")
+        os.utime(policy_file, (0, PolicyEngine.mtime + 1))
+        with pytest.raises(ValueError):
+            PolicyEngine.reload()
+        assert "kids" in PolicyEngine.policies
+
+
+@pytest.mark.parametrize("threshold", ["Infinity", "-Infinity", "NaN"])
+def test_policy_file_with_non_finite_threshold_is_refused(tmp_path, threshold):
+    """Test that thresholds json.load accepts but no score can be compared against are refused"""
+    policy_file = tmp_path / "policies.json"
+    policy_file.write_text(
+        '{"policies": {"open": {"weapon": {"scores": ["weapon.classes.firearm"], "threshold": %s}}}}' % threshold
+    )
+
+    with pytest.raises(ValueError, match="finite"):
+        load_policies(str(policy_file))
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_unknown_policy_is_rejected_not_replaced_by_the_default(mock_check, caplog):
+    """Test that a policy missing after a reload fails the request, and is logged only once"""
+    with caplog.at_level(logging.WARNING, logger="app.services.policy"):
+        for _ in range(3):
+            with pytest.raises(HTTPException) as exc_info:
+                await moderate_image(png_bytes(), "cat.png", policy="removed")
+
+    assert exc_info.value.status_code == 400
+    assert len(caplog.records) == 1
+    mock_check.assert_not_awaited()
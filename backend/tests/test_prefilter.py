@@ -0,0 +1,69 @@
+import io
+import random
+import numpy as np
+import pytest
+import pytest_asyncio
+from unittest.mock import patch, AsyncMock
+from PIL import Image
+
+from app.services.moderation import moderate_image
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.policy import DEFAULT_POLICY, compile_policy
+from app.services.prefilter import Prefilter, FEATURE_NAMES, score_image
+from app.services.result_cache import ModerationCache
+
+SAFE_RESPONSE = {"status": "success", "weapon": {"classes": {"firearm": 0.01}}}
+
+
+def png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue()
+
+
+def noise(size=(120, 90), seed=0) -> bytes:
+    rng = random.Random(seed)
+    return png(Image.frombytes("RGB", size, bytes(rng.getrandbits(8) for _ in range(size[0] * size[1] * 3))))
+
+
+@pytest_asyncio.fixture
+async def prefilter():
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+    Prefilter.clear()
+    with patch('app.services.prefilter.PREFILTER_ENABLED', True), \
+            patch('app.services.prefilter.PREFILTER_WORKERS', 1), \
+            patch('app.services.near_duplicates.store_phash_result', new_callable=AsyncMock):
+        await Prefilter.start()
+        yield Prefilter
+        await Prefilter.close()
+    Prefilter.clear()
+
+
+def test_trivial_images_are_safe_and_the_rest_need_a_model():
+    """Test that solid and tiny images score 0 and busy images are only scored with a model"""
+    model = {"weights": np.eye(len(FEATURE_NAMES))[FEATURE_NAMES.index("edge_density")] * 5,
+             "bias": np.array(0.0), "mean": np.zeros(len(FEATURE_NAMES)), "std": np.full(len(FEATURE_NAMES), 0.1)}
+
+    assert score_image(png(Image.new("RGB", (640, 480), (30, 30, 30)))) == 0.0
+    assert score_image(noise(size=(16, 16))) == 0.0
+    assert score_image(noise()) is None
+    assert score_image(noise(), model) > 0.9
+
+
+@pytest.mark.asyncio
+@patch.dict('app.services.policy.PolicyEngine.policies', {"kids": compile_policy("kids", DEFAULT_POLICY)})
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_confident_images_skip_the_upstream(mock_check, prefilter):
+    """Test that a blank image is settled locally and an uncertain one escalates, with the rate tracked"""
+    mock_check.return_value = SAFE_RESPONSE
+
+    blank = await moderate_image(png(Image.new("RGB", (640, 480), "white")), "blank.png")
+    busy = await moderate_image(noise(), "busy.png")
+    strict = await moderate_image(png(Image.new("RGB", (640, 480), "black")), "kids.png", policy="kids", include_raw=True)
+
+    assert blank["is_safe"] and blank["details"]["prefilter_score"] == 0.0
+    assert busy["is_safe"] and "prefilter_score" not in busy["details"]
+    assert strict["details"]["content_analysis"] == SAFE_RESPONSE
+    assert mock_check.await_count == 2
+    assert prefilter.stats()["escalation_rate"] == 0.5
@@ -0,0 +1,70 @@
+import io
+import numpy as np
+import pytest
+from unittest.mock import patch, AsyncMock
+from PIL import Image
+
+from app.services.moderation import moderate_image
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.preprocess import prepare_image
+from app.services.result_cache import ModerationCache
+
+
+def encode(image: Image.Image, fmt: str, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def animated_gif(frames: int) -> bytes:
+    images = [Image.new("RGB", (200, 200), (i * 20, 0, 0)) for i in range(frames)]
+    return encode(images[0], "gif", save_all=True, append_images=images[1:])
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+    with patch('app.services.near_duplicates.store_phash_result', new_callable=AsyncMock):
+        yield
+
+
+def test_large_images_are_downscaled_and_small_ones_passed_through():
+    """Test that camera-sized uploads shrink to the max edge while small images are sent untouched"""
+    noise = np.random.default_rng(0).integers(0, 256, (1500, 2000, 3), dtype=np.uint8)
+    original = encode(Image.fromarray(noise), "jpeg", quality=95)
+    small = encode(Image.new("RGB", (300, 200), "blue"), "png")
+
+    [(name, prepared)] = prepare_image(original, "camera.JPG")
+
+    assert name == "camera.jpg"
+    assert len(prepared) < len(original) // 2
+    assert Image.open(io.BytesIO(prepared)).size == (1024, 768)
+    assert prepare_image(small, "small.png") == [("small.png", small)]
+
+
+@pytest.mark.parametrize("frame_count,expected", [(2, [0, 1]), (3, [0, 1, 2])])
+def test_short_animations_include_their_last_frame(frame_count, expected):
+    """Test that animations with no more frames than are sampled send every frame upstream"""
+    frames = prepare_image(animated_gif(frame_count), "clip.gif")
+
+    assert [name for name, _ in frames] == [f"clip-frame{index}.jpg" for index in expected]
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock)
+async def test_animation_frames_are_moderated_together(mock_check):
+    """Test that sampled frames are checked concurrently and one unsafe frame flags the animation"""
+
+    async def check(content, filename, **kwargs):
+        firearm = 0.9 if filename.endswith("frame9.jpg") else 0.01
+        return {"status": "success", "weapon": {"classes": {"firearm": firearm, "knife": 0.01}}}
+    mock_check.side_effect = check
+
+    result = await moderate_image(animated_gif(10), "clip.gif", include_raw=True)
+
+    assert sorted(call.args[1] for call in mock_check.await_args_list) == [
+        "clip-frame0.jpg", "clip-frame4.jpg", "clip-frame9.jpg"
+    ]
+    assert result["details"]["violations"] == ["weapon"]
+    assert result["details"]["content_analysis"]["frames_checked"] == 3
@@ -0,0 +1,98 @@
+import time
+import pytest
+from unittest.mock import patch
+
+from app.services.policy import DEFAULT_POLICY, compile_policy
+from app.services.providers import LocalProvider, ProviderRouter, build_providers, is_complete
+
+DEFAULT = compile_policy("default", DEFAULT_POLICY)
+LAX = compile_policy("lax", {**DEFAULT_POLICY, "nudity": {**DEFAULT_POLICY["nudity"], "threshold": 0.95}})
+
+
+class FailingProvider(LocalProvider):
+    async def check(self, content, filename, models):
+        raise ConnectionError("provider down")
+
+
+@pytest.fixture(autouse=True)
+def restore_providers():
+    providers = ProviderRouter.providers
+    yield
+    ProviderRouter.configure(providers)
+
+
+@pytest.mark.asyncio
+@patch('app.services.providers.HEDGE_DELAY_MS', 50)
+async def test_slow_primary_is_hedged_to_the_next_provider():
+    """Test that once the hedge deadline passes the faster answer from the backup wins"""
+    ProviderRouter.configure([LocalProvider(latency_ms=1000, name="slow"), LocalProvider(latency_ms=10, name="fast")])
+
+    started = time.perf_counter()
+    result = await ProviderRouter.check(b"image-bytes", "test.png")
+    elapsed = time.perf_counter() - started
+
+    assert result["provider"] == "fast"
+    assert elapsed < 0.5
+    stats = ProviderRouter.stats()
+    assert stats["slow"]["hedges"] == 1
+    assert stats["fast"]["wins"] == 1
+    # The losing call was cancelled, which isn't held against the slow provider
+    assert stats["slow"]["errors"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failing_provider_is_ranked_last():
+    """Test that a failure falls over to the backup at once and the next call starts with the backup"""
+    ProviderRouter.configure([FailingProvider(name="broken"), LocalProvider(latency_ms=5, name="healthy")])
+
+    first = await ProviderRouter.check(b"image-bytes", "test.png")
+    second = await ProviderRouter.check(b"image-bytes", "test.png")
+
+    assert first["provider"] == second["provider"] == "healthy"
+    assert [provider.name for provider in ProviderRouter.ranked(["weapon"])] == ["healthy", "broken"]
+    assert ProviderRouter.stats()["broken"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+@patch('app.services.providers.MODEL_STAGES', [["nudity-2.1", "weapon"], ["gore-2.0"]])
+async def test_expensive_stage_only_runs_when_needed():
+    """Test that later model stages are skipped once the request's policy finds a violation"""
+    ProviderRouter.configure([LocalProvider(scores={"weapon": 0.95})])
+    unsafe = await ProviderRouter.check(b"image-bytes", "test.png", DEFAULT)
+    unstaged = await ProviderRouter.check(b"image-bytes", "test.png")
+
+    ProviderRouter.configure([
+        LocalProvider(name="cheap", models=["nudity-2.1", "weapon"]),
+        LocalProvider(name="full"),
+    ])
+    with patch('app.services.providers.HEDGE_ENABLED', False):
+        safe = await ProviderRouter.check(b"image-bytes", "test.png", DEFAULT)
+
+    assert unsafe["models_checked"] == ["nudity-2.1", "weapon"]
+    assert unsafe["weapon"]["classes"]["firearm"] == 0.95
+    assert "gore" not in unsafe and not is_complete(unsafe)
+    # Without a policy to judge by, every stage runs
+    assert unstaged["models_checked"] == ["nudity-2.1", "weapon", "gore-2.0"]
+    assert safe["models_checked"] == ["nudity-2.1", "weapon", "gore-2.0"] and is_complete(safe)
+    assert safe["gore"]["prob"] == 0.0
+    assert [provider.name for provider in ProviderRouter.ranked(["gore-2.0"])] == ["full"]
+
+
+@pytest.mark.asyncio
+@patch('app.services.providers.MODEL_STAGES', [["nudity-2.1"], ["weapon"]])
+async def test_high_score_under_a_lax_threshold_runs_every_stage():
+    """Test that a score the request's policy allows does not skip the later stages"""
+    ProviderRouter.configure([LocalProvider(scores={"nudity": 0.92, "weapon": 0.99})])
+
+    result = await ProviderRouter.check(b"image-bytes", "test.png", LAX)
+
+    assert result["models_checked"] == ["nudity-2.1", "weapon"]
+    assert LAX.verdict(result)[0] == ["weapon"]
+
+
+def test_local_provider_needs_the_test_flag():
+    """Test that the always-safe local provider can't end up in a production provider chain"""
+    with pytest.raises(ValueError):
+        build_providers("sightengine,local")
+    with patch('app.services.providers.LOCAL_PROVIDER_ALLOWED', True):
+        assert [provider.name for provider in build_providers("sightengine,local")] == ["sightengine", "local"]
@@ -0,0 +1,149 @@
+import asyncio
+import httpx
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from unittest.mock import patch, AsyncMock
+
+from app.core.auth import get_current_token, TokenCache
+from app.core.rate_limit import RateLimiter
+from app.db.mongodb import MongoDB
+from app.main import app
+from app.schemas.token import TokenInDB
+
+LIMITED_TOKEN = TokenInDB(
+    token="limited_token", isAdmin=False, rateLimit=1, burst=5, dailyQuota=8,
+    createdAt=datetime(2024, 1, 1)
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_limiter():
+    TokenCache.clear()
+    RateLimiter.clear()
+    yield
+    TokenCache.clear()
+    RateLimiter.clear()
+
+
+@pytest_asyncio.fixture
+async def shared_counters():
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    with patch('app.core.rate_limit.RATE_LIMIT_SHARED', True):
+        yield
+    MongoDB.db = None
+
+
+async def burst(count: int):
+    """`count` concurrent clients calling at once; returns the rejections"""
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="limited_token")
+    results = await asyncio.gather(
+        *(get_current_token(credentials) for _ in range(count)), return_exceptions=True
+    )
+    return [result for result in results if isinstance(result, HTTPException)]
+
+
+@pytest.mark.asyncio
+@patch('app.core.auth.get_token', new_callable=AsyncMock)
+async def test_burst_is_capped_per_worker(mock_get_token):
+    """Test that a burst of concurrent calls gets `burst` through and the rest 429 with Retry-After"""
+    mock_get_token.return_value = LIMITED_TOKEN
+
+    rejected = await burst(20)
+
+    assert len(rejected) == 15
+    assert {error.status_code for error in rejected} == {429}
+    assert all(int(error.headers["Retry-After"]) >= 1 for error in rejected)
+
+
+@pytest.mark.asyncio
+@patch('app.core.auth.get_token', new_callable=AsyncMock)
+async def test_shared_limits_hold_across_workers(mock_get_token, shared_counters):
+    """Test that workers share one counter, so the limit is global rather than per worker"""
+    mock_get_token.return_value = LIMITED_TOKEN.model_copy(update={"rateLimit": 1000, "burst": 1000})
+
+    first_worker = await burst(6)
+    # A second worker has none of the first one's in-memory state
+    RateLimiter.clear()
+    TokenCache.clear()
+    second_worker = await burst(6)
+
+    assert (len(first_worker), len(second_worker)) == (0, 4)
+    assert {error.detail for error in second_worker} == {"Daily quota exceeded"}
+
+
+@patch('app.api.endpoints.read_uploads', new_callable=AsyncMock)
+@patch('app.api.endpoints.log_api_usage', new_callable=AsyncMock)
+@patch('app.core.auth.get_token', new_callable=AsyncMock)
+def test_over_limit_upload_is_rejected_before_reading_the_body(mock_get_token, mock_log, mock_read_uploads):
+    """Test that the 429 comes from the auth dependency, before the upload is read"""
+    mock_get_token.return_value = LIMITED_TOKEN.model_copy(update={"burst": 1})
+    mock_read_uploads.side_effect = HTTPException(status_code=400, detail="No file was uploaded")
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer limited_token"}
+
+    first = client.post("/api/moderate", files={"file": ("a.png", b"x", "image/png")}, headers=headers)
+    second = client.post("/api/moderate", files={"file": ("a.png", b"x", "image/png")}, headers=headers)
+
+    assert first.status_code == 400
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "1"
+    assert mock_read_uploads.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_new_tokens_cannot_choose_their_own_limits():
+    """Test that unauthenticated token creation ignores limits; only admins set them"""
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post(
+                "/api/auth/tokens", json={"isAdmin": False, "rateLimit": 1e6, "burst": 10 ** 6, "dailyQuota": 10 ** 9}
+            )
+    finally:
+        MongoDB.db = None
+
+    token = response.json()
+    assert response.status_code == 200
+    assert token["rateLimit"] is None and token["burst"] is None and token["dailyQuota"] is None
+
+
+@patch('app.services.batch.find_result', new_callable=AsyncMock)
+@patch('app.api.endpoints.log_api_usages', new_callable=AsyncMock)
+@patch('app.core.auth.get_token', new_callable=AsyncMock)
+def test_batch_images_count_against_the_quota(mock_get_token, mock_log, mock_find_result):
+    """Test that a batch is charged per image, and refused before moderation once the quota can't cover it"""
+    mock_get_token.return_value = LIMITED_TOKEN.model_copy(update={"rateLimit": 100, "burst": 100})
+    mock_find_result.return_value = ({"status": "success"}, None)
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer limited_token"}
+    files = [("files", (f"{name}.png", name.encode(), "image/png")) for name in "abc"]
+
+    statuses = [client.post("/api/moderate/batch", files=files, headers=headers).status_code for _ in range(3)]
+
+    # 3 + 3 images of the 8 a day: the third batch would need 9
+    assert statuses == [200, 200, 429]
+    assert mock_find_result.await_count == 6
+    assert mock_log.await_count == 2
+    # The refused batch counted only as the one request, not as its images
+    assert RateLimiter.quotas["limited_token"][1] == 7
+
+
+@patch('app.services.batch.find_result', new_callable=AsyncMock)
+@patch('app.core.auth.get_token', new_callable=AsyncMock)
+def test_batch_larger_than_the_burst_is_refused(mock_get_token, mock_find_result):
+    """Test that a batch that could never fit in the token bucket is refused without a Retry-After"""
+    mock_get_token.return_value = LIMITED_TOKEN.model_copy(update={"dailyQuota": None, "burst": 2})
+    client = TestClient(app)
+    files = [("files", (f"{name}.png", name.encode(), "image/png")) for name in "abc"]
+
+    response = client.post("/api/moderate/batch", files=files, headers={"Authorization": "Bearer limited_token"})
+
+    assert response.status_code == 429
+    assert "burst of 2" in response.json()["detail"]
+    assert "Retry-After" not in response.headers
+    mock_find_result.assert_not_awaited()
@@ -0,0 +1,75 @@
+import io
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+from PIL import Image
+
+from app.main import app
+from app.core.auth import get_current_token, get_token_policy
+from app.services.result_cache import ModerationCache
+from app.services.near_duplicates import NearDuplicateIndex
+
+client = TestClient(app)
+
+UNSAFE_RESPONSE = {
+    "status": "success",
+    "request": {"id": "req_1"},
+    "weapon": {"classes": {"firearm": 0.9, "knife": 0.2}},
+    "alcohol": {"prob": 0.1},
+}
+
+
+def png_bytes() -> bytes:
+    file = io.BytesIO()
+    Image.new("RGB", (64, 64), (10, 200, 30)).save(file, "png")
+    return file.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def authenticated():
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+    app.dependency_overrides[get_current_token] = lambda: "user_token_456"
+    app.dependency_overrides[get_token_policy] = lambda: None
+    with patch('app.api.endpoints.log_api_usage', new_callable=AsyncMock), \
+            patch('app.api.endpoints.charge_calls', new_callable=AsyncMock), \
+            patch('app.api.endpoints.log_api_usages', new_callable=AsyncMock), \
+            patch('app.services.near_duplicates.store_phash_result', new_callable=AsyncMock), \
+            patch('app.services.sightengine.SightEngineClient.check', new_callable=AsyncMock) as mock_check:
+        mock_check.return_value = UNSAFE_RESPONSE
+        yield
+    app.dependency_overrides.clear()
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+
+
+def test_results_are_compact_by_default():
+    """Test that a result carries the verdict and per-category scores but not the upstream payload"""
+    response = client.post("/api/moderate", files={"file": ("gun.png", png_bytes(), "image/png")})
+
+    assert response.status_code == 200
+    details = response.json()["details"]
+    assert response.json()["is_safe"] is False
+    assert details["violations"] == ["weapon"]
+    assert details["scores"]["weapon"] == pytest.approx(0.9)
+    assert details["margins"]["weapon"] == pytest.approx(0.4)
+    # Unset fields are left out rather than sent as null
+    assert "content_analysis" not in details and "error" not in details
+
+
+def test_raw_payload_is_opt_in():
+    """Test that ?include=raw adds the upstream response, on single and batch results alike"""
+    single = client.post(
+        "/api/moderate", params={"include": "raw"}, files={"file": ("gun.png", png_bytes(), "image/png")}
+    )
+    batch = client.post(
+        "/api/moderate/batch", params={"include": "raw"}, files=[("files", ("gun.png", png_bytes(), "image/png"))]
+    )
+
+    assert single.json()["details"]["content_analysis"]["request"]["id"] == "req_1"
+    [line] = batch.text.splitlines()
+    assert json.loads(line)["result"]["details"]["content_analysis"] == UNSAFE_RESPONSE
+    assert client.post(
+        "/api/moderate", params={"include": "everything"}, files={"file": ("gun.png", png_bytes(), "image/png")}
+    ).status_code == 422
@@ -0,0 +1,53 @@
+import pytest
+import httpx
+from unittest.mock import patch
+
+from app.services.circuit_breaker import UpstreamUnavailable
+from app.services.sightengine import SightEngineClient
+
+MOCK_SUCCESS = {"status": "success", "alcohol": {"prob": 0.01}}
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.SightEngineClient.backoff_delay', return_value=0)
+async def test_check_retries_on_server_error(mock_backoff):
+    """Test that 5xx responses are retried until the upstream succeeds"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503, json={"status": "failure"})
+        return httpx.Response(200, json=MOCK_SUCCESS)
+
+    await SightEngineClient.start(transport=httpx.MockTransport(handler))
+    try:
+        result = await SightEngineClient.check(b"image-bytes", "test.png")
+    finally:
+        await SightEngineClient.close()
+
+    assert result == MOCK_SUCCESS
+    assert len(calls) == 3
+    assert b"image-bytes" in calls[-1].content
+
+
+@pytest.mark.asyncio
+@patch('app.services.sightengine.SightEngineClient.backoff_delay', return_value=0)
+@patch('app.services.sightengine.MAX_RETRIES', 1)
+async def test_check_gives_up_after_max_retries(mock_backoff):
+    """Test that a retryable status is an outage once retries are exhausted, even with a JSON body"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(429, json={"status": "failure", "error": {"message": "Rate limited"}})
+
+    await SightEngineClient.start(transport=httpx.MockTransport(handler))
+    try:
+        with pytest.raises(UpstreamUnavailable) as exc_info:
+            await SightEngineClient.check(b"image-bytes", "test.png")
+    finally:
+        await SightEngineClient.close()
+
+    assert exc_info.value.status_code == 503
+    assert len(calls) == 2
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+import httpx
+from unittest.mock import patch, AsyncMock
+
+from app.services.circuit_breaker import UpstreamUnavailable
+from app.services.moderation import moderate_image, SingleFlight
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.result_cache import ModerationCache
+from app.services.sightengine import SightEngineClient
+from benchmarks.fake_sightengine import create_app
+from benchmarks.stubs import png_bytes
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+    SingleFlight.clear()
+    with patch('app.services.near_duplicates.store_phash_result', new_callable=AsyncMock):
+        yield
+    ModerationCache.clear()
+    NearDuplicateIndex.clear()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_uploads_make_one_upstream_call():
+    """Test that N concurrent uploads of the same bytes share a single SightEngine call"""
+    upstream = create_app(latency_ms=50)
+    await SightEngineClient.start(transport=httpx.ASGITransport(app=upstream))
+    try:
+        results = await asyncio.gather(*(moderate_image(png_bytes(seed=3), "viral.png") for _ in range(20)))
+    finally:
+        await SightEngineClient.close()
+
+    assert upstream.state.calls == 1
+    assert all(result == results[0] for result in results)
+    assert results[0]["is_safe"] is True
+    assert SingleFlight.stats() == {"in_flight": 0, "started": 1, "coalesced": 19}
+
+
+@pytest.mark.asyncio
+async def test_disconnecting_caller_does_not_cancel_the_others():
+    """Test that cancelling the request that started the lookup leaves the shared call running"""
+    upstream = create_app(latency_ms=50)
+    await SightEngineClient.start(transport=httpx.ASGITransport(app=upstream))
+    try:
+        first = asyncio.create_task(moderate_image(png_bytes(seed=4), "viral.png"))
+        await asyncio.sleep(0.01)
+        others = [asyncio.create_task(moderate_image(png_bytes(seed=4), "viral.png")) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        first.cancel()
+        results = await asyncio.gather(*others)
+    finally:
+        await SightEngineClient.close()
+
+    assert first.cancelled()
+    assert [result["is_safe"] for result in results] == [True] * 3
+    assert upstream.state.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_upstream_error_reaches_every_waiter():
+    """Test that a failed shared lookup fails every coalesced request, and the next one tries again"""
+    async def unavailable(content, filename, **kwargs):
+        await asyncio.sleep(0.02)
+        raise UpstreamUnavailable()
+
+    with patch('app.services.sightengine.SightEngineClient.check', side_effect=unavailable) as mock_check:
+        outcomes = await asyncio.gather(
+            *(moderate_image(png_bytes(seed=5), "viral.png") for _ in range(5)), return_exceptions=True
+        )
+        assert all(isinstance(outcome, UpstreamUnavailable) for outcome in outcomes)
+        assert mock_check.call_count == 1
+
+        with pytest.raises(UpstreamUnavailable):
+            await moderate_image(png_bytes(seed=5), "viral.png")
+        assert mock_check.call_count == 2
@@ -0,0 +1,34 @@
+import io
+from unittest.mock import patch
+from PIL import Image
+
+from app.services.sniff import TypeSniffer, sniff_signature
+
+
+def encode(fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def test_known_image_signatures_skip_libmagic():
+    """Test that common formats are recognized from their magic bytes alone"""
+    heic = b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic"
+    avif = b"\x00\x00\x00\x1cftypavif\x00\x00\x00\x00avifmif1miaf"
+
+    assert [sniff_signature(encode(fmt)) for fmt in ("jpeg", "png", "gif", "webp")] == [
+        "image/jpeg", "image/png", "image/gif", "image/webp"
+    ]
+    assert (sniff_signature(heic), sniff_signature(avif)) == ("image/heic", "image/avif")
+    assert sniff_signature(b"%PDF-1.7") is None
+
+
+def test_other_files_fall_back_to_one_shared_libmagic_handle():
+    """Test that libmagic sees at most the header and is created once"""
+    with patch('app.services.sniff.magic.Magic') as mock_magic, patch.object(TypeSniffer, 'handle', None):
+        mock_magic.return_value.from_buffer.side_effect = lambda header: f"application/x-{len(header)}"
+        results = [TypeSniffer.sniff(b"%PDF" + b"\0" * 100000) for _ in range(3)]
+
+    assert results == ["application/x-4096"] * 3
+    assert mock_magic.call_count == 1
+    assert not TypeSniffer.is_image(b"plain text")
@@ -0,0 +1,95 @@
+import sqlite3
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from app.db.sqlite import SQLiteDB
+from app.db.storage import Storage
+from app.models.token import (
+    create_token, delete_token, get_token, get_tokens_version, list_tokens, update_token_limits, update_token_webhook
+)
+from app.models.usage import build_usage_query, insert_usages, iter_usages, list_usages_by_token, summarize_usages
+from app.models.usage_rollup import get_usage_count, summarize_rollups
+from app.schemas.token import TokenCreate, TokenLimits, TokenWebhook
+from app.schemas.usage import UsageInDB
+
+START = datetime(2024, 1, 1, 10, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def sqlite_storage(tmp_path):
+    """Tokens and usage in an SQLite file, as with STORAGE_BACKEND=sqlite"""
+    path = tmp_path / "moderation.db"
+    previous = Storage.backend, Storage.tokens, Storage.usages
+    with patch('app.db.sqlite.SQLITE_PATH', str(path)):
+        await Storage.connect("sqlite")
+    yield path
+    await Storage.close()
+    Storage.backend, Storage.tokens, Storage.usages = previous
+
+
+@pytest.mark.asyncio
+async def test_sqlite_token_lifecycle(sqlite_storage):
+    """Test that tokens round-trip through SQLite and changes bump the version caches watch"""
+    token = await create_token(TokenCreate(isAdmin=False))
+
+    assert await get_token(token.token) == token
+    assert await update_token_webhook(token.token, TokenWebhook(webhookUrl="https://hooks.example/moderation"))
+    assert str((await get_token(token.token)).webhookUrl) == "https://hooks.example/moderation"
+    assert await update_token_limits(token.token, TokenLimits(rateLimit=2.5, burst=5))
+    assert (await get_token(token.token)).rateLimit == 2.5
+    assert await delete_token(token.token)
+    assert not await delete_token(token.token)
+    assert await get_token(token.token) is None and await list_tokens() == []
+    assert await get_tokens_version() == 3
+
+
+@pytest.mark.asyncio
+async def test_sqlite_usage_matches_the_mongodb_queries(sqlite_storage):
+    """Test that paging, summaries, exports and rollups behave as they do on MongoDB"""
+    await insert_usages([
+        UsageInDB(token=token, endpoint="/moderate", timestamp=START + timedelta(hours=i))
+        for i in range(5) for token in ("alpha", "beta")
+    ])
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = await list_usages_by_token("alpha", limit=2, cursor=cursor)
+        seen.extend(usage.timestamp for usage in page)
+        if cursor is None:
+            break
+    daily = await summarize_usages(build_usage_query(token="beta"), ["token"], "day")
+    exported = [doc async for doc in iter_usages(build_usage_query(endpoint="/moderate"))]
+
+    assert seen == [START + timedelta(hours=i) for i in reversed(range(5))]
+    assert [(summary.token, summary.bucket.date(), summary.count) for summary in daily] == [
+        ("beta", START.date(), 5)
+    ]
+    assert len(exported) == 10 and exported[0]["timestamp"] == START + timedelta(hours=4)
+    assert (await get_usage_count("alpha", at=START)).count == 5
+    assert [(summary.token, summary.count) for summary in await summarize_rollups(build_usage_query(), ["token"])] == [
+        ("alpha", 5), ("beta", 5)
+    ]
+    hourly = await summarize_rollups(build_usage_query(token="alpha", endpoint="/moderate"), ["endpoint"], "hour")
+    assert [summary.bucket for summary in hourly] == [START + timedelta(hours=i) for i in range(5)]
+    with pytest.raises(ValueError):
+        await list_usages_by_token("alpha", cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_sqlite_writes_commit_before_returning(sqlite_storage):
+    """Test that no transaction is left open after a write, so other processes are never kept waiting"""
+    await create_token(TokenCreate(isAdmin=True))
+    await insert_usages([UsageInDB(token="alpha", endpoint="/moderate", timestamp=START)])
+
+    assert not SQLiteDB.connection.in_transaction
+    # Another process sees both writes at once and can take the write lock without waiting
+    other = sqlite3.connect(sqlite_storage, timeout=0, isolation_level=None)
+    assert other.execute("SELECT COUNT(*) FROM tokens").fetchone()[0] == 1
+    assert other.execute("SELECT COUNT(*) FROM usages").fetchone()[0] == 1
+    other.execute("BEGIN IMMEDIATE")
+    other.execute("INSERT INTO usages (token, endpoint, timestamp) VALUES ('beta', '/moderate', '')")
+    other.execute("COMMIT")
+    other.close()
+    assert (await SQLiteDB.read("SELECT COUNT(*) AS count FROM usages"))[0]["count"] == 2
@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch, AsyncMock
+
+from app.main import app
+from app.core.auth import get_current_token, get_token_policy
+from app.services.sniff import TypeSniffer
+from app.services.upload import read_uploads, UnsupportedUpload
+from starlette.requests import Request
+
+client = TestClient(app)
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\nimage-bytes"
+
+
+@pytest.fixture(autouse=True)
+def authenticated():
+    app.dependency_overrides[get_current_token] = lambda: "user_token_456"
+    app.dependency_overrides[get_token_policy] = lambda: None
+    yield
+    app.dependency_overrides.clear()
+
+
+@patch('app.api.endpoints.log_api_usage', new_callable=AsyncMock)
+@patch('app.api.endpoints.moderate_image', new_callable=AsyncMock)
+def test_upload_is_passed_from_memory(mock_moderate, mock_log):
+    """Test that the uploaded bytes reach moderate_image without a temp file"""
+    mock_moderate.return_value = {"is_safe": True, "message": "Image is safe", "details": {"violations": []}}
+
+    response = client.post("/api/moderate", files={"file": ("../../etc/cat.png", PNG_BYTES, "image/png")})
+
+    assert response.status_code == 200
+    mock_moderate.assert_awaited_once_with(
+        PNG_BYTES, "../../etc/cat.png", use_cache=True, policy=None, include_raw=False
+    )
+
+
+@patch('app.services.upload.MAX_UPLOAD_BYTES', 8)
+@patch('app.api.endpoints.log_api_usage', new_callable=AsyncMock)
+@patch('app.api.endpoints.moderate_image', new_callable=AsyncMock)
+def test_oversized_upload_is_rejected(mock_moderate, mock_log):
+    """Test that files over the configured limit are rejected with 413"""
+    response = client.post("/api/moderate", files={"file": ("big.png", b"x" * 64, "image/png")})
+
+    assert response.status_code == 413
+    mock_moderate.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_non_image_is_rejected_from_its_first_chunk():
+    """Test that a non-image is refused once its header arrives, without reading the rest"""
+    head = b'--b\r\nContent-Disposition: form-data; name="file"; filename="x.exe"\r\n\r\nMZ' + b"\0" * 8192
+    chunks = [head] + [b"\0" * 65536] * 100 + [b"\r\n--b--\r\n"]
+    received = []
+
+    async def receive():
+        received.append(1)
+        return {"type": "http.request", "body": chunks[len(received) - 1], "more_body": len(received) < len(chunks)}
+
+    request = Request({
+        "type": "http", "method": "POST", "path": "/api/moderate",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=b")],
+    }, receive)
+
+    with pytest.raises(UnsupportedUpload):
+        await read_uploads(request, accept=TypeSniffer.is_image)
+    assert len(received) == 1
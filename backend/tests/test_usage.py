@@ -0,0 +1,63 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockClient
+
+from app.db.mongodb import MongoDB
+from app.models.usage import (
+    build_usage_query, iter_usages, list_usages_by_token, summarize_usages, get_usages_collection
+)
+
+START = datetime(2024, 1, 1, 10, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def usages():
+    """An in-memory usages collection with 5 calls an hour apart for two tokens"""
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    docs = [
+        {"token": token, "endpoint": "/moderate", "timestamp": START + timedelta(hours=i)}
+        for i in range(5) for token in ("alpha", "beta")
+    ]
+    await get_usages_collection().insert_many(docs)
+    yield docs
+    MongoDB.db = None
+
+
+@pytest.mark.asyncio
+async def test_usage_pages_follow_the_cursor(usages):
+    """Test that keyset pages are newest first and cover every record exactly once"""
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = await list_usages_by_token("alpha", limit=2, cursor=cursor)
+        seen.extend(usage.timestamp for usage in page)
+        if cursor is None:
+            break
+
+    assert seen == [START + timedelta(hours=i) for i in reversed(range(5))]
+
+
+@pytest.mark.asyncio
+async def test_usage_time_range_and_invalid_cursor(usages):
+    """Test that start/end filter the listing and bad cursors are refused"""
+    page, cursor = await list_usages_by_token(
+        "alpha", start=START + timedelta(hours=1), end=START + timedelta(hours=3)
+    )
+
+    assert [usage.timestamp.hour for usage in page] == [12, 11]
+    assert cursor is None
+    with pytest.raises(ValueError):
+        await list_usages_by_token("alpha", cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_usage_summary_and_export(usages):
+    """Test that counts are aggregated per token and per day, and exports stream every record"""
+    totals = await summarize_usages(build_usage_query(), ["token"])
+    daily = await summarize_usages(build_usage_query(token="beta"), ["token"], "day")
+    exported = [doc async for doc in iter_usages(build_usage_query(endpoint="/moderate"))]
+
+    assert [(summary.token, summary.count) for summary in totals] == [("alpha", 5), ("beta", 5)]
+    assert [(summary.bucket.date(), summary.count) for summary in daily] == [(START.date(), 5)]
+    assert len(exported) == 10
@@ -0,0 +1,82 @@
+import pytest
+import pytest_asyncio
+from unittest.mock import patch, AsyncMock
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from app.db.mongodb import MongoDB, MongoUsageRepository
+from app.models.usage import build_usage_query, create_usage, get_usages_collection, insert_usages
+from app.models.usage_rollup import get_usage_count, get_usage_rollups_collection, summarize_rollups
+from app.schemas.usage import UsageCreate, UsageInDB
+
+NOON = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def database():
+    MongoDB.db = AsyncMongoMockClient()["test"]
+    yield MongoDB.db
+    MongoDB.db = None
+
+
+@pytest.mark.asyncio
+async def test_batch_is_rolled_up_per_bucket(database):
+    """Test that a batch lands in minute/hour/day counters, per endpoint and for all endpoints"""
+    usages = [
+        UsageInDB(token="alpha", endpoint=endpoint, timestamp=NOON + timedelta(minutes=minutes))
+        for endpoint, minutes in [("/moderate", 0), ("/moderate", 0), ("/moderate", 90), ("/moderate/batch", 30)]
+    ]
+    await insert_usages(usages)
+
+    day = await get_usage_count("alpha", at=NOON)
+    hour = await get_usage_count("alpha", "/moderate", "hour", at=NOON)
+    minute = await get_usage_count("alpha", "/moderate", "minute", at=NOON)
+    other = await get_usage_count("beta", at=NOON)
+
+    assert (day.count, hour.count, minute.count, other.count) == (4, 2, 2, 0)
+    # One day bucket each for /moderate, /moderate/batch and '*'
+    assert await get_usage_rollups_collection().count_documents({"granularity": "day"}) == 3
+
+
+@pytest.mark.asyncio
+async def test_partially_inserted_batch_counts_only_what_was_written(database):
+    """Test that records an unordered insert_many did write are counted even though it raised"""
+    usages = [UsageInDB(token="alpha", endpoint="/moderate", timestamp=NOON) for _ in range(3)]
+    error = BulkWriteError({"writeErrors": [{"index": 2, "code": 11600, "errmsg": "interrupted"}], "nInserted": 2})
+    with patch.object(MongoUsageRepository, 'insert', new_callable=AsyncMock, side_effect=error):
+        with pytest.raises(BulkWriteError):
+            await insert_usages(usages)
+
+    assert (await get_usage_count("alpha", "/moderate", at=NOON)).count == 2
+
+
+@pytest.mark.asyncio
+async def test_single_usage_increments_todays_counter(database):
+    """Test that create_usage keeps the current day's counter up to date"""
+    for _ in range(3):
+        await create_usage(UsageCreate(token="alpha", endpoint="/moderate"))
+
+    today = await get_usage_count("alpha", "/moderate")
+    assert today.count == 3
+    assert today.bucket == datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@pytest.mark.asyncio
+async def test_totals_come_from_the_counters_and_outlive_the_records(database):
+    """Test that rollup summaries count per endpoint and day, and still do after the raw records expire"""
+    await insert_usages([
+        UsageInDB(token="alpha", endpoint=endpoint, timestamp=NOON + timedelta(days=days))
+        for endpoint, days in [("/moderate", 0), ("/moderate", 1), ("/moderate/batch", 1)]
+    ])
+    await get_usages_collection().delete_many({})
+
+    totals = await summarize_rollups(build_usage_query(), ["token"])
+    per_endpoint = await summarize_rollups(build_usage_query(token="alpha"), ["endpoint"])
+    daily = await summarize_rollups(build_usage_query(token="alpha", start=NOON + timedelta(days=1)), [], "day")
+
+    assert [(summary.token, summary.count) for summary in totals] == [("alpha", 3)]
+    assert [(summary.endpoint, summary.count) for summary in per_endpoint] == [
+        ("/moderate", 2), ("/moderate/batch", 1)
+    ]
+    assert [(summary.bucket.date(), summary.count) for summary in daily] == [((NOON + timedelta(days=1)).date(), 2)]
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from pymongo.errors import BulkWriteError
+
+from app.core.auth import log_api_usage
+from app.schemas.usage import UsageCreate
+from app.services.usage_writer import UsageWriter
+
+
+@pytest.mark.asyncio
+@patch('app.services.usage_writer.USAGE_FLUSH_INTERVAL', 0.05)
+@patch('app.services.usage_writer.insert_usages', new_callable=AsyncMock)
+async def test_usage_is_written_in_batches(mock_insert):
+    """Test that queued usage records are flushed together with one insert_many"""
+    await UsageWriter.start()
+    try:
+        for _ in range(5):
+            await log_api_usage("user_token_456", "/moderate")
+        await asyncio.sleep(0.2)
+    finally:
+        await UsageWriter.close()
+
+    assert mock_insert.await_count == 1
+    batch = mock_insert.await_args.args[0]
+    assert [usage.endpoint for usage in batch] == ["/moderate"] * 5
+
+
+@pytest.mark.asyncio
+@patch('app.services.usage_writer.USAGE_FLUSH_INTERVAL', 60)
+@patch('app.services.usage_writer.insert_usages', new_callable=AsyncMock)
+async def test_queued_usage_is_drained_on_shutdown(mock_insert):
+    """Test that nothing queued is lost on a clean stop"""
+    await UsageWriter.start()
+    for _ in range(3):
+        await log_api_usage("user_token_456", "/moderate")
+    await asyncio.sleep(0)
+    await UsageWriter.close()
+
+    written = sum(len(call.args[0]) for call in mock_insert.await_args_list)
+    assert written == 3
+    assert not UsageWriter.running()
+
+
+@pytest.mark.asyncio
+@patch('app.services.usage_writer.USAGE_FLUSH_INTERVAL', 60)
+@patch('app.services.usage_writer.insert_usages', new_callable=AsyncMock, side_effect=[
+    BulkWriteError({"writeErrors": [{"index": 1, "code": 11600, "errmsg": "interrupted"}], "nInserted": 2}), None
+])
+async def test_partial_insert_retries_only_the_failed_records(mock_insert):
+    """Test that records an unordered insert_many already wrote are not written again"""
+    await UsageWriter.start()
+    await UsageWriter.enqueue_many([UsageCreate(token="user_token_456", endpoint=f"/moderate/{n}") for n in range(3)])
+    written = UsageWriter.written
+    await UsageWriter.close()
+
+    retried = mock_insert.await_args_list[1].args[0]
+    assert [usage.endpoint for usage in retried] == ["/moderate/1"]
+    assert UsageWriter.written - written == 3
+
+
+@pytest.mark.asyncio
+@patch('app.services.usage_writer.USAGE_FLUSH_INTERVAL', 0.01)
+@patch('app.services.usage_writer.insert_usages', new_callable=AsyncMock, side_effect=[ValueError("bad record"), None])
+async def test_writer_survives_unexpected_errors(mock_insert):
+    """Test that an error outside the storage errors drops its batch but keeps the writer draining"""
+    await UsageWriter.start()
+    try:
+        await log_api_usage("user_token_456", "/moderate")
+        await asyncio.sleep(0.05)
+        await log_api_usage("user_token_456", "/moderate/batch")
+        await asyncio.sleep(0.05)
+        assert not UsageWriter.task.done()
+    finally:
+        await UsageWriter.close()
+
+    assert mock_insert.await_count == 2
+    assert [usage.endpoint for usage in mock_insert.await_args.args[0]] == ["/moderate/batch"]
@@ -348,7 +348,9 @@ function App() {
 
     try {
       const response = await axios.post(`${API_URL}/api/moderate`, formData, {
-        headers: { 
+        // The charts and raw JSON tabs read the upstream payload
+        params: { include: 'raw' },
+        headers: {
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'multipart/form-data'
         }
@@ -722,7 +724,7 @@ function App() {
                       {activeTab === 1 && (
                         <Box className="tab-content">
                           <Typography variant="body2" sx={{ mb: 2, fontFamily: 'monospace' }}>
-                            Request ID: {result.details.content_analysis.request?.id || 'N/A'}
+                            Request ID: {result.details.content_analysis?.request?.id || 'N/A'}
                           </Typography>
                           
                           {/* Add a nice formatting for the JSON data */}
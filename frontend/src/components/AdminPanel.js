@@ -25,6 +25,7 @@ import {
 } from '@mui/material';
 import { Delete, AdminPanelSettings, PersonOutline, History, BarChart, VpnKey } from '@mui/icons-material';
 import TokenInput from './TokenInput';
+import UsageHistoryTable from './UsageHistoryTable';
 
 // Use environment variable for API URL, fallback to localhost for development
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:7001';
@@ -35,7 +36,6 @@ const AdminPanel = ({ token }) => {
   const [error, setError] = useState(null);
   const [deleteDialog, setDeleteDialog] = useState({ open: false, tokenToDelete: null });
   const [successMessage, setSuccessMessage] = useState(null);
-  const [usageData, setUsageData] = useState([]);
   const [usageDialog, setUsageDialog] = useState({ open: false, tokenId: null, tokenType: '' });
   const [tokenUsageCounts, setTokenUsageCounts] = useState({});
   const [loadingUsageCounts, setLoadingUsageCounts] = useState(false);
@@ -77,26 +77,22 @@ const AdminPanel = ({ token }) => {
     
     try {
       const countsObj = {};
+      tokensList.forEach(tokenItem => {
+        countsObj[tokenItem.token] = 0;
+      });
       
-      // Create an array of promises for all API calls
-      const promises = tokensList.map(tokenItem => 
-        axios.get(`${API_URL}/api/auth/usage/token/${tokenItem.token}`, {
-          headers: {
-            Authorization: `Bearer ${token}`
-          }
-        })
-      );
-      
-      // Execute all promises concurrently
-      const results = await Promise.allSettled(promises);
+      // One aggregated request, from the rollup counters: raw usage records
+      // expire, the daily counters are kept
+      const response = await axios.get(`${API_URL}/api/auth/usage/totals`, {
+        params: { group_by: 'token' },
+        headers: {
+          Authorization: `Bearer ${token}`
+        }
+      });
       
-      // Process results
-      results.forEach((result, index) => {
-        if (result.status === 'fulfilled') {
-          const tokenId = tokensList[index].token;
-          countsObj[tokenId] = result.value.data.length;
-        } else {
-          console.error(`Failed to fetch usage for token: ${tokensList[index].token}`);
+      response.data.forEach(summary => {
+        if (summary.token in countsObj) {
+          countsObj[summary.token] = summary.count;
         }
       });
       
@@ -139,32 +135,6 @@ const AdminPanel = ({ token }) => {
     }
   };
 
-  // Load usage data for a specific token
-  const loadUsageForToken = async (tokenId) => {
-    if (!token) {
-      setError("Admin token is required");
-      return;
-    }
-
-    setLoading(true);
-    setError(null);
-
-    try {
-      const response = await axios.get(`${API_URL}/api/auth/usage/token/${tokenId}`, {
-        headers: {
-          Authorization: `Bearer ${token}`
-        }
-      });
-      
-      setUsageData(response.data);
-      setLoading(false);
-    } catch (err) {
-      console.error("Error loading usage data:", err);
-      setError(err.response?.data?.detail || "Failed to load usage data");
-      setLoading(false);
-    }
-  };
-
   // Handle opening delete confirmation dialog
   const handleDeleteClick = (tokenToDelete) => {
     setDeleteDialog({ open: true, tokenToDelete });
@@ -182,13 +152,11 @@ const AdminPanel = ({ token }) => {
       tokenId, 
       tokenType: isAdmin ? 'Admin' : 'User' 
     });
-    loadUsageForToken(tokenId);
   };
 
   // Handle closing usage dialog
   const handleCloseUsageDialog = () => {
     setUsageDialog({ open: false, tokenId: null, tokenType: '' });
-    setUsageData([]);
   };
 
   // Confirm token deletion
@@ -389,66 +357,37 @@ const AdminPanel = ({ token }) => {
           )}
         </DialogTitle>
         <DialogContent>
-          {loading ? (
-            <Box sx={{ display: 'flex', justifyContent: 'center', p: 3 }}>
-              <CircularProgress />
+          <Typography variant="subtitle2" gutterBottom sx={{ 
+            fontFamily: 'monospace',
+            backgroundColor: 'rgba(0, 0, 0, 0.05)',
+            padding: '8px 12px',
+            borderRadius: '4px',
+            border: '1px solid rgba(255, 255, 255, 0.1)',
+            overflow: 'auto'
+          }}>
+            Token: {usageDialog.tokenId}
+          </Typography>
+          
+          <Box sx={{ mb: 2 }}>
+            <Chip
+              icon={<BarChart />}
+              label={`Total Usage: ${tokenUsageCounts[usageDialog.tokenId] || 0}`}
+              color="primary"
+              sx={{ mt: 1 }}
+            />
+          </Box>
+          
+          {usageDialog.tokenId && (
+            <Box sx={{ mt: 2 }}>
+              <UsageHistoryTable
+                key={usageDialog.tokenId}
+                url={`${API_URL}/api/auth/usage/token/${usageDialog.tokenId}`}
+                token={token}
+                size="small"
+                emptyMessage="No usage data found for this token."
+                onError={setError}
+              />
             </Box>
-          ) : (
-            <>
-              <Typography variant="subtitle2" gutterBottom sx={{ 
-                fontFamily: 'monospace',
-                backgroundColor: 'rgba(0, 0, 0, 0.05)',
-                padding: '8px 12px',
-                borderRadius: '4px',
-                border: '1px solid rgba(255, 255, 255, 0.1)',
-                overflow: 'auto'
-              }}>
-                Token: {usageDialog.tokenId}
-              </Typography>
-              
-              <Box sx={{ mb: 2 }}>
-                <Chip
-                  icon={<BarChart />}
-                  label={`Total Usage: ${usageData.length}`}
-                  color="primary"
-                  sx={{ mt: 1 }}
-                />
-              </Box>
-              
-              {usageData.length > 0 ? (
-                <TableContainer component={Paper} variant="outlined" sx={{ mt: 2 }}>
-                  <Table size="small">
-                    <TableHead>
-                      <TableRow>
-                        <TableCell>Endpoint</TableCell>
-                        <TableCell>Timestamp</TableCell>
-                      </TableRow>
-                    </TableHead>
-                    <TableBody>
-                      {usageData
-                        .sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp))
-                        .map((usage, index) => (
-                          <TableRow key={index}>
-                            <TableCell>
-                              <Chip 
-                                label={usage.endpoint} 
-                                size="small"
-                                variant="outlined" 
-                              />
-                            </TableCell>
-                            <TableCell>{formatDate(usage.timestamp)}</TableCell>
-                          </TableRow>
-                        ))
-                      }
-                    </TableBody>
-                  </Table>
-                </TableContainer>
-              ) : (
-                <Box sx={{ p: 2, textAlign: 'center' }}>
-                  <Typography>No usage data found for this token.</Typography>
-                </Box>
-              )}
-            </>
           )}
         </DialogContent>
         <DialogActions>
@@ -0,0 +1,138 @@
+import React, { useState, useEffect } from 'react';
+import axios from 'axios';
+import {
+  Paper,
+  Box,
+  Table,
+  TableBody,
+  TableCell,
+  TableContainer,
+  TableHead,
+  TableRow,
+  TablePagination,
+  CircularProgress,
+  Chip
+} from '@mui/material';
+
+const ROWS_PER_PAGE_OPTIONS = [25, 50, 100];
+
+// Format date
+const formatDate = (dateString) => {
+  const date = new Date(dateString);
+  return date.toLocaleString();
+};
+
+const defaultRenderEndpoint = (usage) => (
+  <Chip label={usage.endpoint} size="small" variant="outlined" />
+);
+
+/**
+ * One page of usage records at a time, newest first. Pages are fetched only
+ * when the user moves to them, following the X-Next-Cursor header. Give it a
+ * `key` that changes with `url` so a new listing starts from its first page.
+ */
+const UsageHistoryTable = ({
+  url,
+  token,
+  size = 'medium',
+  renderEndpoint = defaultRenderEndpoint,
+  emptyMessage = 'No usage data found',
+  onError
+}) => {
+  const [rows, setRows] = useState([]);
+  const [loading, setLoading] = useState(false);
+  const [page, setPage] = useState(0);
+  const [rowsPerPage, setRowsPerPage] = useState(ROWS_PER_PAGE_OPTIONS[0]);
+  // cursors[n] fetches page n; the first page needs none
+  const [cursors, setCursors] = useState([null]);
+
+  useEffect(() => {
+    if (!url || !token) return;
+    let cancelled = false;
+
+    const loadPage = async () => {
+      setLoading(true);
+      try {
+        const cursor = cursors[page];
+        const response = await axios.get(url, {
+          params: { limit: rowsPerPage, ...(cursor && { cursor }) },
+          headers: {
+            Authorization: `Bearer ${token}`
+          }
+        });
+        if (cancelled) return;
+        setRows(response.data);
+        const next = response.headers['x-next-cursor'] || null;
+        setCursors(previous => [...previous.slice(0, page + 1), next]);
+      } catch (err) {
+        if (cancelled) return;
+        console.error("Error loading usage page:", err);
+        setRows([]);
+        onError?.(err.response?.data?.detail || "Failed to load usage data");
+      } finally {
+        if (!cancelled) setLoading(false);
+      }
+    };
+
+    loadPage();
+    return () => { cancelled = true; };
+    // cursors only grows from the page being loaded, so it is not a trigger
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [url, token, page, rowsPerPage]);
+
+  const handleRowsPerPageChange = (event) => {
+    setRowsPerPage(parseInt(event.target.value, 10));
+    setPage(0);
+    setCursors([null]);
+  };
+
+  const hasNextPage = Boolean(cursors[page + 1]);
+
+  return (
+    <TableContainer component={Paper} variant="outlined">
+      {loading ? (
+        <Box sx={{ display: 'flex', justifyContent: 'center', p: 3 }}>
+          <CircularProgress />
+        </Box>
+      ) : (
+        <Table size={size}>
+          <TableHead>
+            <TableRow>
+              <TableCell>Endpoint</TableCell>
+              <TableCell>Timestamp</TableCell>
+            </TableRow>
+          </TableHead>
+          <TableBody>
+            {rows.length > 0 ? (
+              rows.map((usage, index) => (
+                <TableRow key={`${usage.timestamp}-${index}`}>
+                  <TableCell>{renderEndpoint(usage)}</TableCell>
+                  <TableCell>{formatDate(usage.timestamp)}</TableCell>
+                </TableRow>
+              ))
+            ) : (
+              <TableRow>
+                <TableCell colSpan={2} align="center">
+                  {emptyMessage}
+                </TableCell>
+              </TableRow>
+            )}
+          </TableBody>
+        </Table>
+      )}
+      <TablePagination
+        component="div"
+        // The total is unknown; a page exists whenever the server sent its cursor
+        count={hasNextPage ? -1 : page * rowsPerPage + rows.length}
+        page={page}
+        rowsPerPage={rowsPerPage}
+        rowsPerPageOptions={ROWS_PER_PAGE_OPTIONS}
+        onPageChange={(event, newPage) => setPage(newPage)}
+        onRowsPerPageChange={handleRowsPerPageChange}
+        labelDisplayedRows={({ from, to }) => `${from}–${to}`}
+      />
+    </TableContainer>
+  );
+};
+
+export default UsageHistoryTable;
@@ -4,12 +4,6 @@ import {
   Paper,
   Typography,
   Box,
-  Table,
-  TableBody,
-  TableCell,
-  TableContainer,
-  TableHead,
-  TableRow,
   Button,
   Alert,
   CircularProgress,
@@ -37,6 +31,7 @@ import {
   Pie, 
   Cell 
 } from 'recharts';
+import UsageHistoryTable from './UsageHistoryTable';
 
 // Use environment variable for API URL, fallback to localhost for development
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:7001';
@@ -45,7 +40,10 @@ const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:7001';
 const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#8884d8', '#82ca9d'];
 
 const UsageStats = ({ token }) => {
-  const [usageData, setUsageData] = useState([]);
+  const [endpointTotals, setEndpointTotals] = useState([]);
+  const [dailyTotals, setDailyTotals] = useState([]);
+  // Bumped by Refresh so the history table starts again from the newest record
+  const [historyKey, setHistoryKey] = useState(0);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [activeTab, setActiveTab] = useState(0);
@@ -65,14 +63,23 @@ const UsageStats = ({ token }) => {
     setError(null);
 
     try {
-      // Get usage for current token if not admin
-      const response = await axios.get(`${API_URL}/api/auth/usage/my-usage`, {
-        headers: {
-          Authorization: `Bearer ${token}`
-        }
-      });
-      
-      setUsageData(response.data);
+      // Totals come from the rollup counters, so the charts cover the whole
+      // history in two small responses however many calls the token made
+      const headers = { Authorization: `Bearer ${token}` };
+      const [perEndpoint, perDay] = await Promise.all([
+        axios.get(`${API_URL}/api/auth/usage/my-usage/totals`, {
+          params: { group_by: 'endpoint' },
+          headers
+        }),
+        axios.get(`${API_URL}/api/auth/usage/my-usage/totals`, {
+          params: { granularity: 'day' },
+          headers
+        })
+      ]);
+
+      setEndpointTotals(perEndpoint.data);
+      setDailyTotals(perDay.data);
+      setHistoryKey(key => key + 1);
       setLoading(false);
     } catch (err) {
       console.error("Error loading usage data:", err);
@@ -81,12 +88,6 @@ const UsageStats = ({ token }) => {
     }
   };
 
-  // Format date
-  const formatDate = (dateString) => {
-    const date = new Date(dateString);
-    return date.toLocaleString();
-  };
-
   // Format endpoint for display
   const formatEndpoint = (endpoint) => {
     // For token-specific endpoints, extract just the endpoint type and show a shorter token version
@@ -141,9 +142,9 @@ const UsageStats = ({ token }) => {
   const prepareEndpointData = () => {
     const endpointCounts = {};
     
-    usageData.forEach(usage => {
+    endpointTotals.forEach(total => {
       // Format the endpoint for better readability
-      let formattedEndpoint = usage.endpoint;
+      let formattedEndpoint = total.endpoint;
       
       // If it's a token-specific endpoint, extract just the endpoint type
       if (formattedEndpoint.includes('/auth/usage/token/')) {
@@ -152,11 +153,7 @@ const UsageStats = ({ token }) => {
         formattedEndpoint = '/auth/tokens/*';
       }
       
-      if (endpointCounts[formattedEndpoint]) {
-        endpointCounts[formattedEndpoint]++;
-      } else {
-        endpointCounts[formattedEndpoint] = 1;
-      }
+      endpointCounts[formattedEndpoint] = (endpointCounts[formattedEndpoint] || 0) + total.count;
     });
     
     return Object.entries(endpointCounts).map(([name, value]) => ({ name, value }));
@@ -164,18 +161,11 @@ const UsageStats = ({ token }) => {
 
   // Prepare data for usage over time chart
   const prepareTimeData = () => {
-    // Group by day
+    // One bucket per day (UTC), YYYY-MM-DD
     const dayUsage = {};
     
-    usageData.forEach(usage => {
-      const date = new Date(usage.timestamp);
-      const day = date.toISOString().split('T')[0]; // Get YYYY-MM-DD
-      
-      if (dayUsage[day]) {
-        dayUsage[day]++;
-      } else {
-        dayUsage[day] = 1;
-      }
+    dailyTotals.forEach(total => {
+      dayUsage[total.bucket.split('T')[0]] = total.count;
     });
     
     // Convert to array and sort by date
@@ -250,62 +240,40 @@ const UsageStats = ({ token }) => {
           <>
             {/* History Tab */}
             {activeTab === 0 && (
-              <TableContainer component={Paper} variant="outlined">
-                <Table>
-                  <TableHead>
-                    <TableRow>
-                      <TableCell>Endpoint</TableCell>
-                      <TableCell>Timestamp</TableCell>
-                    </TableRow>
-                  </TableHead>
-                  <TableBody>
-                    {usageData.length > 0 ? (
-                      // Sort by timestamp (newest first)
-                      [...usageData]
-                        .sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp))
-                        .map((usage, index) => {
-                          const endpointInfo = formatEndpoint(usage.endpoint);
-                          return (
-                            <TableRow key={index}>
-                              <TableCell>
-                                <Box sx={{ display: 'flex', alignItems: 'center', gap: 1 }}>
-                                  <Chip 
-                                    label={endpointInfo.main} 
-                                    color={endpointInfo.color} 
-                                    variant="outlined"
-                                    size="small" 
-                                  />
-                                  {endpointInfo.token && (
-                                    <Tooltip title={usage.endpoint.split('/').pop()}>
-                                      <Chip
-                                        label={endpointInfo.token}
-                                        size="small"
-                                        variant="outlined"
-                                      />
-                                    </Tooltip>
-                                  )}
-                                </Box>
-                              </TableCell>
-                              <TableCell>{formatDate(usage.timestamp)}</TableCell>
-                            </TableRow>
-                          );
-                        })
-                    ) : (
-                      <TableRow>
-                        <TableCell colSpan={2} align="center">
-                          No usage data found
-                        </TableCell>
-                      </TableRow>
-                    )}
-                  </TableBody>
-                </Table>
-              </TableContainer>
+              <UsageHistoryTable
+                key={historyKey}
+                url={`${API_URL}/api/auth/usage/my-usage`}
+                token={token}
+                renderEndpoint={(usage) => {
+                  const endpointInfo = formatEndpoint(usage.endpoint);
+                  return (
+                    <Box sx={{ display: 'flex', alignItems: 'center', gap: 1 }}>
+                      <Chip 
+                        label={endpointInfo.main} 
+                        color={endpointInfo.color} 
+                        variant="outlined"
+                        size="small" 
+                      />
+                      {endpointInfo.token && (
+                        <Tooltip title={usage.endpoint.split('/').pop()}>
+                          <Chip
+                            label={endpointInfo.token}
+                            size="small"
+                            variant="outlined"
+                          />
+                        </Tooltip>
+                      )}
+                    </Box>
+                  );
+                }}
+                onError={setError}
+              />
             )}
             
             {/* Endpoints Tab */}
             {activeTab === 1 && (
               <Box sx={{ height: 400 }}>
-                {usageData.length > 0 ? (
+                {endpointTotals.length > 0 ? (
                   <ResponsiveContainer width="100%" height="100%">
                     <PieChart>
                       <Pie
@@ -350,7 +318,7 @@ const UsageStats = ({ token }) => {
             {/* Trends Tab */}
             {activeTab === 2 && (
               <Box sx={{ height: 400 }}>
-                {usageData.length > 0 ? (
+                {dailyTotals.length > 0 ? (
                   <ResponsiveContainer width="100%" height="100%">
                     <BarChart
                       data={prepareTimeData()}